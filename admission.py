@@ -0,0 +1,118 @@
+import math
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Dict, Optional
+
+# 処理時間の移動平均の重み（新しい1件の割合）
+EWMA_WEIGHT = 0.2
+
+
+class Overloaded(Exception):
+    """
+    同時実行数も待ち行列も埋まっていて受け付けられない（すぐに 503 を返す）
+    """
+
+    def __init__(self, estimated_wait: float):
+        super().__init__('Card generation is busy, please retry later')
+        self.status_code = 503
+        self.estimated_wait = estimated_wait
+        # Retry-After は整数秒（最低1秒）
+        self.retry_after = max(1, math.ceil(estimated_wait))
+
+
+class AdmissionController:
+    """
+    カード生成の同時実行数と待ち行列の長さを制限する
+
+    同時に max_concurrent 件まで実行し、それを超えた分は max_queue 件まで到着順に待たせる。
+    待ち行列も埋まっていたら待たずに Overloaded を投げる（呼び出し側は 503 + Retry-After を返す）。
+    待ち時間の見積もりは、1件の処理時間の移動平均 × 前に並んでいる件数 ÷ 同時実行数。
+    """
+
+    def __init__(self, max_concurrent: int, max_queue: int, initial_service_time: float = 1.0):
+        if max_concurrent < 1 or max_queue < 0:
+            raise ValueError('max_concurrent は1以上、max_queue は0以上を指定してください')
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.average_service_time = initial_service_time
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        self._waiters: "deque[threading.Event]" = deque()
+        self.admitted = 0
+        self.rejected = 0
+
+    def _wait_for(self, ahead: int) -> float:
+        # 先に ahead 件（実行中 + 待ち）あるときの見積もり秒数（max_concurrent 件ずつ処理が進む）
+        return self.average_service_time * (ahead // self.max_concurrent)
+
+    def estimated_wait(self) -> float:
+        """
+        いま到着したリクエストが処理を始めるまでの見積もり秒数
+        """
+        with self._lock:
+            return self._wait_for(self._in_flight + len(self._waiters))
+
+    def _enter(self) -> Optional[threading.Event]:
+        with self._lock:
+            if self._in_flight < self.max_concurrent and not self._waiters:
+                self._in_flight += 1
+                self.admitted += 1
+                return None
+            if len(self._waiters) >= self.max_queue:
+                self.rejected += 1
+                raise Overloaded(self._wait_for(self._in_flight + len(self._waiters)))
+            self.admitted += 1
+            waiter = threading.Event()
+            self._waiters.append(waiter)
+            return waiter
+
+    def _leave(self, service_time: float) -> None:
+        with self._lock:
+            self.average_service_time += EWMA_WEIGHT * (service_time - self.average_service_time)
+            if self._waiters:
+                # 枠をそのまま先頭の待ち手に渡す（_in_flight は変わらない）
+                self._waiters.popleft().set()
+            else:
+                self._in_flight -= 1
+
+    @contextmanager
+    def admit(self):
+        """
+        with controller.admit(): の中身を同時実行数の枠内で実行する（待ち行列も満杯なら Overloaded）
+        """
+        waiter = self._enter()
+        if waiter is not None:
+            waiter.wait()
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self._leave(time.perf_counter() - started)
+
+    def in_flight(self) -> int:
+        return self._in_flight
+
+    def queued(self) -> int:
+        return len(self._waiters)
+
+    def saturated(self) -> bool:
+        """
+        次のリクエストを断る状態（待ち行列が満杯）かどうか
+        """
+        with self._lock:
+            return self._in_flight >= self.max_concurrent and len(self._waiters) >= self.max_queue
+
+    def status(self) -> Dict:
+        with self._lock:
+            return {
+                'in_flight': self._in_flight,
+                'queued': len(self._waiters),
+                'max_concurrent': self.max_concurrent,
+                'max_queue': self.max_queue,
+                'estimated_wait_seconds': round(self._wait_for(self._in_flight + len(self._waiters)), 3),
+                'average_service_seconds': round(self.average_service_time, 3),
+                'admitted': self.admitted,
+                'rejected': self.rejected,
+            }
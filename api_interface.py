@@ -2,12 +2,17 @@ from flask import Flask, request, jsonify, send_file
 from flask_cors import CORS
 from werkzeug.utils import secure_filename
 import os
+import hmac
 import json
 import uuid
 from datetime import datetime
 from card_generator import CardGenerator, CardAttribute
+from upload_validation import validate_upload, UploadRejected, reported_original_sizes, trusted_original_size
+from generation_client import WORKER_SECRET_HEADER
 from typing import List, Dict
 import shutil
+import argparse
+import multiprocessing
 
 app = Flask(__name__)
 CORS(app)
@@ -20,13 +25,16 @@ ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif', 'bmp'}
 app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
 app.config['CARDS_FOLDER'] = CARDS_FOLDER
 app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB max file size
+app.config['MAX_IMAGE_MEGAPIXELS'] = 50  # デコード前に拒否する画素数の上限
+# 設定されていれば /internal/generate は同じ値の WORKER_SECRET_HEADER を付けた依頼だけを受け付ける
+app.config['WORKER_SECRET'] = os.environ.get('PHOTOBATTLE_WORKER_SECRET') or None
 
 # フォルダの作成
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
 os.makedirs(CARDS_FOLDER, exist_ok=True)
 
-# CardGeneratorのインスタンス
-card_generator = CardGenerator()
+# CardGeneratorのインスタンス（PHOTOBATTLE_FEATURE_PROFILE で特徴量プロファイルを選択）
+card_generator = CardGenerator(feature_profile=os.environ.get('PHOTOBATTLE_FEATURE_PROFILE', 'accurate'))
 
 def allowed_file(filename: str) -> bool:
     """
@@ -86,6 +94,17 @@ def generate_cards():
         if len(files) != 3:
             return jsonify({'error': 'Exactly 3 images required'}), 400
         
+        # 保存・デコードの前にヘッダーだけで形式と画素数を検査
+        # （縮小済みアップロードなら解像度の評価に元のサイズを使う）
+        reported_sizes = reported_original_sizes(request.form, len(files))
+        original_sizes = []
+        for file, reported_size in zip(files, reported_sizes):
+            try:
+                _, width, height = validate_upload(file, app.config['MAX_IMAGE_MEGAPIXELS'])
+            except UploadRejected as e:
+                return jsonify({'error': str(e)}), e.status_code
+            original_sizes.append(trusted_original_size((width, height), reported_size))
+        
         # セッションIDを生成
         session_id = str(uuid.uuid4())
         session_folder = os.path.join(app.config['UPLOAD_FOLDER'], session_id)
@@ -111,7 +130,7 @@ def generate_cards():
                 return jsonify({'error': f'Invalid file: {file.filename}'}), 400
         
         # カードを生成
-        cards_info = card_generator.generate_cards_batch(uploaded_files, cards_folder)
+        cards_info = card_generator.generate_cards_batch(uploaded_files, cards_folder, original_sizes)
         
         if len(cards_info) == 0:
             return jsonify({'error': 'Failed to generate any cards'}), 500
@@ -153,6 +172,50 @@ def generate_cards():
     except Exception as e:
         return jsonify({'error': f'Internal server error: {str(e)}'}), 500
 
+@app.route('/internal/generate', methods=['POST'])
+def generate_cards_for_game_server():
+    """
+    ゲームサーバー（app.py）から依頼されたカード生成
+    
+    画像は app.py が検査して uploads/<session_id>/ に保存済みなので、ファイル名だけを受け取り
+    詳細なカード情報（generate_cards_batch の結果）をそのまま返す
+    """
+    secret = app.config['WORKER_SECRET']
+    if secret and not hmac.compare_digest(request.headers.get(WORKER_SECRET_HEADER, ''), secret):
+        return jsonify({'error': 'Forbidden'}), 403
+    
+    try:
+        data = request.get_json(silent=True) or {}
+        session_id = str(data.get('session_id', ''))
+        filenames = data.get('filenames') or []
+        original_sizes = data.get('original_sizes') or None
+        
+        try:
+            uuid.UUID(session_id)
+        except ValueError:
+            return jsonify({'error': 'Invalid session_id'}), 400
+        if not filenames or any(secure_filename(name) != name or not allowed_file(name) for name in filenames):
+            return jsonify({'error': 'Invalid filenames'}), 400
+        if original_sizes is not None:
+            if len(original_sizes) != len(filenames):
+                return jsonify({'error': 'Invalid original_sizes'}), 400
+            original_sizes = [tuple(size) if size else None for size in original_sizes]
+        
+        session_folder = os.path.join(app.config['UPLOAD_FOLDER'], session_id)
+        cards_folder = os.path.join(app.config['CARDS_FOLDER'], session_id)
+        image_paths = [os.path.join(session_folder, name) for name in filenames]
+        if not all(os.path.exists(path) for path in image_paths):
+            return jsonify({'error': 'Uploaded images not found'}), 404
+        
+        cards_info = card_generator.generate_cards_batch(image_paths, cards_folder, original_sizes)
+        if len(cards_info) == 0:
+            return jsonify({'error': 'Failed to generate any cards'}), 500
+        
+        return jsonify({'cards_info': cards_info})
+        
+    except Exception as e:
+        return jsonify({'error': f'Internal server error: {str(e)}'}), 500
+
 @app.route('/api/cards/<session_id>/<card_filename>', methods=['GET'])
 def get_card(session_id: str, card_filename: str):
     """
@@ -289,5 +352,32 @@ def not_found(e):
 def internal_error(e):
     return jsonify({'error': 'Internal server error'}), 500
 
+def run_worker(host: str, port: int):
+    # ウォームアップが終わってから待ち受けを始める（それまでヘルスチェックに応答しないので、
+    # ゲームサーバーは再起動直後のワーカーにリクエストを振り分けない）
+    seconds = card_generator.warm_up()
+    print(f"🔥 ワーカー {port} のウォームアップ完了（{seconds:.2f}秒）")
+    app.run(debug=False, host=host, port=port, threaded=True)
+
 if __name__ == '__main__':
-    app.run(debug=False, host='0.0.0.0', port=5001)
\ No newline at end of file
+    # --workers N で port, port+1, ... に N 個の生成ワーカーを起動する
+    # （app.py には PHOTOBATTLE_GENERATION_WORKERS でURLを渡す）
+    parser = argparse.ArgumentParser(description='カード生成ワーカー')
+    parser.add_argument('--host', default='127.0.0.1',
+                        help='待ち受けるアドレス（別ホストから使うなら PHOTOBATTLE_WORKER_SECRET も設定する）')
+    parser.add_argument('--port', type=int, default=5001, help='最初のワーカーのポート')
+    parser.add_argument('--workers', type=int, default=1, help='起動するワーカープロセス数')
+    args = parser.parse_args()
+    if args.host not in ('127.0.0.1', 'localhost', '::1') and not app.config['WORKER_SECRET']:
+        print(f"⚠️ {args.host} で待ち受けますが PHOTOBATTLE_WORKER_SECRET が未設定のため、"
+              "/internal/generate は誰からでも呼び出せます")
+    
+    if args.workers <= 1:
+        run_worker(args.host, args.port)
+    else:
+        processes = [multiprocessing.Process(target=run_worker, args=(args.host, args.port + i))
+                     for i in range(args.workers)]
+        for process in processes:
+            process.start()
+        for process in processes:
+            process.join()
\ No newline at end of file
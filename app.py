@@ -1,4 +1,4 @@
-from flask import Flask, render_template, request, send_from_directory, jsonify
+from flask import Flask, render_template, request, send_from_directory, jsonify, Response
 from flask_socketio import SocketIO, emit, join_room, leave_room
 from flask_cors import CORS
 import uuid
@@ -8,24 +8,104 @@ from io import BytesIO
 import os
 import json
 import shutil
+import sqlite3
 from datetime import datetime
 from werkzeug.utils import secure_filename
 import socket
 import math
+import random
+import time
+import functools
+from timer_wheel import TimerWheel
+from matchmaking import MatchmakingQueue, average_attack_power
+from player_tokens import PlayerRegistry, TOKEN_PATTERN, public_player_id, rebind_player
+from metrics import DirectorySizeMonitor, MetricsRegistry
+from stage_profiler import TimingHook, StageProfiler, combine_hooks
+from upload_validation import validate_upload, UploadRejected, reported_original_sizes, trusted_original_size
+from feature_store import FeatureStore
+from image_hashes import PerceptualHashIndex, DUPLICATE_RADIUS
+from admission import AdmissionController, Overloaded
+from rate_limiter import TokenBucketLimiter
+from generation_client import GenerationClient, GenerationError, NoHealthyWorkers
+from static_pages import StaticPages
+from spectators import SpectatorHub, spectator_group
+from emit_batcher import EmitBatcher
+from battle_log import BattleLog, battle_summary, HISTORY_TAIL, ROUND, FINISHED
+from leaderboard import Leaderboard
+from card_collection import CardCollection, CollectionError
+from lazy_imports import lazy_object
+from wire_format import resolve_wire_format, socketio_serializer, client_head_html
 
 app = Flask(__name__)
 app.config['SECRET_KEY'] = 'your-secret-key-here'
 CORS(app)
-socketio = SocketIO(app, cors_allowed_origins="*")
+
+# Socket.IO の通信形式（PHOTOBATTLE_WIRE_FORMAT=msgpack で MessagePack + 短縮スキーマ）
+WIRE_FORMAT = resolve_wire_format(os.environ.get('PHOTOBATTLE_WIRE_FORMAT', 'json'))
+socketio = SocketIO(app, cors_allowed_origins="*", serializer=socketio_serializer(WIRE_FORMAT))
 
 # 設定
 UPLOAD_FOLDER = 'uploads'
 CARDS_FOLDER = 'generated_cards'
+FEATURE_STORE_PATH = 'analytics/card_features.bin'
+IMAGE_HASH_PATH = 'analytics/image_hashes.bin'
+BATTLE_LOG_PATH = 'logs/battles.jsonl'
+LEADERBOARD_PATH = 'analytics/leaderboard.sqlite3'
+COLLECTION_DB_PATH = 'collection/cards.sqlite3'
+COLLECTION_IMAGE_FOLDER = 'collection/images'
 ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif', 'bmp'}
 
 app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
 app.config['CARDS_FOLDER'] = CARDS_FOLDER
 app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024
+app.config['MAX_IMAGE_MEGAPIXELS'] = 50
+# ブラウザで縮小してからアップロードさせる長辺の上限（/api/config で通知）
+app.config['MAX_ANALYSIS_DIMENSION'] = 1600
+app.config['UPLOAD_JPEG_QUALITY'] = 0.9
+# ほぼ同じ写真とみなす dHash のハミング距離（64ビット中）
+app.config['DUPLICATE_HASH_RADIUS'] = DUPLICATE_RADIUS
+
+# カード生成の同時実行数と待ち行列の長さ（両方埋まったら待たせずに 503 + Retry-After を返す）
+app.config['GENERATION_CONCURRENCY'] = int(os.environ.get('PHOTOBATTLE_GENERATION_CONCURRENCY', os.cpu_count() or 1))
+app.config['GENERATION_QUEUE_DEPTH'] = int(os.environ.get(
+    'PHOTOBATTLE_GENERATION_QUEUE_DEPTH', 4 * app.config['GENERATION_CONCURRENCY']))
+
+# クライアントごとの呼び出し予算（1秒あたりの補充数, 続けて使える回数）。超えたら HTTP は 429、
+# Socket.IO のイベントはハンドラーを呼ばずに捨てる。
+# HTTP はIPごと（教室など同じIPの大人数を考えて多め）と、プレイヤートークン付きならプレイヤーごとの両方で数える
+HTTP_IP_RATE_BUDGETS = {
+    'generate_cards': (2.0, 60),
+    'build_collection_deck': (2.0, 60),
+    'list_collection_cards': (20.0, 200),
+}
+HTTP_PLAYER_RATE_BUDGETS = {
+    'generate_cards': (0.2, 5),
+    'build_collection_deck': (0.5, 5),
+    'list_collection_cards': (5.0, 20),
+}
+SOCKET_RATE_BUDGETS = {
+    'request_card_sync': (1.0, 5),
+    'get_room_status': (2.0, 10),
+    'force_card_update': (0.5, 3),
+    'reset_all_cards': (0.2, 2),
+    'create_room': (0.5, 5),
+    'join_room_request': (1.0, 5),
+    'find_match': (1.0, 5),
+    'spectate_room': (1.0, 5),
+}
+SOCKET_DEFAULT_RATE_BUDGET = (10.0, 30)
+
+# カード生成ワーカー（api_interface.py）のURL。カンマ区切りで複数指定、未指定ならこのプロセスで生成
+GENERATION_WORKERS = [url.strip() for url in os.environ.get('PHOTOBATTLE_GENERATION_WORKERS', '').split(',') if url.strip()]
+# ワーカーと共有するシークレット（ワーカー側にも同じ値を設定すると、付けていない依頼は断られる）
+GENERATION_WORKER_SECRET = os.environ.get('PHOTOBATTLE_WORKER_SECRET') or None
+
+# タイマー設定（秒）
+NEXT_ROUND_DELAY = 3
+SELECTION_TIMEOUT = 30
+REMATCH_WINDOW = 120
+MATCHMAKING_SWEEP_INTERVAL = 1  # 待機者同士を組み直す間隔
+STORAGE_SCAN_INTERVAL = 60      # uploads/・generated_cards/ の使用容量を測り直す間隔
 
 # フォルダの作成
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
@@ -34,29 +114,251 @@ os.makedirs(CARDS_FOLDER, exist_ok=True)
 # データストレージ
 rooms = {}
 users = {}
+connected_sockets = 0
+
+# メトリクス
+metrics_registry = MetricsRegistry()
+generation_stage_seconds = metrics_registry.histogram(
+    'photobattle_card_generation_stage_seconds',
+    'Time spent in each card generation stage', 'stage')
+socketio_event_seconds = metrics_registry.histogram(
+    'photobattle_socketio_event_seconds',
+    'Socket.IO event handler latency', 'event')
+generation_worker_seconds = metrics_registry.histogram(
+    'photobattle_generation_worker_seconds',
+    'Card generation latency per worker as seen by the game server', 'worker')
+metrics_registry.gauge('photobattle_active_rooms', 'Number of active rooms', lambda: len(rooms))
+metrics_registry.gauge('photobattle_connected_sockets', 'Number of connected sockets', lambda: connected_sockets)
+# 使用容量はスクレイプのたびに測らず、バックグラウンドで STORAGE_SCAN_INTERVAL 秒ごとに測る
+storage_monitor = DirectorySizeMonitor((UPLOAD_FOLDER, CARDS_FOLDER), STORAGE_SCAN_INTERVAL)
+metrics_registry.gauge(
+    'photobattle_storage_bytes', 'Bytes on disk per storage folder (refreshed in the background)',
+    lambda: storage_monitor.snapshot(), label_name='folder')
+
+# カード生成の詳細プロファイル（PHOTOBATTLE_PROFILE=1 のときだけ有効）
+# POST /debug/profile で一度に予約できる cProfile 計測は MAX_PROFILED_BATCHES 回まで
+MAX_PROFILED_BATCHES = 20
+generation_profiler = StageProfiler(track_memory=True) if os.environ.get('PHOTOBATTLE_PROFILE') == '1' else None
+
+# カード生成用のインスタンス（特徴量プロファイルは PHOTOBATTLE_FEATURE_PROFILE=fast などで切り替え）
+card_generator = CardGenerator(profiler=combine_hooks(
+    TimingHook(generation_stage_seconds.observe), generation_profiler),
+    feature_profile=os.environ.get('PHOTOBATTLE_FEATURE_PROFILE', 'accurate'))
+
+# カード生成の受付制御（同時実行数の枠と到着順の待ち行列）
+generation_admission = AdmissionController(app.config['GENERATION_CONCURRENCY'], app.config['GENERATION_QUEUE_DEPTH'])
+metrics_registry.gauge('photobattle_generation_in_flight', 'Card generation requests being processed',
+                       generation_admission.in_flight)
+metrics_registry.gauge('photobattle_generation_queue_depth', 'Card generation requests waiting for a slot',
+                       generation_admission.queued)
+metrics_registry.counter('photobattle_generation_rejected_total', 'Card generation requests rejected with 503',
+                         lambda: generation_admission.rejected)
+
+# クライアントごとのトークンバケツ（使われなくなったバケツは捨てるのでメモリは上限つき）
+rate_limiters = {
+    'ip': TokenBucketLimiter(HTTP_IP_RATE_BUDGETS),
+    'player': TokenBucketLimiter(HTTP_PLAYER_RATE_BUDGETS),
+    'socket': TokenBucketLimiter(SOCKET_RATE_BUDGETS, default=SOCKET_DEFAULT_RATE_BUDGET),
+}
+metrics_registry.counter('photobattle_rate_limited_total', 'Requests and events rejected by the rate limiter',
+                         lambda: {f'{scope}:{name}': count for scope, limiter in rate_limiters.items()
+                                  for name, count in limiter.limited.items()}, label_name='name')
+metrics_registry.gauge('photobattle_rate_limit_buckets', 'Token buckets held by the rate limiter',
+                       lambda: {scope: len(limiter) for scope, limiter in rate_limiters.items()}, label_name='scope')
+
+def rate_limited(handler):
+    """
+    HTTP_IP_RATE_BUDGETS（IPごと）と HTTP_PLAYER_RATE_BUDGETS（プレイヤーごと）の予算で
+    呼び出し回数を制限する（超えたら 429 + Retry-After）
+    """
+    @functools.wraps(handler)
+    def limited_handler(*args, **kwargs):
+        wait = rate_limiters['ip'].check(request.remote_addr, handler.__name__)
+        player_id = request_player_id()
+        if not wait and player_id is not None:
+            wait = rate_limiters['player'].check(player_id, handler.__name__)
+        if wait:
+            retry_after = max(1, math.ceil(wait))
+            response = jsonify({'error': 'Too many requests', 'retry_after': retry_after})
+            response.status_code = 429
+            response.headers['Retry-After'] = str(retry_after)
+            return response
+        return handler(*args, **kwargs)
+    return limited_handler
+
+# 起動直後は cold。warm_up() がストアを読み込み、合成画像でカード生成を1回通し終えると ready になり、
+# それまで /api/ready は 503 を返す（ロードバランサーは ready になってから振り分ける）
+readiness = {'state': 'cold', 'warm_up_seconds': None, 'error': None}
+
+def warm_up():
+    """
+    ストアの読み込みとカード生成の初回コスト（遅延 import・フォント・OpenCV/PNGの初期化）を先に払って ready にする
+    """
+    readiness['state'] = 'warming_up'
+    started = time.perf_counter()
+    try:
+        for store in (feature_store, image_hash_index, card_collection, battle_log, leaderboard):
+            store.load()
+        card_generator.warm_up()
+    except Exception as e:
+        readiness.update(state='failed', error=str(e))
+        print(f"⚠️ ウォームアップに失敗しました: {e}")
+        return
+    seconds = time.perf_counter() - started
+    readiness.update(state='ready', warm_up_seconds=round(seconds, 3))
+    print(f"🔥 ウォームアップ完了（{seconds:.2f}秒）")
+
+def start_warm_up() -> bool:
+    """
+    ウォームアップをバックグラウンドタスクで1回だけ始める（サーバーはその間も応答する）
+    """
+    if readiness['state'] != 'cold':
+        return False
+    readiness['state'] = 'warming_up'
+    socketio.start_background_task(warm_up)
+    return True
+
+# カード生成ワーカーへの接続プール（ワーカー未指定ならNone）
+generation_client = GenerationClient(GENERATION_WORKERS, secret=GENERATION_WORKER_SECRET) if GENERATION_WORKERS else None
+if generation_client is not None:
+    metrics_registry.gauge(
+        'photobattle_generation_worker_healthy', 'Whether each generation worker passes health checks',
+        lambda: {worker['url']: int(worker['healthy']) for worker in generation_client.status()},
+        label_name='worker')
+
+def generate_card_batch(session_id: str, uploaded_files: list, cards_folder: str,
+                        original_sizes: list = None) -> list:
+    """
+    生成ワーカーがあればそちらに任せ、なければ（全ワーカー停止中も）このプロセスで生成する
+    """
+    if generation_client is not None:
+        generation_client.start(socketio.start_background_task, socketio.sleep)
+        started = time.perf_counter()
+        try:
+            cards_info, worker_url = generation_client.generate(
+                session_id, [os.path.basename(path) for path in uploaded_files], original_sizes)
+            generation_worker_seconds.observe(worker_url, time.perf_counter() - started)
+            return cards_info
+        except NoHealthyWorkers:
+            print("⚠️ 生成ワーカーが応答しないため、ゲームサーバーでカードを生成します")
+    
+    return card_generator.generate_cards_batch(uploaded_files, cards_folder, original_sizes)
+
+# 以下のストアは開くときにファイルやDBを全部読み込むので、import 時ではなく warm_up()
+# （それより先にリクエストが来たら最初の参照）で作る。ゲージは読み込むまで 0 を返す
+
+# 全カードの特徴量（集計用の固定長レコード）
+feature_store = lazy_object(lambda: FeatureStore(FEATURE_STORE_PATH), 'feature_store')
+
+# アップロードされた写真の知覚ハッシュ（ほぼ同じ写真の再アップロードの検出用）
+image_hash_index = lazy_object(
+    lambda: PerceptualHashIndex(IMAGE_HASH_PATH, start_task=socketio.start_background_task), 'image_hash_index')
+metrics_registry.gauge('photobattle_indexed_image_hashes', 'Number of uploaded photos in the perceptual hash index',
+                       lambda: len(image_hash_index) if image_hash_index.loaded else 0)
 
-# カード生成用のインスタンス
-card_generator = CardGenerator()
+# プレイヤーごとのカードコレクション（デッキはここに保存した画像から組み立てる）
+card_collection = lazy_object(lambda: CardCollection(COLLECTION_DB_PATH, COLLECTION_IMAGE_FOLDER), 'card_collection')
+
+# 再接続用のプレイヤートークン（token → プレイヤー状態, sid → token）
+player_registry = PlayerRegistry()
+
+# 自動マッチング用の待機キュー
+matchmaking_queue = MatchmakingQueue()
+matchmaking_tokens = {}
+
+# 観戦者（プレイヤーとは別グループ・別タスクで送信）
+spectator_hub = SpectatorHub(socketio.emit, socketio.close_room)
+metrics_registry.gauge('photobattle_spectators', 'Number of connected spectators', lambda: spectator_hub.count())
+
+# 決着したラウンド・試合結果の追記専用ログ（書き込みはバックグラウンドタスク）
+battle_log = lazy_object(lambda: BattleLog(BATTLE_LOG_PATH), 'battle_log')
+metrics_registry.gauge('photobattle_battle_log_pending', 'Battle log records waiting to be written',
+                       lambda: battle_log.pending() if battle_log.loaded else 0)
+
+# Elo レーティングのランキング（保存はバックグラウンドタスク）
+leaderboard = lazy_object(lambda: Leaderboard(LEADERBOARD_PATH), 'leaderboard')
+metrics_registry.gauge('photobattle_rated_players', 'Number of players on the leaderboard',
+                       lambda: len(leaderboard) if leaderboard.loaded else 0)
+
+# 1回の状態遷移で送るイベントを受信者ごとに1フレームにまとめる
+emit_batcher = EmitBatcher(socketio.emit)
+
+def batched_emits(handler):
+    """
+    ハンドラー内の emit_to_room / emit_to_player を受信者ごとにまとめて最後に送る
+    """
+    @functools.wraps(handler)
+    def wrapper(*args, **kwargs):
+        with emit_batcher.batch():
+            return handler(*args, **kwargs)
+    return wrapper
+
+def emit_to_room(event: str, data: dict, room_id: str, include_self: bool = True):
+    """
+    ルームのプレイヤーに送ったあと、同じイベントを観戦者向けに積む
+    """
+    players = rooms[room_id].get('players', []) if room_id in rooms else None
+    skip_sid = None if include_self else request.sid
+    emit_batcher.emit(event, data, room_id, players, skip_sid)
+    spectator_hub.broadcast(room_id, event, data)
+
+def emit_to_player(event: str, data: dict, player_id: str):
+    emit_batcher.emit(event, data, player_id)
+
+def reject_spectator(room_id: str) -> bool:
+    """
+    観戦者からのゲーム操作を拒否する（拒否したらTrue）
+    """
+    if spectator_hub.is_spectator(room_id, request.sid):
+        emit('error', {'message': '観戦中は操作できません'})
+        return True
+    return False
+
+# 全ルームのタイマー（次ラウンド開始・選択期限・再戦受付）を管理するスケジューラー
+timer_wheel = TimerWheel()
+
+def schedule_room_timer(room_id: str, kind: str, delay: float, callback, *args):
+    timer_wheel.start(socketio.start_background_task, socketio.sleep)
+    timer_wheel.schedule((room_id, kind), delay, callback, *args)
+
+def cancel_room_timers(room_id: str):
+    for kind in ('next_round', 'selection', 'rematch'):
+        timer_wheel.cancel((room_id, kind))
+
+# HTMLページ（起動時に圧縮してメモリに保持）
+static_pages = StaticPages('.', ['matching.html', 'card-generation.html', 'battle.html', 'spectate.html'],
+                           head_html=client_head_html(WIRE_FORMAT))
 
 # HTMLページのルーティング
 @app.route('/')
 def index():
-    return send_from_directory('.', 'matching.html')
+    return static_pages.response('matching.html', request)
 
 @app.route('/matching')
 @app.route('/matching.html')
 def matching():
-    return send_from_directory('.', 'matching.html')
+    return static_pages.response('matching.html', request)
 
 @app.route('/card-generation')
 @app.route('/card-generation.html')
 def card_generation():
-    return send_from_directory('.', 'card-generation.html')
+    return static_pages.response('card-generation.html', request)
 
 @app.route('/battle')
 @app.route('/battle.html')
 def battle():
-    return send_from_directory('.', 'battle.html')
+    return static_pages.response('battle.html', request)
+
+@app.route('/spectate')
+@app.route('/spectate.html')
+def spectate():
+    return static_pages.response('spectate.html', request)
+
+@app.route('/pages/<fingerprint>/<page>')
+def fingerprinted_page(fingerprint: str, page: str):
+    if page not in static_pages.pages:
+        return jsonify({'error': 'Page not found'}), 404
+    return static_pages.fingerprinted_response(fingerprint, page, request)
 
 # API エンドポイント
 def allowed_file(filename: str) -> bool:
@@ -100,10 +402,42 @@ def health_check():
         'timestamp': datetime.now().isoformat(),
         'service': 'photo-battle-app',
         'version': '2.0.0',
-        'features': ['socket_io', 'card_generation', 'battle_system']
+        'features': ['socket_io', 'card_generation', 'battle_system'],
+        'generation_workers': generation_client.status() if generation_client is not None else []
+    })
+
+@app.route('/api/ready', methods=['GET'])
+def readiness_check():
+    """
+    ウォームアップ済みでカード生成の待ち行列に空きがあれば 200、そうでなければ 503 + Retry-After
+    （どちらの場合も待ち行列の状況を返すので、ロードバランサーや画面側が様子を見て待てる）
+
+    python app.py 以外（WSGIサーバーなど）で起動されてまだウォームアップを始めていなければ、ここで始める
+    """
+    start_warm_up()
+    generation = generation_admission.status()
+    saturated = generation_admission.saturated()
+    ready = readiness['state'] == 'ready' and not saturated
+    response = jsonify(dict(readiness, ready=ready, generation=dict(generation, saturated=saturated)))
+    if ready:
+        return response
+    response.status_code = 503
+    response.headers['Retry-After'] = str(max(1, math.ceil(generation['estimated_wait_seconds'])) if saturated else 1)
+    return response
+
+@app.route('/api/config', methods=['GET'])
+def client_config():
+    return jsonify({
+        'max_analysis_dimension': app.config['MAX_ANALYSIS_DIMENSION'],
+        'upload_jpeg_quality': app.config['UPLOAD_JPEG_QUALITY'],
+        'max_content_length': app.config['MAX_CONTENT_LENGTH'],
+        'max_image_megapixels': app.config['MAX_IMAGE_MEGAPIXELS'],
+        'allowed_extensions': sorted(ALLOWED_EXTENSIONS),
+        'wire_format': WIRE_FORMAT
     })
 
 @app.route('/api/cards/generate', methods=['POST'])
+@rate_limited
 def generate_cards():
     try:
         if 'images' not in request.files:
@@ -114,66 +448,149 @@ def generate_cards():
         if len(files) != 3:
             return jsonify({'error': 'Exactly 3 images required'}), 400
         
-        session_id = str(uuid.uuid4())
-        session_folder = os.path.join(app.config['UPLOAD_FOLDER'], session_id)
-        cards_folder = os.path.join(app.config['CARDS_FOLDER'], session_id)
+        # 縮小済みアップロードなら解像度の評価に元のサイズを使う
+        reported_sizes = reported_original_sizes(request.form, len(files))
+        original_sizes = []
+        for file, reported_size in zip(files, reported_sizes):
+            try:
+                _, width, height = validate_upload(file, app.config['MAX_IMAGE_MEGAPIXELS'])
+            except UploadRejected as e:
+                return jsonify({'error': str(e)}), e.status_code
+            original_sizes.append(trusted_original_size((width, height), reported_size))
+        
+        # 生成の枠が空くまで到着順に待つ（待ち行列も満杯なら Overloaded ですぐに 503）
+        with generation_admission.admit():
+            session_id = str(uuid.uuid4())
+            session_folder = os.path.join(app.config['UPLOAD_FOLDER'], session_id)
+            cards_folder = os.path.join(app.config['CARDS_FOLDER'], session_id)
+        
+            os.makedirs(session_folder, exist_ok=True)
+            os.makedirs(cards_folder, exist_ok=True)
         
-        os.makedirs(session_folder, exist_ok=True)
-        os.makedirs(cards_folder, exist_ok=True)
-        
-        uploaded_files = []
-        for i, file in enumerate(files):
-            if file and file.filename and allowed_file(file.filename):
-                filename = secure_filename(file.filename)
-                name, ext = os.path.splitext(filename)
-                filename = f"{name}_{i+1}{ext}"
-                filepath = os.path.join(session_folder, filename)
-                file.save(filepath)
-                uploaded_files.append(filepath)
-            else:
-                shutil.rmtree(session_folder, ignore_errors=True)
-                shutil.rmtree(cards_folder, ignore_errors=True)
-                return jsonify({'error': f'Invalid file: {file.filename}'}), 400
-        
-        cards_info = card_generator.generate_cards_batch(uploaded_files, cards_folder)
+            uploaded_files = []
+            for i, file in enumerate(files):
+                if file and file.filename and allowed_file(file.filename):
+                    filename = secure_filename(file.filename)
+                    name, ext = os.path.splitext(filename)
+                    filename = f"{name}_{i+1}{ext}"
+                    filepath = os.path.join(session_folder, filename)
+                    file.save(filepath)
+                    uploaded_files.append(filepath)
+                else:
+                    shutil.rmtree(session_folder, ignore_errors=True)
+                    shutil.rmtree(cards_folder, ignore_errors=True)
+                    return jsonify({'error': f'Invalid file: {file.filename}'}), 400
+        
+            try:
+                cards_info = generate_card_batch(session_id, uploaded_files, cards_folder, original_sizes)
+            except GenerationError as e:
+                return jsonify({'error': str(e)}), e.status_code
         
         if len(cards_info) == 0:
             return jsonify({'error': 'Failed to generate any cards'}), 500
         
-        game_cards = []
-        for i, card_info in enumerate(cards_info):
-            game_card = prepare_card_for_game_logic(card_info, session_id, i)
-            game_cards.append(game_card)
-        
-        response_data = {
-            'session_id': session_id,
-            'cards': game_cards,
-            'timestamp': datetime.now().isoformat(),
-            'card_generation_info': {
-                'total_cards': len(game_cards),
-                'attributes_generated': [card['attribute'] for card in game_cards],
-                'average_attack_power': sum(card['attack_power'] for card in game_cards) / len(game_cards)
-            },
-            'attribute_system': {
-                'attributes': ['火', '水', '土'],
-                'effectiveness_rules': 'fire > earth > water > fire'
-            }
-        }
+        feature_store.append(cards_info, session_id)
         
-        session_data = {
-            'response_data': response_data,
-            'detailed_cards_info': cards_info
-        }
+        # 登録前に過去のアップロードとの重複を調べる（同じ写真の使い回しの判定用）
+        player_id = request_player_id()
+        near_duplicates = find_near_duplicates(cards_info, player_id)
+        image_hash_index.add(cards_info, session_id, player_id)
         
-        session_info_path = os.path.join(cards_folder, 'session_info.json')
-        with open(session_info_path, 'w', encoding='utf-8') as f:
-            json.dump(session_data, f, ensure_ascii=False, indent=2)
+        response_data = save_card_session(session_id, cards_info, cards_folder)
+        response_data['near_duplicates'] = near_duplicates
+        
+        # プレイヤートークン付きのアップロードならカードをコレクションにも残す
+        if player_id is not None:
+            try:
+                response_data['collection_card_ids'] = card_collection.add_cards(player_id, cards_info)
+            except (OSError, sqlite3.Error) as e:
+                print(f"⚠️ カードをコレクションに保存できませんでした: {e}")
         
         return jsonify(response_data)
         
+    except Overloaded as e:
+        return overloaded_response(e)
     except Exception as e:
         return jsonify({'error': f'Internal server error: {str(e)}'}), 500
 
+def overloaded_response(error: Overloaded):
+    """
+    混雑時の 503（Retry-After と見積もり待ち時間付き）
+    """
+    response = jsonify({
+        'error': str(error),
+        'retry_after': error.retry_after,
+        'estimated_wait_seconds': round(error.estimated_wait, 1),
+    })
+    response.status_code = error.status_code
+    response.headers['Retry-After'] = str(error.retry_after)
+    return response
+
+def find_near_duplicates(cards_info: list, player_id: str = None) -> list:
+    """
+    カードごとに、過去にアップロードされたほぼ同じ写真のうち最も近いもの（なければ None）を返す
+
+    他人のセッションIDは返さず、距離・最初のアップロード時刻・自分の過去のアップロードに
+    同じ写真があるかどうかだけを返す
+    """
+    near_duplicates = []
+    for card_info in cards_info:
+        dhash = card_info.get('features', {}).get('dhash')
+        matches = image_hash_index.lookup(dhash, app.config['DUPLICATE_HASH_RADIUS']) if dhash else []
+        if not matches:
+            near_duplicates.append(None)
+            continue
+        near_duplicates.append({
+            'distance': matches[0]['distance'],
+            'first_seen_at': datetime.fromtimestamp(min(match['created_at'] for match in matches)).isoformat(),
+            'own_upload': player_id is not None and any(match['player_id'] == player_id for match in matches),
+        })
+    return near_duplicates
+
+def request_player_id():
+    """
+    X-Player-Token ヘッダーのプレイヤートークンから公開用のプレイヤーIDを求める（なければ None）
+    """
+    token = request.headers.get('X-Player-Token', '')
+    if not TOKEN_PATTERN.match(token):
+        return None
+    return public_player_id(token)
+
+def save_card_session(session_id: str, cards_info: list, cards_folder: str) -> dict:
+    """
+    カード一覧を session_info.json に保存し、クライアントへ返す内容を作る
+    """
+    game_cards = []
+    for i, card_info in enumerate(cards_info):
+        game_card = prepare_card_for_game_logic(card_info, session_id, i)
+        game_cards.append(game_card)
+    
+    response_data = {
+        'session_id': session_id,
+        'cards': game_cards,
+        'timestamp': datetime.now().isoformat(),
+        'card_generation_info': {
+            'total_cards': len(game_cards),
+            'attributes_generated': [card['attribute'] for card in game_cards],
+            'average_attack_power': sum(card['attack_power'] for card in game_cards) / len(game_cards)
+        },
+        'attribute_system': {
+            'attributes': ['火', '水', '土'],
+            'effectiveness_rules': 'fire > earth > water > fire'
+        }
+    }
+    
+    session_data = {
+        'response_data': response_data,
+        'detailed_cards_info': cards_info
+    }
+    
+    session_info_path = os.path.join(cards_folder, 'session_info.json')
+    with open(session_info_path, 'w', encoding='utf-8') as f:
+        json.dump(session_data, f, ensure_ascii=False, indent=2)
+    
+    return response_data
+
 @app.route('/api/cards/<session_id>/<card_filename>', methods=['GET'])
 def get_card(session_id: str, card_filename: str):
     try:
@@ -204,37 +621,255 @@ def get_session_info(session_id: str):
     except Exception as e:
         return jsonify({'error': f'Error retrieving session info: {str(e)}'}), 500
 
+@app.route('/api/analytics/cards', methods=['GET'])
+def card_analytics():
+    try:
+        bin_width = int(request.args.get('bin_width', 10))
+    except ValueError:
+        bin_width = 0
+    if not 1 <= bin_width <= 90:
+        return jsonify({'error': 'bin_width must be an integer between 1 and 90'}), 400
+    
+    try:
+        since = request.args.get('since', type=float)
+        until = request.args.get('until', type=float)
+        return jsonify({
+            'total_cards': len(feature_store.query(since=since, until=until)),
+            'attribute_fractions': feature_store.attribute_fractions(since, until),
+            'attack_power_histogram': feature_store.attack_power_histogram(bin_width, since, until)
+        })
+        
+    except Exception as e:
+        return jsonify({'error': f'Error reading analytics: {str(e)}'}), 500
+
+@app.route('/api/collection/cards', methods=['GET'])
+@rate_limited
+def list_collection_cards():
+    """
+    自分のコレクションを絞り込み・並び替えて1ページ分返す（次のページは next_cursor を cursor に渡す）
+    """
+    player_id = request_player_id()
+    if player_id is None:
+        return jsonify({'error': 'X-Player-Token header required'}), 401
+    
+    try:
+        cards, next_cursor = card_collection.query(
+            player_id,
+            attribute=request.args.get('attribute'),
+            min_attack=request.args.get('min_attack', type=int),
+            max_attack=request.args.get('max_attack', type=int),
+            since=request.args.get('since', type=float),
+            until=request.args.get('until', type=float),
+            sort=request.args.get('sort', 'created_at'),
+            descending=request.args.get('order', 'desc') != 'asc',
+            limit=request.args.get('limit', 50, type=int),
+            cursor=request.args.get('cursor'))
+    except CollectionError as e:
+        return jsonify({'error': str(e)}), e.status_code
+    
+    for card in cards:
+        card['card_image_url'] = f"/api/collection/images/{card.pop('image_key')}.png"
+    return jsonify({
+        'player_id': player_id,
+        'cards': cards,
+        'next_cursor': next_cursor
+    })
+
+@app.route('/api/collection/images/<image_key>.png', methods=['GET'])
+def get_collection_card_image(image_key: str):
+    """
+    コレクションのカード画像（URL は一覧で返した推測できない image_key。<img> から読めるようにトークンは不要）
+    """
+    image_path = card_collection.image_path_for_key(image_key)
+    if image_path is None or not os.path.exists(image_path):
+        return jsonify({'error': 'Card not found'}), 404
+    return send_from_directory(os.path.dirname(image_path), os.path.basename(image_path), mimetype='image/png')
+
+@app.route('/api/collection/decks', methods=['POST'])
+@rate_limited
+def build_collection_deck():
+    """
+    コレクションから3枚選んでデッキ（新しいセッション）を作る。カード画像は作り直さず保存済みのものを使う
+    """
+    player_id = request_player_id()
+    if player_id is None:
+        return jsonify({'error': 'X-Player-Token header required'}), 401
+    
+    card_ids = (request.get_json(silent=True) or {}).get('card_ids')
+    if not isinstance(card_ids, list) or len(card_ids) != 3 or \
+            not all(isinstance(card_id, int) for card_id in card_ids):
+        return jsonify({'error': 'card_ids must be a list of 3 card ids'}), 400
+    
+    session_id = str(uuid.uuid4())
+    cards_folder = os.path.join(app.config['CARDS_FOLDER'], session_id)
+    try:
+        cards_info = card_collection.build_deck(player_id, card_ids, cards_folder)
+    except CollectionError as e:
+        shutil.rmtree(cards_folder, ignore_errors=True)
+        return jsonify({'error': str(e)}), e.status_code
+    
+    return jsonify(save_card_session(session_id, cards_info, cards_folder))
+
+@app.route('/api/rooms/<room_id>/replay', methods=['GET'])
+def replay_match(room_id: str):
+    """
+    終了した試合のログを JSON Lines で返す（match_id 省略時はそのルームで最後に終了した試合）
+    """
+    room_id = room_id.upper()
+    match_id = request.args.get('match_id')
+    # 書き込みが止まっていても待ち続けず、書けている分だけで答える
+    battle_log.flush(timeout=5.0)
+    
+    records = battle_log.replay(room_id, match_id)
+    first = next(records, None)
+    if first is None:
+        return jsonify({'error': 'Match not found', 'matches': battle_log.matches(room_id)}), 404
+    
+    def stream():
+        yield json.dumps(first, ensure_ascii=False) + '\n'
+        for record in records:
+            yield json.dumps(record, ensure_ascii=False) + '\n'
+    
+    return Response(stream(), mimetype='application/x-ndjson')
+
+@app.route('/api/leaderboard', methods=['GET'])
+def leaderboard_top():
+    limit = min(max(request.args.get('limit', 10, type=int), 1), 100)
+    return jsonify({
+        'total_players': len(leaderboard),
+        'top': leaderboard.top(limit)
+    })
+
+@app.route('/api/leaderboard/<player_id>', methods=['GET'])
+def leaderboard_player(player_id: str):
+    radius = min(max(request.args.get('radius', 5, type=int), 0), 50)
+    player = leaderboard.rank(player_id)
+    if player is None:
+        return jsonify({'error': 'Player not found'}), 404
+    return jsonify({
+        'player': player,
+        'around': leaderboard.around(player_id, radius)
+    })
+
+@app.route('/metrics', methods=['GET'])
+def export_metrics():
+    storage_monitor.start(socketio.start_background_task, socketio.sleep)
+    return Response(metrics_registry.render(), mimetype='text/plain; version=0.0.4')
+
+@app.route('/debug/profile', methods=['GET', 'POST'])
+def generation_profile():
+    if generation_profiler is None:
+        return jsonify({'error': 'Profiling disabled (set PHOTOBATTLE_PROFILE=1)'}), 404
+    
+    if request.method == 'POST':
+        try:
+            batches = int(request.args.get('batches', 1))
+        except ValueError:
+            batches = 0
+        if not 1 <= batches <= MAX_PROFILED_BATCHES:
+            return jsonify({'error': f'batches must be an integer between 1 and {MAX_PROFILED_BATCHES}'}), 400
+        generation_profiler.profile_next_batches(batches)
+        return jsonify({'message': f'Next {batches} batch(es) will be profiled with cProfile'})
+    
+    return jsonify({
+        'summary': generation_profiler.summary(),
+        'recent_cards': list(generation_profiler.reports)[-10:],
+        'pstats_dumps': generation_profiler.dumps
+    })
+
 # Socket.IO イベントハンドラー
+def on_event(event: str):
+    """
+    socketio.on と同じ登録に加えて、ハンドラーの処理時間をメトリクスに記録する
+    （sid ごとの予算を超えたイベントはハンドラーを呼ばずに捨てる）
+    """
+    def decorator(handler):
+        histogram = socketio_event_seconds.labels(event)
+        
+        @functools.wraps(handler)
+        def timed_handler(*args, **kwargs):
+            if not rate_limiters['socket'].allow(request.sid, event):
+                return
+            started = time.perf_counter()
+            try:
+                return handler(*args, **kwargs)
+            finally:
+                histogram.observe(time.perf_counter() - started)
+        
+        return socketio.on(event)(timed_handler)
+    return decorator
+
 @socketio.on('connect')
 def on_connect():
+    global connected_sockets
+    connected_sockets += 1
     emit('connected', {'message': 'Connected to server'})
 
 @socketio.on('disconnect')
 def on_disconnect():
-    pass
+    global connected_sockets
+    connected_sockets -= 1
+    matchmaking_queue.remove(request.sid)
+    matchmaking_tokens.pop(request.sid, None)
+    player_registry.disconnect(request.sid)
+    spectator_hub.remove(request.sid)
 
-@socketio.on('create_room')
-def create_room():
+def new_room(players: list) -> str:
     room_id = str(uuid.uuid4())[:8].upper()
     rooms[room_id] = {
-        'players': [request.sid],
-        'status': 'waiting',
+        'players': list(players),
+        'status': 'ready' if len(players) == 2 else 'waiting',
         'current_round': 1,
         'max_rounds': 3,
-        'scores': {request.sid: 0},
+        'scores': {player_id: 0 for player_id in players},
         'player_cards': {},
         'current_selections': {},
         'battle_history': [],
+        'match_id': uuid.uuid4().hex,
+        'player_tokens': [],
         'created_at': datetime.now().isoformat()
     }
+    return room_id
+
+def record_rated_game(room: dict, winner_sid: str = None) -> dict:
+    """
+    試合結果をレーティングに反映し、{sid: 新しいレーティング・変動・順位} を返す
+
+    ランキング上のプレイヤーはプレイヤートークンから作ったIDで識別する（トークンを持たない
+    プレイヤーがいる試合や、同じトークン同士の試合は記録しない）
+    """
+    keys = {}
+    for token in room.get('player_tokens', []):
+        state = player_registry.get(token)
+        if state and state['sid'] in room['players']:
+            keys[state['sid']] = public_player_id(token)
+    if len(keys) != 2 or len(set(keys.values())) != 2:
+        return {}
+    
+    (sid_a, key_a), (sid_b, key_b) = keys.items()
+    ratings = leaderboard.record_game(key_a, key_b, keys.get(winner_sid))
+    leaderboard.start(socketio.start_background_task)
+    return {sid_a: ratings[key_a], sid_b: ratings[key_b]}
+
+def issue_player_token(room_id: str, sid: str, token: str = None) -> str:
+    token = player_registry.issue(room_id, sid, token)
+    rooms[room_id]['player_tokens'].append(token)
+    return token
+
+@on_event('create_room')
+def create_room(data=None):
+    data = data or {}
+    room_id = new_room([request.sid])
     join_room(room_id)
+    player_token = issue_player_token(room_id, request.sid, data.get('player_token'))
     
     emit('room_created', {
         'room_id': room_id,
+        'player_token': player_token,
         'message': f'Room {room_id} created successfully'
     })
 
-@socketio.on('join_room_request')
+@on_event('join_room_request')
 def join_room_request(data):
     room_id = data['room_id'].upper()
     
@@ -255,9 +890,11 @@ def join_room_request(data):
     join_room(room_id)
     room['players'].append(request.sid)
     room['scores'][request.sid] = 0
+    player_token = issue_player_token(room_id, request.sid, data.get('player_token'))
     
     emit('room_joined', {
         'room_id': room_id,
+        'player_token': player_token,
         'players_count': len(room['players'])
     })
     
@@ -271,7 +908,63 @@ def join_room_request(data):
             'message': 'Both players joined. Ready to start!'
         }, room=room_id)
 
-@socketio.on('rejoin_room')
+@on_event('find_match')
+def find_match(data=None):
+    data = data or {}
+    strength = average_attack_power(data.get('cards'))
+    matchmaking_tokens[request.sid] = data.get('player_token')
+    opponent_id = matchmaking_queue.enqueue(request.sid, strength)
+    
+    if opponent_id is None:
+        emit('match_searching', {
+            'message': '対戦相手を探しています...',
+            'queue_size': len(matchmaking_queue)
+        })
+        schedule_matchmaking_sweep()
+        return
+    
+    start_matched_room(opponent_id, request.sid)
+
+def start_matched_room(first_sid: str, second_sid: str):
+    """
+    マッチした2人のルームを作って参加させ、game_ready を送る
+    """
+    room_id = new_room([first_sid, second_sid])
+    for player_id in (first_sid, second_sid):
+        socketio.server.enter_room(player_id, room_id, namespace='/')
+    
+    for player_id in (first_sid, second_sid):
+        socketio.emit('room_joined', {
+            'room_id': room_id,
+            'player_token': issue_player_token(room_id, player_id, matchmaking_tokens.pop(player_id, None)),
+            'players_count': 2,
+            'matched': True
+        }, room=player_id)
+    
+    socketio.emit('game_ready', {
+        'message': 'Both players joined. Ready to start!'
+    }, room=room_id)
+
+def schedule_matchmaking_sweep():
+    if len(matchmaking_queue) > 1 and not timer_wheel.pending(('matchmaking', 'sweep')):
+        timer_wheel.start(socketio.start_background_task, socketio.sleep)
+        timer_wheel.schedule(('matchmaking', 'sweep'), MATCHMAKING_SWEEP_INTERVAL, sweep_matchmaking)
+
+def sweep_matchmaking():
+    """
+    待ち時間で許容範囲が広がった待機者同士を組み合わせる（まだ2人以上待っていれば再び予約）
+    """
+    for first_sid, second_sid in matchmaking_queue.pair_waiting():
+        start_matched_room(first_sid, second_sid)
+    schedule_matchmaking_sweep()
+
+@on_event('cancel_match')
+def cancel_match(data=None):
+    removed = matchmaking_queue.remove(request.sid)
+    matchmaking_tokens.pop(request.sid, None)
+    emit('match_cancelled', {'removed': removed})
+
+@on_event('rejoin_room')
 def rejoin_room(data):
     room_id = data['room_id'].upper()
     current_socket_id = request.sid
@@ -280,72 +973,56 @@ def rejoin_room(data):
         emit('error', {'message': 'Room not found'})
         return
     
-    room = rooms[room_id]
-    current_players = room.get('players', [])
-    player_cards = room.get('player_cards', {})
-    available_card_owners = list(player_cards.keys())
+    state, old_sid = player_registry.bind(data.get('player_token'), room_id, current_socket_id)
+    if state is None:
+        emit('error', {'message': 'プレイヤー情報が見つかりません。マッチング画面からやり直してください。'})
+        return
     
-    join_room(room_id)
+    if old_sid != current_socket_id:
+        rebind_player(rooms[room_id], old_sid, current_socket_id)
     
-    # スコアの初期化を確実に行う
-    if 'scores' not in room:
-        room['scores'] = {}
+    join_room(room_id)
+    emit('room_rejoined', {'room_id': room_id})
+
+@on_event('spectate_room')
+def spectate_room(data):
+    room_id = data.get('room_id', '').upper()
     
-    if current_socket_id in current_players and current_socket_id in player_cards:
-        # 既に参加済みで、カードも持っている場合
-        if current_socket_id not in room['scores']:
-            room['scores'][current_socket_id] = 0
+    if room_id not in rooms:
+        emit('error', {'message': 'Room not found'})
         return
     
-    if current_socket_id in current_players and current_socket_id not in player_cards:
-        # プレイヤーリストにはいるが、カードがない場合
-        unassigned_cards = [owner for owner in available_card_owners if owner not in current_players]
-        if unassigned_cards:
-            old_card_owner = unassigned_cards[0]
-            player_cards[current_socket_id] = player_cards[old_card_owner]
-            del player_cards[old_card_owner]
-        if current_socket_id not in room['scores']:
-            room['scores'][current_socket_id] = 0
+    room = rooms[room_id]
+    if request.sid in room.get('players', []):
+        emit('error', {'message': 'プレイヤーは観戦できません'})
         return
     
-    if current_socket_id not in current_players and current_socket_id in player_cards:
-        # プレイヤーリストにはいないが、カードはある場合
-        if len(current_players) < 2:
-            current_players.append(current_socket_id)
-        else:
-            current_players[1] = current_socket_id
-        if current_socket_id not in room['scores']:
-            room['scores'][current_socket_id] = 0
-        return
+    previous_room = spectator_hub.remove(request.sid)
+    if previous_room is not None:
+        leave_room(spectator_group(previous_room))
     
-    if current_socket_id not in current_players and current_socket_id not in player_cards:
-        # 新規参加の場合
-        unassigned_cards = [owner for owner in available_card_owners if owner not in current_players]
-        
-        if unassigned_cards:
-            old_card_owner = unassigned_cards[0]
-            player_cards[current_socket_id] = player_cards[old_card_owner]
-            del player_cards[old_card_owner]
-            
-            if len(current_players) < 2:
-                current_players.append(current_socket_id)
-            else:
-                for i, player_id in enumerate(current_players):
-                    if player_id not in player_cards:
-                        current_players[i] = current_socket_id
-                        break
-        
-        # スコアを確実に設定
-        if current_socket_id not in room['scores']:
-            room['scores'][current_socket_id] = 0
-    
-    # 古いスコアデータのクリーンアップ
-    valid_players = set(current_players)
-    for old_id in list(room['scores'].keys()):
-        if old_id not in valid_players and old_id not in player_cards:
-            del room['scores'][old_id]
-
-@socketio.on('cards_ready')
+    join_room(spectator_group(room_id))
+    spectator_hub.add(room_id, request.sid)
+    spectator_hub.start(socketio.start_background_task)
+    
+    emit('spectate_started', {
+        'room_id': room_id,
+        'status': room.get('status'),
+        'current_round': room.get('current_round'),
+        'players': room.get('players', []),
+        'scores': room.get('scores', {}),
+        'battle_history': room.get('battle_history', []),
+        'spectators': spectator_hub.count(room_id)
+    })
+
+@on_event('stop_spectating')
+def stop_spectating(data=None):
+    room_id = spectator_hub.remove(request.sid)
+    if room_id is not None:
+        leave_room(spectator_group(room_id))
+
+@on_event('cards_ready')
+@batched_emits
 def cards_ready(data):
     room_id = data['room_id'].upper()
     cards = data['cards']
@@ -354,6 +1031,9 @@ def cards_ready(data):
         emit('error', {'message': 'Room not found'})
         return
     
+    if reject_spectator(room_id):
+        return
+    
     room = rooms[room_id]
     user_id = request.sid
     
@@ -371,15 +1051,18 @@ def cards_ready(data):
     if user_id not in room['scores']:
         room['scores'][user_id] = 0
     
-    socketio.emit('opponent_cards_ready', {}, room=room_id, include_self=False)
+    emit_batcher.emit('opponent_cards_ready', {}, room_id, room['players'], skip_sid=request.sid)
     
     if len(room['player_cards']) == 2:
         room['status'] = 'battle_ready'
-        socketio.emit('both_players_ready', {
-            'message': 'Both players are ready for battle!'
-        }, room=room_id)
+        emit_to_room('both_players_ready', {
+            'message': 'Both players are ready for battle!',
+            'selection_timeout': SELECTION_TIMEOUT
+        }, room_id)
+        start_selection_timer(room_id, room['current_round'])
 
-@socketio.on('card_selected')
+@on_event('card_selected')
+@batched_emits
 def handle_card_selection(data):
     room_id = data['room_id'].upper()
     card_id = data['card_id']
@@ -392,26 +1075,11 @@ def handle_card_selection(data):
     room = rooms[room_id]
     
     if current_socket_id not in room.get('player_cards', {}):
-        current_players = room.get('players', [])
-        player_cards = room.get('player_cards', {})
-        available_card_owners = list(player_cards.keys())
-        
-        unassigned_cards = [owner for owner in available_card_owners if owner not in current_players]
-        
-        if unassigned_cards:
-            old_owner = unassigned_cards[0]
-            player_cards[current_socket_id] = player_cards[old_owner]
-            del player_cards[old_owner]
-            
-            if current_socket_id not in current_players:
-                if len(current_players) < 2:
-                    current_players.append(current_socket_id)
-                else:
-                    for i, pid in enumerate(current_players):
-                        if pid not in player_cards:
-                            current_players[i] = current_socket_id
-                            break
-        else:
+        state, old_sid = player_registry.bind(data.get('player_token'), room_id, current_socket_id)
+        if state is not None and old_sid != current_socket_id:
+            rebind_player(room, old_sid, current_socket_id)
+        
+        if current_socket_id not in room.get('player_cards', {}):
             emit('error', {'message': 'カード情報が見つかりません。ページを再読み込みしてください。'})
             return
     
@@ -458,13 +1126,59 @@ def handle_card_selection(data):
         'selected_at': datetime.now().isoformat()
     }
     
-    socketio.emit('opponent_card_selected', {
+    emit_batcher.emit('opponent_card_selected', {
         'message': 'Opponent has selected a card'
-    }, room=room_id, include_self=False)
+    }, room_id, room['players'], skip_sid=current_socket_id)
     
     if len(room['current_selections'][round_key]) == 2:
+        timer_wheel.cancel((room_id, 'selection'))
         process_battle(room_id, current_round)
 
+def start_selection_timer(room_id: str, round_number: int):
+    schedule_room_timer(room_id, 'selection', SELECTION_TIMEOUT, on_selection_timeout, room_id, round_number)
+
+@batched_emits
+def on_selection_timeout(room_id: str, round_number: int):
+    """
+    選択期限切れ：未選択のプレイヤーには未使用カードから自動で選択する
+    """
+    if room_id not in rooms:
+        return
+    
+    room = rooms[room_id]
+    if room.get('status') == 'finished' or room.get('current_round') != round_number:
+        return
+    
+    round_key = f"round_{round_number}"
+    selections = room.setdefault('current_selections', {}).setdefault(round_key, {})
+    if len(selections) >= 2:
+        return
+    
+    for player_id in room.get('players', []):
+        if player_id in selections:
+            continue
+        
+        available_cards = [card for card in room.get('player_cards', {}).get(player_id, [])
+                           if not card.get('used', False)]
+        if not available_cards:
+            continue
+        
+        auto_card = random.choice(available_cards)
+        selections[player_id] = {
+            'card': auto_card,
+            'player_id': player_id,
+            'selected_at': datetime.now().isoformat(),
+            'auto_selected': True
+        }
+        emit_to_player('card_auto_selected', {
+            'card_id': auto_card['id'],
+            'round': round_number,
+            'message': '時間切れのため自動でカードが選択されました'
+        }, player_id)
+    
+    if len(selections) == 2:
+        process_battle(room_id, round_number)
+
 def calculate_battle_power(attacker_card, defender_card):
     base_power = attacker_card['attack_power']
     attacker_attr = attacker_card['attribute']
@@ -495,6 +1209,7 @@ def calculate_battle_power(attacker_card, defender_card):
         'is_effective': is_effective
     }
 
+@batched_emits
 def process_battle(room_id, round_number):
     room = rooms[room_id]
     round_key = f"round_{round_number}"
@@ -597,19 +1312,20 @@ def process_battle(room_id, round_number):
         }
     }
     
-    if 'battle_history' not in room:
-        room['battle_history'] = []
-    room['battle_history'].append(battle_result)
+    # 全内容はログに残し、ルームには直近の要約だけを持つ
+    battle_log.append(room_id, room['match_id'], ROUND, battle_result)
+    battle_log.start(socketio.start_background_task)
+    room['battle_history'] = (room.get('battle_history', []) + [battle_summary(battle_result)])[-HISTORY_TAIL:]
     
     print(f"DEBUG: Sending battle result with scores: {battle_result['scores']}")
-    socketio.emit('battle_result', battle_result, room=room_id)
+    emit_to_room('battle_result', battle_result, room_id)
     
     for player_id, cards in room['player_cards'].items():
-        socketio.emit('sync_card_status', {
+        emit_to_player('sync_card_status', {
             'cards': cards,
             'message': 'Card status synchronized',
             'round': round_number
-        }, room=player_id)
+        }, player_id)
     
     max_score = max(room['scores'].values()) if room['scores'] else 0
     total_rounds_played = round_number
@@ -629,29 +1345,53 @@ def process_battle(room_id, round_number):
             'total_rounds': total_rounds_played,
             'battle_history': room['battle_history'],
             'game_end_reason': '2勝先取' if max_score >= 2 else '3ラウンド終了',
-            'room_id': room_id
+            'room_id': room_id,
+            'ratings': record_rated_game(room, final_winner)
         }
         
+        battle_log.append(room_id, room['match_id'], FINISHED, {
+            key: game_end_data[key] for key in ('winner', 'final_scores', 'total_rounds', 'game_end_reason')})
+        
         print(f"DEBUG: Game ended with final scores: {game_end_data['final_scores']}")
-        socketio.emit('game_finished', game_end_data, room=room_id)
+        emit_to_room('game_finished', game_end_data, room_id)
         room['status'] = 'finished'
         
         auto_reset_cards_after_game(room_id)
+        schedule_room_timer(room_id, 'rematch', REMATCH_WINDOW, close_rematch_window, room_id)
         
     else:
         room['current_round'] += 1
-        
-        def start_next_round():
-            socketio.emit('next_round', {
-                'round': room['current_round'],
-                'message': f'Round {room["current_round"]} 開始！',
-                'room_id': room_id
-            }, room=room_id)
-        
-        socketio.start_background_task(lambda: (
-            socketio.sleep(3),
-            start_next_round()
-        ))
+        schedule_room_timer(room_id, 'next_round', NEXT_ROUND_DELAY, start_next_round, room_id)
+
+def start_next_round(room_id: str):
+    if room_id not in rooms:
+        return
+    
+    room = rooms[room_id]
+    emit_to_room('next_round', {
+        'round': room['current_round'],
+        'message': f'Round {room["current_round"]} 開始！',
+        'room_id': room_id,
+        'selection_timeout': SELECTION_TIMEOUT
+    }, room_id)
+    start_selection_timer(room_id, room['current_round'])
+
+def close_rematch_window(room_id: str):
+    """
+    再戦受付期間の終了：再戦が始まっていなければルームを閉じる
+    """
+    if room_id not in rooms or rooms[room_id].get('status') != 'finished':
+        return
+    
+    emit_to_room('room_closed', {
+        'message': '再戦の受付期間が終了しました',
+        'room_id': room_id
+    }, room_id)
+    spectator_hub.close(room_id)
+    cancel_room_timers(room_id)
+    for player_token in rooms[room_id].get('player_tokens', []):
+        player_registry.discard(player_token, room_id)
+    del rooms[room_id]
 
 def auto_reset_cards_after_game(room_id):
     if room_id not in rooms:
@@ -664,7 +1404,7 @@ def auto_reset_cards_after_game(room_id):
             if card.get('used', False):
                 card['used'] = False
 
-@socketio.on('request_rematch')
+@on_event('request_rematch')
 def handle_rematch(data):
     room_id = data['room_id'].upper()
     
@@ -672,7 +1412,11 @@ def handle_rematch(data):
         emit('error', {'message': 'Room not found'})
         return
     
+    if reject_spectator(room_id):
+        return
+    
     room = rooms[room_id]
+    timer_wheel.cancel((room_id, 'rematch'))
     
     # 現在のプレイヤーリストを取得
     players = room.get('players', [])
@@ -690,7 +1434,8 @@ def handle_rematch(data):
         'current_round': 1,
         'scores': reset_scores,  # 確実にリセット
         'current_selections': {},
-        'battle_history': []
+        'battle_history': [],
+        'match_id': uuid.uuid4().hex
     })
     
     # カードの使用状態もリセット
@@ -700,17 +1445,19 @@ def handle_rematch(data):
     
     print(f"DEBUG: Rematch started with reset scores: {room['scores']}")
     
-    socketio.emit('rematch_started', {
+    emit_to_room('rematch_started', {
         'message': 'Rematch started! Round 1 begins.',
         'room_status': {
             'current_round': 1,
             'scores': room['scores'],
             'players': room['players']
         },
-        'reset_cards': True
-    }, room=room_id)
+        'reset_cards': True,
+        'selection_timeout': SELECTION_TIMEOUT
+    }, room_id)
+    start_selection_timer(room_id, 1)
 
-@socketio.on('reset_all_cards')
+@on_event('reset_all_cards')
 def handle_reset_all_cards(data):
     room_id = data['room_id'].upper()
     
@@ -718,6 +1465,9 @@ def handle_reset_all_cards(data):
         emit('error', {'message': 'Room not found'})
         return
     
+    if reject_spectator(room_id):
+        return
+    
     room = rooms[room_id]
     reset_count = 0
     
@@ -734,7 +1484,7 @@ def handle_reset_all_cards(data):
             'reset_by': 'force_reset'
         }, room=player_id)
 
-@socketio.on('request_card_sync')
+@on_event('request_card_sync')
 def handle_card_sync_request(data):
     room_id = data['room_id'].upper()
     player_id = request.sid
@@ -755,7 +1505,7 @@ def handle_card_sync_request(data):
     else:
         emit('error', {'message': 'No cards found for player'})
 
-@socketio.on('force_card_update')
+@on_event('force_card_update')
 def handle_force_card_update(data):
     room_id = data['room_id'].upper()
     card_id = data['card_id']
@@ -785,7 +1535,7 @@ def handle_force_card_update(data):
     else:
         emit('error', {'message': 'No cards found for player'})
 
-@socketio.on('get_room_status')
+@on_event('get_room_status')
 def get_room_status(data):
     room_id = data.get('room_id', '').upper()
     
@@ -891,4 +1641,7 @@ if __name__ == '__main__':
     print("")
     print("💡 友達のデバイスが同じWi-Fiに接続されていることを確認してください！")
     
+    # 接続の受け付けはすぐに始め、カード生成のウォームアップは裏で行う（完了まで /api/ready は 503）
+    start_warm_up()
+    
     socketio.run(app, debug=False, host='0.0.0.0', port=port)
\ No newline at end of file
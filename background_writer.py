@@ -0,0 +1,108 @@
+import queue
+import threading
+import time
+from typing import Any, Callable, List, Optional, Tuple, Type
+
+# 書き込みに失敗したときの再試行の間隔（失敗が続くと倍にしていく）
+RETRY_DELAY = 0.5
+MAX_RETRY_DELAY = 30.0
+
+
+class BackgroundWriter:
+    """
+    積んだ項目を1本のバックグラウンドタスクがまとめて書き込むキュー（バトルログ・ランキングの保存で共用）
+
+    write_batch(items, retrying) は最大 max_batch 件をまとめて書き込む。errors のいずれかを
+    投げたら項目は捨てずに持っておき、間隔を空けて次の書き込みで先頭から書き直す
+    （retrying=True で呼ぶ）。task_done は書き込みが確定してから呼ぶので、flush() はそれまで待つ。
+    """
+
+    def __init__(self, write_batch: Callable[[List[Any], bool], None], errors: Tuple[Type[Exception], ...],
+                 description: str, max_batch: int):
+        self.write_batch = write_batch
+        self.errors = errors
+        self.description = description
+        self.max_batch = max_batch
+        self._queue: "queue.Queue" = queue.Queue()
+        self._lock = threading.Lock()
+        self._running = False
+        # 書き込みに失敗して書き直しを待っている項目
+        self._retry: List[Any] = []
+        self.write_failures = 0
+
+    def put(self, item: Any) -> None:
+        self._queue.put(item)
+
+    def pending(self) -> int:
+        return self._queue.qsize() + len(self._retry)
+
+    def write_pending(self, block: bool = False, timeout: Optional[float] = None) -> int:
+        """
+        キューに溜まっている項目（前回失敗した項目が先）をまとめて書き込み、書いた件数を返す
+
+        失敗したら項目を持ったまま write_batch の例外をそのまま投げる
+        """
+        items, self._retry = self._retry, []
+        retrying = bool(items)
+        if not items:
+            try:
+                items.append(self._queue.get(block, timeout))
+            except queue.Empty:
+                return 0
+        while len(items) < self.max_batch:
+            try:
+                items.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+
+        try:
+            self.write_batch(items, retrying)
+        except self.errors:
+            self.write_failures += 1
+            self._retry = items
+            raise
+
+        for _ in items:
+            self._queue.task_done()
+        return len(items)
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """
+        積んである項目が全て書き込まれるまで待つ（書き込みタスクが動いていなければ自分で書く）
+
+        timeout 秒たっても書き終わらなければ False（書き込みに失敗し続けているときなど）
+        """
+        if not self._running:
+            while self.write_pending():
+                pass
+            return True
+        with self._queue.all_tasks_done:
+            return self._queue.all_tasks_done.wait_for(lambda: not self._queue.unfinished_tasks, timeout)
+
+    def run(self) -> None:
+        """
+        書き込みループ本体（バックグラウンドタスクとして1本だけ起動する）
+        """
+        delay = RETRY_DELAY
+        while self._running:
+            try:
+                self.write_pending(block=True, timeout=1.0)
+                delay = RETRY_DELAY
+            except self.errors as e:
+                print(f"⚠️ {self.description}に失敗しました（{delay:.1f}秒後に再試行, 未書き込み {self.pending()}件）: {e}")
+                time.sleep(delay)
+                delay = min(delay * 2, MAX_RETRY_DELAY)
+
+    def start(self, start_task: Callable) -> bool:
+        """
+        書き込みループが未起動なら start_task(self.run) で起動する
+        """
+        with self._lock:
+            if self._running:
+                return False
+            self._running = True
+        start_task(self.run)
+        return True
+
+    def stop(self) -> None:
+        self._running = False
@@ -0,0 +1,224 @@
+import json
+import os
+import threading
+import time
+from array import array
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+from background_writer import BackgroundWriter
+
+# 1回の書き込み（fsync）でまとめる最大件数
+MAX_BATCH = 256
+
+# ルームが保持する直近ラウンドの件数（全件はログファイル側にある）
+HISTORY_TAIL = 3
+
+# ログの種類
+ROUND = 'round'
+FINISHED = 'finished'
+
+
+# 各行は必ず {"room_id": ... から始まるので、索引を作るときは先頭の room_id だけを読む
+_ROOM_PREFIX = b'{"room_id": '
+_DECODER = json.JSONDecoder()
+
+
+def battle_summary(battle_result: Dict) -> Dict:
+    """
+    ルームのメモリに残す1ラウンド分の要約（観戦画面の表示に必要な項目だけ）
+    """
+    players = {}
+    for player_id, entry in battle_result['players'].items():
+        card = entry['card']
+        players[player_id] = {
+            'card': {key: card.get(key) for key in
+                     ('id', 'name', 'attribute', 'attack_power', 'card_image_url')},
+            'battle_power': {'effective_power': entry['battle_power']['effective_power']},
+        }
+    return {
+        'round': battle_result['round'],
+        'players': players,
+        'winner': battle_result['winner'],
+        'is_draw': battle_result['is_draw'],
+        'scores': dict(battle_result['scores']),
+        'battle_timestamp': battle_result['battle_timestamp'],
+    }
+
+
+class BattleLog:
+    """
+    決着したラウンドと試合結果を追記専用の JSON Lines ファイルに残す
+
+    append() は呼び出し時点の内容を1行の JSON にしてキューに積むだけなので、
+    Socket.IO のハンドラーはディスクI/Oを待たない。書き込みは BackgroundWriter の1本の
+    バックグラウンドタスクが行い、キューに溜まっている行をまとめて書いてから fsync を1回だけ呼ぶ
+    （グループコミット）。書き込みに失敗した行は捨てずに持っておき、間隔を空けて書き直す。
+
+    ルームごとに各行の先頭のバイト位置を索引として持ち（起動時にファイルから作り、書き込むたびに
+    追加する）、リプレイはその位置の行だけを読む。ログが大きくなってもリプレイは試合の行数分で済む。
+    """
+
+    def __init__(self, path: str, max_batch: int = MAX_BATCH):
+        self.path = path
+        # キューには (room_id, 行) を積む
+        self._writer = BackgroundWriter(self._write_batch, (OSError,), 'バトルログの書き込み', max_batch)
+        self._offsets: Dict[str, array] = {}
+        self._index_lock = threading.Lock()
+        self.records_written = 0
+        self.fsyncs = 0
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._terminate_torn_line()
+        self._build_index()
+
+    def _terminate_torn_line(self) -> None:
+        # 前回の書き込みが行の途中で止まっていたら改行を足し、次の行とつながらないようにする
+        if not os.path.exists(self.path) or os.path.getsize(self.path) == 0:
+            return
+        with open(self.path, 'rb+') as f:
+            f.seek(-1, os.SEEK_END)
+            if f.read(1) != b'\n':
+                f.write(b'\n')
+
+    def _build_index(self) -> None:
+        """
+        ログファイルを1回だけ読み、ルームごとの行の先頭位置の索引を作る
+        """
+        if not os.path.exists(self.path):
+            return
+        offset = 0
+        with open(self.path, 'rb') as f:
+            for line in f:
+                if line.startswith(_ROOM_PREFIX):
+                    try:
+                        room_id, _ = _DECODER.raw_decode(line[len(_ROOM_PREFIX):].decode('utf-8', 'replace'))
+                    except ValueError:
+                        room_id = None
+                    if isinstance(room_id, str):
+                        self._index(room_id, offset)
+                offset += len(line)
+
+    def _index(self, room_id: str, offset: int) -> None:
+        offsets = self._offsets.get(room_id)
+        if offsets is None:
+            offsets = self._offsets[room_id] = array('q')
+        offsets.append(offset)
+
+    def append(self, room_id: str, match_id: str, kind: str, data: Dict) -> None:
+        """
+        1件のログを積む（room_id・match_id・種類・記録時刻・内容）
+        """
+        record = {'room_id': room_id, 'match_id': match_id, 'kind': kind,
+                  'logged_at': time.time(), 'data': data}
+        self._writer.put((room_id, (json.dumps(record, ensure_ascii=False) + '\n').encode('utf-8')))
+
+    @property
+    def write_failures(self) -> int:
+        return self._writer.write_failures
+
+    def pending(self) -> int:
+        return self._writer.pending()
+
+    def write_pending(self, block: bool = False, timeout: Optional[float] = None) -> int:
+        """
+        キューに溜まっている行（前回失敗した行が先）を書き込んで fsync し、書いた件数を返す
+        """
+        return self._writer.write_pending(block, timeout)
+
+    def _write_batch(self, entries: List[Tuple[str, bytes]], retrying: bool) -> None:
+        """
+        行をまとめて追記して fsync し、索引に加える（失敗したら書きかけの部分を切り詰めて OSError を投げる）
+        """
+        start = None
+        try:
+            if retrying:
+                # 切り詰めにも失敗して書きかけの行が残っていたら、書き直す行がそこにつながらないようにする
+                self._terminate_torn_line()
+            with open(self.path, 'ab') as f:
+                start = f.seek(0, os.SEEK_END)
+                f.writelines(line for _, line in entries)
+                f.flush()
+                os.fsync(f.fileno())
+        except OSError:
+            if start is not None:
+                self._truncate(start)
+            raise
+
+        with self._index_lock:
+            offset = start
+            for room_id, line in entries:
+                self._index(room_id, offset)
+                offset += len(line)
+        self.records_written += len(entries)
+        self.fsyncs += 1
+
+    def _truncate(self, size: int) -> None:
+        # 途中まで書けた行が残ると、書き直したときに行が重複・分断するので元の長さに戻す
+        try:
+            with open(self.path, 'rb+') as f:
+                f.truncate(size)
+        except OSError as e:
+            print(f"⚠️ バトルログの書きかけの行を切り詰められませんでした: {e}")
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """
+        積んである行が全て書き込まれるまで待つ（timeout 秒たっても書き終わらなければ False）
+        """
+        return self._writer.flush(timeout)
+
+    def start(self, start_task: Callable) -> bool:
+        """
+        書き込みタスクが未起動なら start_task で起動する
+        """
+        return self._writer.start(start_task)
+
+    def stop(self) -> None:
+        self._writer.stop()
+
+    def _room_records(self, room_id: str, reverse: bool = False) -> Iterator[Dict]:
+        """
+        索引にあるルームの行だけを読んで返す（書き込み途中で止まった行は読み飛ばす）
+        """
+        with self._index_lock:
+            offsets = self._offsets.get(room_id)
+            count = len(offsets) if offsets is not None else 0
+        if count == 0:
+            return
+        positions = range(count - 1, -1, -1) if reverse else range(count)
+        with open(self.path, 'rb') as f:
+            for i in positions:
+                f.seek(offsets[i])
+                try:
+                    yield json.loads(f.readline())
+                except ValueError:
+                    continue
+
+    def matches(self, room_id: str) -> List[Dict]:
+        """
+        ルームで行われた試合の一覧（古い順、finished は試合が最後まで終わったかどうか）
+        """
+        matches: Dict[str, Dict] = {}
+        for record in self._room_records(room_id):
+            match = matches.setdefault(record['match_id'], {
+                'match_id': record['match_id'], 'rounds': 0, 'finished': False,
+                'started_at': record['logged_at']})
+            if record['kind'] == ROUND:
+                match['rounds'] += 1
+            elif record['kind'] == FINISHED:
+                match['finished'] = True
+        return list(matches.values())
+
+    def replay(self, room_id: str, match_id: Optional[str] = None) -> Iterator[Dict]:
+        """
+        1試合分のログを記録順に返す（match_id 省略時は最後に終了した試合）
+        """
+        if match_id is None:
+            # 後ろから読んで最初に見つかった試合結果の試合
+            match_id = next((record['match_id'] for record in self._room_records(room_id, reverse=True)
+                             if record['kind'] == FINISHED), None)
+            if match_id is None:
+                return
+        for record in self._room_records(room_id):
+            if record['match_id'] == match_id:
+                yield record
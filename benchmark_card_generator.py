@@ -0,0 +1,223 @@
+#!/usr/bin/env python3
+"""
+カード生成パイプラインのベンチマーク
+
+合成画像（VGA / 12MP / 48MP）で analyze_image_features・描画・generate_cards_batch・
+/api/cards/generate（Flaskテストクライアント経由）を計測し、結果をJSONに保存する。
+--baseline を指定すると保存済みの結果と中央値を比較し、閾値を超えて遅くなった項目があれば
+終了コード1を返す。
+
+    python benchmark_card_generator.py --output bench.json
+    python benchmark_card_generator.py --baseline bench.json --threshold 0.2
+"""
+
+import argparse
+import glob
+import json
+import os
+import platform
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime
+from typing import Dict, List
+
+from card_generator import CardGenerator
+from stage_profiler import TimingHook
+from test_card_generator import create_test_images
+
+RESOLUTIONS = {
+    'vga': (640, 480),
+    '12mp': (4000, 3000),
+    '48mp': (8000, 6000),
+}
+CORPUS_IMAGES = ["fire_image.jpg", "water_image.jpg", "earth_image.jpg"]
+
+
+def summarize(samples: List[float]) -> Dict:
+    """
+    計測値の要約統計（秒）
+    """
+    ordered = sorted(samples)
+    p95_index = min(len(ordered) - 1, int(round(0.95 * (len(ordered) - 1))))
+    return {
+        'runs': len(ordered),
+        'min': ordered[0],
+        'median': statistics.median(ordered),
+        'mean': statistics.fmean(ordered),
+        'p95': ordered[p95_index],
+        'max': ordered[-1],
+    }
+
+
+def build_corpus(corpus_dir: str, label: str) -> List[str]:
+    """
+    解像度ごとの合成画像を作成（既にあれば再利用）
+    """
+    target_dir = os.path.join(corpus_dir, label)
+    paths = [os.path.join(target_dir, name) for name in CORPUS_IMAGES]
+    if not all(os.path.exists(path) for path in paths):
+        create_test_images(target_dir, RESOLUTIONS[label])
+    return paths
+
+
+def bench_generator(image_paths: List[str], runs: int) -> Dict:
+    """
+    CardGenerator 単体の計測（特徴量抽出・段階別・バッチ全体）
+    """
+    stage_samples: Dict[str, List[float]] = {}
+    generator = CardGenerator(profiler=TimingHook(
+        lambda stage, seconds: stage_samples.setdefault(stage, []).append(seconds)))
+
+    analyze_samples = []
+    for _ in range(runs):
+        for image_path in image_paths:
+            started = time.perf_counter()
+            generator.analyze_image_features(image_path)
+            analyze_samples.append(time.perf_counter() - started)
+
+    stage_samples.clear()
+    batch_samples = []
+    output_dir = tempfile.mkdtemp(prefix='bench_cards_')
+    try:
+        for _ in range(runs):
+            started = time.perf_counter()
+            cards = generator.generate_cards_batch(image_paths, output_dir)
+            batch_samples.append(time.perf_counter() - started)
+            if len(cards) != len(image_paths):
+                raise RuntimeError(f"カード生成に失敗しました: {len(cards)}/{len(image_paths)}")
+    finally:
+        shutil.rmtree(output_dir, ignore_errors=True)
+
+    results = {
+        'analyze_image_features': summarize(analyze_samples),
+        'generate_cards_batch': summarize(batch_samples),
+    }
+    for stage in ('render', 'thumbnail', 'text', 'save'):
+        if stage in stage_samples:
+            results[f'stage_{stage}'] = summarize(stage_samples[stage])
+    return results
+
+
+def prepare_api_workdir() -> str:
+    """
+    /api/cards/generate を計測するための一時ディレクトリ（画面のHTMLだけをコピーしておく）
+
+    app は uploads/・generated_cards/・analytics/ などをカレントディレクトリに作るので、
+    このディレクトリで import・計測して、本番の特徴量ストアや知覚ハッシュの索引に計測用のカードを混ぜない
+    """
+    workdir = tempfile.mkdtemp(prefix='bench_api_')
+    for page in glob.glob(os.path.join(os.path.dirname(os.path.abspath(__file__)), '*.html')):
+        shutil.copy(page, workdir)
+    return workdir
+
+
+def bench_api(image_paths: List[str], runs: int, workdir: str) -> Dict:
+    """
+    /api/cards/generate をFlaskのテストクライアントで計測（アップロード保存から応答まで）
+
+    計測中は workdir（prepare_api_workdir() で作ったもの）をカレントディレクトリにする
+    """
+    image_paths = [os.path.abspath(path) for path in image_paths]
+    previous_dir = os.getcwd()
+    os.chdir(workdir)
+    try:
+        import app as game_app
+
+        client = game_app.app.test_client()
+        samples = []
+        for _ in range(runs):
+            files = [(open(path, 'rb'), os.path.basename(path)) for path in image_paths]
+            try:
+                started = time.perf_counter()
+                response = client.post('/api/cards/generate', data={'images': files},
+                                       content_type='multipart/form-data')
+                samples.append(time.perf_counter() - started)
+            finally:
+                for handle, _ in files:
+                    handle.close()
+
+            if response.status_code != 200:
+                raise RuntimeError(f"APIエラー: {response.status_code} {response.get_json()}")
+            client.delete(f"/cleanup-session/{response.get_json()['session_id']}")
+    finally:
+        os.chdir(previous_dir)
+
+    return {'api_cards_generate': summarize(samples)}
+
+
+def compare(current: Dict, baseline: Dict, threshold: float) -> List[Dict]:
+    """
+    ベースラインと中央値を比較し、threshold（割合）を超えて遅くなった項目を返す
+    """
+    regressions = []
+    for label, metrics in current['results'].items():
+        for name, stats in metrics.items():
+            base = baseline.get('results', {}).get(label, {}).get(name)
+            if not base or base['median'] <= 0:
+                continue
+            ratio = stats['median'] / base['median'] - 1.0
+            print(f"  {label:>5} {name:<24} {base['median'] * 1000:9.2f}ms → "
+                  f"{stats['median'] * 1000:9.2f}ms ({ratio:+.1%})")
+            if ratio > threshold:
+                regressions.append({'resolution': label, 'metric': name,
+                                    'baseline': base['median'], 'current': stats['median'],
+                                    'change': ratio})
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='カード生成パイプラインのベンチマーク')
+    parser.add_argument('--resolutions', nargs='+', choices=sorted(RESOLUTIONS), default=['vga', '12mp', '48mp'])
+    parser.add_argument('--runs', type=int, default=5, help='各項目の計測回数')
+    parser.add_argument('--corpus-dir', default='bench_images', help='合成画像の保存先')
+    parser.add_argument('--output', default='benchmark_results.json', help='結果JSONの出力先')
+    parser.add_argument('--baseline', help='比較対象の結果JSON')
+    parser.add_argument('--threshold', type=float, default=0.2, help='回帰とみなす中央値の悪化率')
+    parser.add_argument('--skip-api', action='store_true', help='/api/cards/generate の計測を省略')
+    args = parser.parse_args()
+
+    report = {
+        'timestamp': datetime.now().isoformat(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'runs': args.runs,
+        'results': {},
+    }
+
+    api_workdir = None if args.skip_api else prepare_api_workdir()
+    try:
+        for label in args.resolutions:
+            print(f"=== {label} {RESOLUTIONS[label][0]}x{RESOLUTIONS[label][1]} ===")
+            image_paths = build_corpus(args.corpus_dir, label)
+            results = bench_generator(image_paths, args.runs)
+            if api_workdir is not None:
+                results.update(bench_api(image_paths, args.runs, api_workdir))
+            report['results'][label] = results
+            for name, stats in results.items():
+                print(f"  {name:<24} median {stats['median'] * 1000:9.2f}ms  p95 {stats['p95'] * 1000:9.2f}ms")
+    finally:
+        if api_workdir is not None:
+            shutil.rmtree(api_workdir, ignore_errors=True)
+
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"📁 結果を保存しました: {args.output}")
+
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+        print(f"\n=== ベースライン比較 ({args.baseline}) ===")
+        regressions = compare(report, baseline, args.threshold)
+        if regressions:
+            print(f"❌ {len(regressions)}件の性能劣化を検出しました")
+            for regression in regressions:
+                print(f"  - {regression['resolution']} {regression['metric']}: {regression['change']:+.1%}")
+            sys.exit(1)
+        print("✅ 性能劣化なし")
+
+
+if __name__ == "__main__":
+    main()
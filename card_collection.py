@@ -0,0 +1,260 @@
+import base64
+import json
+import os
+import secrets
+import shutil
+import sqlite3
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+from feature_store import ATTRIBUTE_CODES, ATTRIBUTES
+from card_generator import CardAttribute
+
+# 並び替えに使える列（カーソルは (列の値, card_id) の組）
+SORT_COLUMNS = ('created_at', 'attack_power')
+
+# 1ページの最大件数
+MAX_PAGE_SIZE = 200
+
+# 保存しないキー（セッションごとのファイルパス）
+_TRANSIENT_KEYS = ('image_path', 'card_path')
+
+
+class CollectionError(Exception):
+    """
+    コレクションへの不正な操作（存在しないカード・不正なカーソルなど）
+    """
+
+    def __init__(self, message: str, status_code: int = 400):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+def _attribute_code(attribute: str) -> int:
+    """
+    '火' などの属性名または 'fire' などの英名を整数コードに変換する
+    """
+    if attribute in ATTRIBUTE_CODES:
+        return ATTRIBUTE_CODES[attribute]
+    try:
+        return ATTRIBUTE_CODES[CardAttribute[attribute.upper()].value]
+    except KeyError:
+        raise CollectionError(f'Unknown attribute: {attribute}')
+
+
+def encode_cursor(values: Tuple) -> str:
+    return base64.urlsafe_b64encode(json.dumps(list(values)).encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor: str) -> Tuple:
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        sort_value, card_id = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+    except (ValueError, TypeError):
+        raise CollectionError('Invalid cursor')
+    if not isinstance(sort_value, (int, float)) or not isinstance(card_id, int):
+        raise CollectionError('Invalid cursor')
+    return sort_value, card_id
+
+
+class CardCollection:
+    """
+    プレイヤーごとのカードコレクション（SQLite + カード画像の保存フォルダ）
+
+    カードのメタデータは generate_card の結果をそのまま保存し、絞り込み・並び替えに使う
+    属性・攻撃力・作成時刻は列として持つ。(player_id[, attribute], 並び替え列) の索引と
+    rowid（card_id）の組で並ぶので、カーソル（前ページ最後の (値, card_id)）から先を
+    索引の範囲検索で読むだけになり、何万枚あっても OFFSET のように前のページを読み飛ばさない。
+    カード画像はセッションのフォルダから保存フォルダへハードリンク（できなければコピー）する。
+    画像の URL には card_id（連番）ではなく推測できない image_key を使う（<img> はトークンを送れないため）。
+    """
+
+    def __init__(self, db_path: str, image_dir: str):
+        self.db_path = db_path
+        self.image_dir = image_dir
+        self._local = threading.local()
+        for directory in (os.path.dirname(db_path), image_dir):
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+
+        connection = self._connection()
+        with connection:
+            connection.executescript('''
+                CREATE TABLE IF NOT EXISTS cards (
+                    card_id INTEGER PRIMARY KEY,
+                    player_id TEXT NOT NULL,
+                    name TEXT NOT NULL,
+                    attribute INTEGER NOT NULL,
+                    attack_power INTEGER NOT NULL,
+                    created_at REAL NOT NULL,
+                    metadata TEXT NOT NULL,
+                    image_key TEXT
+                );
+                CREATE INDEX IF NOT EXISTS cards_by_created
+                    ON cards (player_id, created_at);
+                CREATE INDEX IF NOT EXISTS cards_by_attack
+                    ON cards (player_id, attack_power);
+                CREATE INDEX IF NOT EXISTS cards_by_attribute_created
+                    ON cards (player_id, attribute, created_at);
+                CREATE INDEX IF NOT EXISTS cards_by_attribute_attack
+                    ON cards (player_id, attribute, attack_power);
+            ''')
+            self._add_image_keys(connection)
+
+    def _add_image_keys(self, connection: sqlite3.Connection) -> None:
+        # image_key 列がない古いDBは列を足し、既存のカードにも鍵を付ける
+        columns = {row['name'] for row in connection.execute('PRAGMA table_info(cards)')}
+        if 'image_key' not in columns:
+            connection.execute('ALTER TABLE cards ADD COLUMN image_key TEXT')
+            card_ids = connection.execute('SELECT card_id FROM cards').fetchall()
+            connection.executemany('UPDATE cards SET image_key = ? WHERE card_id = ?',
+                                   [(secrets.token_urlsafe(16), row['card_id']) for row in card_ids])
+        connection.execute('CREATE UNIQUE INDEX IF NOT EXISTS cards_by_image_key ON cards (image_key)')
+
+    def _connection(self) -> sqlite3.Connection:
+        # sqlite3 の接続はスレッドをまたげないので、スレッドごとに1本持つ
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = sqlite3.connect(self.db_path)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.row_factory = sqlite3.Row
+            self._local.connection = connection
+        return connection
+
+    def image_path(self, player_id: str, card_id: int) -> str:
+        return os.path.join(self.image_dir, player_id, f'{card_id}.png')
+
+    def add_cards(self, player_id: str, cards_info: List[Dict], created_at: Optional[float] = None) -> List[int]:
+        """
+        生成したカード（generate_card の結果）をコレクションに追加し、card_id の一覧を返す
+        """
+        created_at = time.time() if created_at is None else created_at
+        player_folder = os.path.join(self.image_dir, player_id)
+        os.makedirs(player_folder, exist_ok=True)
+
+        card_ids = []
+        connection = self._connection()
+        with connection:
+            for card_info in cards_info:
+                metadata = {key: value for key, value in card_info.items() if key not in _TRANSIENT_KEYS}
+                cursor = connection.execute(
+                    'INSERT INTO cards (player_id, name, attribute, attack_power, created_at, metadata, image_key) '
+                    'VALUES (?, ?, ?, ?, ?, ?, ?)',
+                    (player_id, card_info['name'], ATTRIBUTE_CODES[card_info['attribute']],
+                     int(card_info['attack_power']), created_at, json.dumps(metadata, ensure_ascii=False),
+                     secrets.token_urlsafe(16)))
+                card_id = cursor.lastrowid
+                destination = self.image_path(player_id, card_id)
+                try:
+                    os.link(card_info['card_path'], destination)
+                except OSError:
+                    shutil.copyfile(card_info['card_path'], destination)
+                card_ids.append(card_id)
+        return card_ids
+
+    def _row_to_card(self, row: sqlite3.Row) -> Dict:
+        return {
+            'card_id': row['card_id'],
+            'name': row['name'],
+            'attribute': ATTRIBUTES[row['attribute']],
+            'attack_power': row['attack_power'],
+            'created_at': row['created_at'],
+            'image_key': row['image_key'],
+        }
+
+    def image_path_for_key(self, image_key: str) -> Optional[str]:
+        """
+        image_key のカード画像のパス（該当するカードがなければ None）
+        """
+        row = self._connection().execute(
+            'SELECT player_id, card_id FROM cards WHERE image_key = ?', (image_key,)).fetchone()
+        if row is None:
+            return None
+        return self.image_path(row['player_id'], row['card_id'])
+
+    def query(self, player_id: str, attribute: Optional[str] = None,
+              min_attack: Optional[int] = None, max_attack: Optional[int] = None,
+              since: Optional[float] = None, until: Optional[float] = None,
+              sort: str = 'created_at', descending: bool = True,
+              limit: int = 50, cursor: Optional[str] = None) -> Tuple[List[Dict], Optional[str]]:
+        """
+        条件に合うカードを1ページ分返す（次のページがあれば next_cursor も返す）
+        """
+        if sort not in SORT_COLUMNS:
+            raise CollectionError(f'Unknown sort: {sort}')
+        limit = max(1, min(limit, MAX_PAGE_SIZE))
+
+        conditions = ['player_id = ?']
+        params: List = [player_id]
+        if attribute is not None:
+            conditions.append('attribute = ?')
+            params.append(_attribute_code(attribute))
+        if min_attack is not None:
+            conditions.append('attack_power >= ?')
+            params.append(min_attack)
+        if max_attack is not None:
+            conditions.append('attack_power <= ?')
+            params.append(max_attack)
+        if since is not None:
+            conditions.append('created_at >= ?')
+            params.append(since)
+        if until is not None:
+            conditions.append('created_at < ?')
+            params.append(until)
+        if cursor is not None:
+            conditions.append(f'({sort}, card_id) {"<" if descending else ">"} (?, ?)')
+            params.extend(decode_cursor(cursor))
+
+        direction = 'DESC' if descending else 'ASC'
+        rows = self._connection().execute(
+            f'SELECT card_id, name, attribute, attack_power, created_at, image_key FROM cards '
+            f'WHERE {" AND ".join(conditions)} '
+            f'ORDER BY {sort} {direction}, card_id {direction} LIMIT ?',
+            params + [limit + 1]).fetchall()
+
+        cards = [self._row_to_card(row) for row in rows[:limit]]
+        next_cursor = None
+        if len(rows) > limit:
+            last = rows[limit - 1]
+            next_cursor = encode_cursor((last[sort], last['card_id']))
+        return cards, next_cursor
+
+    def count(self, player_id: str) -> int:
+        return self._connection().execute(
+            'SELECT COUNT(*) FROM cards WHERE player_id = ?', (player_id,)).fetchone()[0]
+
+    def get_cards(self, player_id: str, card_ids: List[int]) -> List[Dict]:
+        """
+        指定した順にカードのメタデータ（generate_card の結果と同じ形）を返す
+        """
+        if not card_ids:
+            return []
+        placeholders = ','.join('?' * len(card_ids))
+        rows = self._connection().execute(
+            f'SELECT card_id, metadata FROM cards WHERE player_id = ? AND card_id IN ({placeholders})',
+            [player_id] + list(card_ids)).fetchall()
+        found = {row['card_id']: json.loads(row['metadata']) for row in rows}
+        missing = [card_id for card_id in card_ids if card_id not in found]
+        if missing:
+            raise CollectionError(f'Cards not found: {missing}', 404)
+        return [dict(found[card_id], card_id=card_id) for card_id in card_ids]
+
+    def build_deck(self, player_id: str, card_ids: List[int], cards_folder: str) -> List[Dict]:
+        """
+        保存済みのカード画像から card_1.png, card_2.png, ... を cards_folder に用意する
+        （カードを作り直さない）。戻り値は card_path を付け直したカード情報
+        """
+        if len(set(card_ids)) != len(card_ids):
+            raise CollectionError('Duplicate cards in deck')
+        cards_info = self.get_cards(player_id, card_ids)
+        os.makedirs(cards_folder, exist_ok=True)
+        for i, card_info in enumerate(cards_info):
+            destination = os.path.join(cards_folder, f'card_{i+1}.png')
+            source = self.image_path(player_id, card_info['card_id'])
+            try:
+                os.link(source, destination)
+            except OSError:
+                shutil.copyfile(source, destination)
+            card_info['card_path'] = destination
+        return cards_info
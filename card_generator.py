@@ -1,11 +1,72 @@
-import cv2
+from __future__ import annotations
 import numpy as np
-from PIL import Image, ImageDraw, ImageFont
 import os
 import json
-from typing import List, Tuple, Dict
+import argparse
+import glob
+import hashlib
+import multiprocessing
+import time
+import functools
+import tempfile
+from typing import List, Tuple, Dict, Optional, Callable, ContextManager
 import random
+from contextlib import nullcontext
 from enum import Enum
+from feature_profiles import get_feature_profile
+from lazy_imports import lazy_import
+
+# 読み込みの重いモジュールは最初のカード生成（またはウォームアップ）で import する
+cv2 = lazy_import('cv2')
+Image = lazy_import('PIL.Image')
+ImageDraw = lazy_import('PIL.ImageDraw')
+ImageFont = lazy_import('PIL.ImageFont')
+
+# カードの文字に使うフォントの候補（macOS用・日本語対応、見つからなければデフォルトフォント）
+FONT_PATHS = [
+    "/System/Library/Fonts/ヒラギノ角ゴシック W3.ttc",
+    "/System/Library/Fonts/Hiragino Sans GB.ttc", 
+    "/Library/Fonts/Arial Unicode MS.ttf",
+    "/System/Library/Fonts/Arial.ttf",
+    "Arial.ttf"
+]
+
+# プロファイラー無効時に使い回す何もしないコンテキスト
+_NULL_STAGE = nullcontext()
+
+def _null_stage(stage: str, image_path: str) -> ContextManager:
+    return _NULL_STAGE
+
+@functools.lru_cache(maxsize=1)
+def load_card_fonts() -> Tuple:
+    """
+    カードの文字に使うフォント（大・中・小・極小）。探索と読み込みはプロセスで1回だけ行う
+    """
+    # 利用可能なフォントを順番に試す
+    for font_path in FONT_PATHS:
+        try:
+            if os.path.exists(font_path):
+                return tuple(ImageFont.truetype(font_path, size) for size in (32, 20, 16, 12))
+        except Exception:
+            continue
+    
+    # フォントが見つからない場合はデフォルトフォントを使用
+    font = ImageFont.load_default()
+    return (font, font, font, font)
+
+def difference_hash(img: np.ndarray) -> int:
+    """
+    画像の dHash（64ビットの知覚ハッシュ）
+
+    9x8 に縮小したグレースケール画像で、横に隣り合う画素の明暗を1ビットずつ並べる。
+    再圧縮・縮小・軽い色調補正ではほとんどのビットが変わらないので、
+    ハミング距離が小さいほど同じ写真に近い
+    """
+    small = cv2.resize(img, (9, 8), interpolation=cv2.INTER_AREA)
+    if small.ndim == 3:
+        small = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
+    bits = (small[:, 1:] > small[:, :-1]).flatten()
+    return int.from_bytes(np.packbits(bits).tobytes(), 'big')
 
 class CardAttribute(Enum):
     """
@@ -20,12 +81,23 @@ class CardGenerator:
     写真からカードを生成するクラス
     """
     
-    def __init__(self, card_width: int = 300, card_height: int = 420):
+    def __init__(self, card_width: int = 300, card_height: int = 420,
+                 profiler: Optional[Callable[[str, str], ContextManager]] = None,
+                 feature_profile: str = 'accurate'):
         self.card_width = card_width
         self.card_height = card_height
         self.image_width = 260
         self.image_height = 180
         
+        # 処理段階の計測フック profiler(stage, image_path) -> コンテキストマネージャー
+        # （stage_profiler.py 参照）。未指定時は何もしないコンテキストを返すだけ
+        self.profiler = profiler
+        self._stage = profiler or _null_stage
+        
+        # 特徴量の計算方法（feature_profiles.py に登録された accurate / fast など）
+        self.feature_profile = feature_profile
+        self._extract = get_feature_profile(feature_profile)
+        
         # カードテンプレートの設定
         self.bg_color = (255, 255, 255)  # 白背景
         self.border_color = (0, 0, 0)    # 黒枠
@@ -57,16 +129,39 @@ class CardGenerator:
             }
         }
         
-    def analyze_image_features(self, image_path: str) -> Dict:
+    def analyze_image_features(self, image_path: str, original_size: Optional[Tuple[int, int]] = None) -> Dict:
         """
         画像の特徴を分析して攻撃力と属性を算出
+        
+        original_size（幅, 高さ）はブラウザで縮小してからアップロードされた画像の元のサイズ。
+        指定すると解像度の評価は縮小後ではなく元のサイズで行う
         """
         # 画像を読み込み
-        img = cv2.imread(image_path)
+        with self._stage('decode', image_path):
+            img = cv2.imread(image_path)
         if img is None:
             raise ValueError(f"画像を読み込めませんでした: {image_path}")
         
-        # 画像の特徴量を計算
+        with self._stage('analyze', image_path):
+            features = self.extract_features(img, image_path)
+        if original_size is not None:
+            features['resolution'] = min(original_size[0] * original_size[1] / 1000000.0, 1.0)
+        
+        # 重複検出用の知覚ハッシュ（JSONでも桁落ちしないよう16進文字列で持つ）
+        with self._stage('hash', image_path):
+            features['dhash'] = f'{difference_hash(img):016x}'
+        return features
+    
+    def extract_features(self, img: np.ndarray, image_path: str) -> Dict:
+        """
+        読み込み済みの画像から、選択中のプロファイルで特徴量を計算
+        """
+        return self._extract(self, img, image_path)
+    
+    def _extract_features(self, img: np.ndarray, image_path: str) -> Dict:
+        """
+        読み込み済みの画像から特徴量を計算（accurate プロファイル）
+        """
         features = {}
         
         # BGR to HSV変換
@@ -78,7 +173,8 @@ class CardGenerator:
         
         # 2. エッジの密度（複雑さ）
         gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
-        edges = cv2.Canny(gray, 50, 150)
+        with self._stage('canny', image_path):
+            edges = cv2.Canny(gray, 50, 150)
         edge_density = np.sum(edges > 0) / (edges.shape[0] * edges.shape[1])
         features['complexity'] = min(edge_density * 10, 1.0)
         
@@ -215,7 +311,8 @@ class CardGenerator:
         img = Image.open(image_path)
         
         # アスペクト比を保持してリサイズ
-        img.thumbnail((self.image_width, self.image_height), Image.Resampling.LANCZOS)
+        with self._stage('thumbnail', image_path):
+            img.thumbnail((self.image_width, self.image_height), Image.Resampling.LANCZOS)
         
         # 中央配置用の背景を作成
         background = Image.new('RGB', (self.image_width, self.image_height), (240, 240, 240))
@@ -257,46 +354,7 @@ class CardGenerator:
         """
         draw = ImageDraw.Draw(card)
         
-        try:
-            # macOS用のフォント設定（日本語対応）
-            font_paths = [
-                "/System/Library/Fonts/ヒラギノ角ゴシック W3.ttc",
-                "/System/Library/Fonts/Hiragino Sans GB.ttc", 
-                "/Library/Fonts/Arial Unicode MS.ttf",
-                "/System/Library/Fonts/Arial.ttf",
-                "Arial.ttf"
-            ]
-            
-            font_large = None
-            font_medium = None
-            font_small = None
-            font_tiny = None
-            
-            # 利用可能なフォントを順番に試す
-            for font_path in font_paths:
-                try:
-                    if os.path.exists(font_path):
-                        font_large = ImageFont.truetype(font_path, 32)
-                        font_medium = ImageFont.truetype(font_path, 20)
-                        font_small = ImageFont.truetype(font_path, 16)
-                        font_tiny = ImageFont.truetype(font_path, 12)
-                        break
-                except:
-                    continue
-            
-            # フォントが見つからない場合はデフォルトフォントを使用
-            if font_large is None:
-                font_large = ImageFont.load_default()
-                font_medium = ImageFont.load_default()
-                font_small = ImageFont.load_default()
-                font_tiny = ImageFont.load_default()
-                
-        except Exception as e:
-            # デフォルトフォントを使用
-            font_large = ImageFont.load_default()
-            font_medium = ImageFont.load_default()
-            font_small = ImageFont.load_default()
-            font_tiny = ImageFont.load_default()
+        font_large, font_medium, font_small, font_tiny = load_card_fonts()
         
         # 属性名をヘッダーに表示（英語で代用）
         attribute_text = f"Type: {attribute.name}"
@@ -343,34 +401,44 @@ class CardGenerator:
         else:  # EARTH
             return "EARTH > WATER > FIRE > EARTH"
     
-    def generate_card(self, image_path: str, output_path: str) -> Dict:
+    def generate_card(self, image_path: str, output_path: str,
+                      original_size: Optional[Tuple[int, int]] = None) -> Dict:
         """
         1枚のカードを生成
         """
+        with self._stage('card', image_path):
+            return self._generate_card(image_path, output_path, original_size)
+    
+    def _generate_card(self, image_path: str, output_path: str,
+                       original_size: Optional[Tuple[int, int]] = None) -> Dict:
         # 画像の特徴を分析
-        features = self.analyze_image_features(image_path)
+        features = self.analyze_image_features(image_path, original_size)
         
-        # 属性を決定
-        attribute = self.determine_attribute(features)
-        
-        # 攻撃力を計算
-        attack_power = self.calculate_attack_power(features)
-        
-        # カードテンプレートを作成
-        card = self.create_card_template(attribute)
-        
-        # 画像をリサイズしてカードに配置
-        resized_image = self.resize_image_for_card(image_path)
-        img_x = (self.card_width - self.image_width) // 2
-        img_y = 40
-        card.paste(resized_image, (img_x, img_y))
+        with self._stage('score', image_path):
+            # 属性を決定
+            attribute = self.determine_attribute(features)
+            
+            # 攻撃力を計算
+            attack_power = self.calculate_attack_power(features)
         
-        # テキストを追加
         image_name = os.path.basename(image_path)
-        card = self.add_text_to_card(card, attack_power, attribute, image_name)
+        with self._stage('render', image_path):
+            # カードテンプレートを作成
+            card = self.create_card_template(attribute)
+            
+            # 画像をリサイズしてカードに配置
+            resized_image = self.resize_image_for_card(image_path)
+            img_x = (self.card_width - self.image_width) // 2
+            img_y = 40
+            card.paste(resized_image, (img_x, img_y))
+            
+            # テキストを追加
+            with self._stage('text', image_path):
+                card = self.add_text_to_card(card, attack_power, attribute, image_name)
         
-        # カードを保存
-        card.save(output_path)
+        # カードを保存（PNGエンコード）
+        with self._stage('save', image_path):
+            card.save(output_path)
         
         # 属性相性を文字列キーの辞書に変換（JSON serializable）
         safe_effectiveness = {}
@@ -398,25 +466,46 @@ class CardGenerator:
             }
         }
     
-    def generate_cards_batch(self, image_paths: List[str], output_dir: str) -> List[Dict]:
+    def warm_up(self) -> float:
+        """
+        小さな合成画像を読み込み・特徴量・描画・PNG保存まで1回通し、遅延 import・フォント探索・
+        OpenCV と画像コーデックの初回コストを先に払っておく（所要秒数を返す）
+        
+        初回だけの遅さをメトリクスに混ぜないよう、計測フックのない同じ設定のインスタンスで実行する
+        """
+        started = time.perf_counter()
+        generator = CardGenerator(self.card_width, self.card_height, feature_profile=self.feature_profile)
+        with tempfile.TemporaryDirectory() as directory:
+            image_path = os.path.join(directory, 'warm_up.jpg')
+            gradient = np.zeros((96, 128, 3), dtype=np.uint8)
+            gradient[:, :, 1] = np.linspace(0, 255, 128, dtype=np.uint8)
+            gradient[:, :, 2] = np.linspace(255, 0, 96, dtype=np.uint8)[:, None]
+            cv2.imwrite(image_path, gradient)
+            generator.generate_card(image_path, os.path.join(directory, 'warm_up_card.png'))
+        return time.perf_counter() - started
+    
+    def generate_cards_batch(self, image_paths: List[str], output_dir: str,
+                             original_sizes: Optional[List[Optional[Tuple[int, int]]]] = None) -> List[Dict]:
         """
-        複数のカードを一括生成
+        複数のカードを一括生成（original_sizes は image_paths と同じ順の元画像サイズ）
         """
         if not os.path.exists(output_dir):
             os.makedirs(output_dir)
         
         cards_info = []
         
-        for i, image_path in enumerate(image_paths):
-            try:
-                output_filename = f"card_{i+1}.png"
-                output_path = os.path.join(output_dir, output_filename)
-                
-                card_info = self.generate_card(image_path, output_path)
-                cards_info.append(card_info)
-                
-            except Exception as e:
-                continue
+        with self._stage('batch', output_dir):
+            for i, image_path in enumerate(image_paths):
+                try:
+                    output_filename = f"card_{i+1}.png"
+                    output_path = os.path.join(output_dir, output_filename)
+                    
+                    original_size = original_sizes[i] if original_sizes else None
+                    card_info = self.generate_card(image_path, output_path, original_size)
+                    cards_info.append(card_info)
+                    
+                except Exception as e:
+                    continue
         
         return cards_info
     
@@ -437,33 +526,149 @@ class CardGenerator:
         }
 
 
-# 使用例とテスト用の関数
+# 一括生成CLI（オフラインでのデッキ事前生成用）
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.gif', '.bmp')
+
+_worker_generator = None
+
+def normalize_image_path(image_path: str) -> str:
+    """
+    作業ディレクトリや glob の書き方（./photos と photos/../photos など）によらない絶対パス
+    """
+    return os.path.normcase(os.path.realpath(image_path))
+
+def collect_image_paths(inputs: List[str]) -> List[str]:
+    """
+    ディレクトリ（再帰）・globパターン・ファイルパスから画像パスの一覧を作る（正規化した絶対パス）
+    """
+    paths = []
+    for pattern in inputs:
+        if os.path.isdir(pattern):
+            matches = glob.glob(os.path.join(pattern, '**', '*'), recursive=True)
+        else:
+            matches = glob.glob(pattern, recursive=True)
+        paths.extend(normalize_image_path(path) for path in matches
+                     if os.path.isfile(path) and path.lower().endswith(IMAGE_EXTENSIONS))
+    return sorted(set(paths))
+
+def card_filename_for(image_path: str) -> str:
+    """
+    画像パスから決まるカードのファイル名（再開時も同じ名前になる）
+    """
+    digest = hashlib.sha1(normalize_image_path(image_path).encode('utf-8')).hexdigest()[:16]
+    return f"card_{digest}.png"
+
+def load_checkpoint(results_path: str) -> set:
+    """
+    JSON Lines の結果ファイルから生成済みの画像パスを読み込む（途中で切れた行は無視）
+
+    パスは collect_image_paths と同じく正規化して返す（相対パスで記録された古い結果は
+    いまの作業ディレクトリからの相対パスとみなす）
+    """
+    done = set()
+    if not os.path.exists(results_path):
+        return done
+    with open(results_path, 'r', encoding='utf-8') as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            if 'error' not in record:
+                done.add(normalize_image_path(record['image_path']))
+    return done
+
+def _init_worker(feature_profile: str):
+    global _worker_generator
+    # プロセス単位で並列化するのでOpenCV内部のスレッドは使わない
+    cv2.setNumThreads(1)
+    _worker_generator = CardGenerator(feature_profile=feature_profile)
+
+def _generate_worker(task: Tuple[str, str]) -> Dict:
+    image_path, output_path = task
+    try:
+        return _worker_generator.generate_card(image_path, output_path)
+    except Exception as e:
+        return {'image_path': image_path, 'error': str(e)}
+
+def run_batch(inputs: List[str], output_dir: str, results_path: Optional[str] = None,
+              workers: int = 1, feature_profile: str = 'accurate', resume: bool = False,
+              progress_every: int = 100) -> Dict:
+    """
+    写真のディレクトリ・globからカードを並列生成し、結果を JSON Lines で逐次書き出す
+
+    戻り値は {'total', 'skipped', 'generated', 'failed', 'results_path'}
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    results_path = results_path or os.path.join(output_dir, 'cards_info.jsonl')
+
+    image_paths = collect_image_paths(inputs)
+    done = load_checkpoint(results_path) if resume else set()
+    tasks = [(path, os.path.join(output_dir, card_filename_for(path)))
+             for path in image_paths if path not in done]
+    stats = {'total': len(image_paths), 'skipped': len(image_paths) - len(tasks),
+             'generated': 0, 'failed': 0, 'results_path': results_path}
+    print(f"🃏 {len(image_paths)}枚中 {len(tasks)}枚を生成します（再開でスキップ: {stats['skipped']}枚, "
+          f"プロセス数: {workers}）")
+    if not tasks:
+        return stats
+
+    mode = 'a' if resume else 'w'
+    if mode == 'a' and os.path.exists(results_path) and os.path.getsize(results_path) > 0:
+        # 中断で末尾の行が途中で切れていても次の行が壊れないようにする
+        with open(results_path, 'rb') as f:
+            f.seek(-1, os.SEEK_END)
+            needs_newline = f.read(1) != b'\n'
+    else:
+        needs_newline = False
+
+    started = time.perf_counter()
+    generated = failed = 0
+    with open(results_path, mode, encoding='utf-8') as results, \
+            multiprocessing.Pool(workers, initializer=_init_worker,
+                                 initargs=(feature_profile,)) as pool:
+        if needs_newline:
+            results.write('\n')
+        chunksize = max(1, min(32, len(tasks) // (workers * 8)))
+        for record in pool.imap_unordered(_generate_worker, tasks, chunksize=chunksize):
+            results.write(json.dumps(record, ensure_ascii=False) + '\n')
+            results.flush()
+            if 'error' in record:
+                failed += 1
+            else:
+                generated += 1
+
+            processed = generated + failed
+            if processed % progress_every == 0 or processed == len(tasks):
+                elapsed = time.perf_counter() - started
+                print(f"  {processed}/{len(tasks)}枚 ({processed / elapsed:.1f}枚/秒, 失敗 {failed}枚)")
+
+    elapsed = time.perf_counter() - started
+    print(f"✅ 完了: {generated}枚生成, {failed}枚失敗, {elapsed:.1f}秒 ({(generated + failed) / elapsed:.1f}枚/秒)")
+    print(f"📁 結果: {results_path}")
+    stats.update(generated=generated, failed=failed)
+    return stats
+
 def main():
     """
-    テスト用のメイン関数
+    一括生成のコマンドライン
+
+        python card_generator.py photos/ --output-dir generated_cards --workers 8
+        python card_generator.py "archive/**/*.jpg" --resume
     """
-    generator = CardGenerator()
-    
-    # テスト用の画像パス
-    test_images = [
-        "test_images/fire_image.jpg",
-        "test_images/water_image.jpg", 
-        "test_images/earth_image.jpg"
-    ]
-    
-    # 存在する画像ファイルのみを使用
-    existing_images = [img for img in test_images if os.path.exists(img)]
-    
-    if len(existing_images) == 0:
-        return
-    
-    # カードを生成
-    cards_info = generator.generate_cards_batch(existing_images, "generated_cards")
-    
-    # 結果をJSONファイルに保存
-    with open("generated_cards/cards_info.json", "w", encoding="utf-8") as f:
-        json.dump(cards_info, f, ensure_ascii=False, indent=2)
+    parser = argparse.ArgumentParser(description='写真からカードを一括生成')
+    parser.add_argument('inputs', nargs='*', default=['test_images'], help='画像ディレクトリ・globパターン・ファイル')
+    parser.add_argument('--output-dir', default='generated_cards', help='カード画像の出力先')
+    parser.add_argument('--results', help='結果の JSON Lines（既定: <output-dir>/cards_info.jsonl）')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help='並列プロセス数')
+    parser.add_argument('--feature-profile', default='accurate', help='特徴量プロファイル（accurate / fast / strips）')
+    parser.add_argument('--resume', action='store_true', help='結果ファイルに記録済みの画像を飛ばして再開')
+    parser.add_argument('--progress-every', type=int, default=100, help='進捗を表示する間隔（枚）')
+    args = parser.parse_args()
+
+    run_batch(args.inputs, args.output_dir, args.results, args.workers, args.feature_profile,
+              args.resume, args.progress_every)
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,63 @@
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterable, List, Optional
+
+# まとめて送るときのイベント名（中身は {'events': [{'event': ..., 'data': ...}, ...]}）
+BATCH_EVENT = 'batch'
+
+
+class EmitBatcher:
+    """
+    1回の状態遷移（ラウンド決着など）で送るイベントを受信者ごとに1つのフレームにまとめる
+
+    with batcher.batch(): の中で emit() されたイベントは送らずに受信者ごとに溜め、
+    ブロックを抜けるときに受信者ごとに順番を保ったまま 'batch' イベント1回で送る
+    （1件だけなら元のイベントのまま送る）。ブロックの外ではそのまま送信する。
+    """
+
+    def __init__(self, emit: Callable):
+        self._emit = emit
+        self._local = threading.local()
+        self.frames_sent = 0
+        self.events_coalesced = 0
+
+    @contextmanager
+    def batch(self):
+        if getattr(self._local, 'pending', None) is not None:
+            # 入れ子の場合は一番外側でまとめて送る
+            yield
+            return
+
+        pending: Dict[str, List[Dict]] = OrderedDict()
+        self._local.pending = pending
+        try:
+            yield
+        finally:
+            self._local.pending = None
+            self._flush(pending)
+
+    def emit(self, event: str, data: Dict, room: str, recipients: Optional[Iterable[str]] = None,
+             skip_sid: Optional[str] = None) -> None:
+        """
+        room 宛てのイベントを送る（まとめ中は recipients の各sidに振り分けて溜める）
+
+        recipients を省略すると room 自体を1人の受信者（sid）として扱う。
+        """
+        pending = getattr(self._local, 'pending', None)
+        if pending is None:
+            self._emit(event, data, room=room, skip_sid=skip_sid)
+            return
+
+        for sid in (recipients if recipients is not None else [room]):
+            if sid != skip_sid:
+                pending.setdefault(sid, []).append({'event': event, 'data': data})
+
+    def _flush(self, pending: Dict[str, List[Dict]]) -> None:
+        for sid, events in pending.items():
+            self.frames_sent += 1
+            if len(events) == 1:
+                self._emit(events[0]['event'], events[0]['data'], room=sid)
+            else:
+                self.events_coalesced += len(events) - 1
+                self._emit(BATCH_EVENT, {'events': events}, room=sid)
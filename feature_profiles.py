@@ -0,0 +1,343 @@
+#!/usr/bin/env python3
+"""
+特徴量抽出のプロファイル
+
+CardGenerator(feature_profile=...) で選ぶ特徴量の計算方法を登録する。
+- accurate: 従来どおり全画素でCanny・HSV統計を計算する
+- fast: 等間隔に選んだ小タイルだけのCannyと、間引いた画素の色統計で近似する
+- strips: accurate と同じ全画素の計算を横長の帯ごとに行い、作業用メモリを画像の大きさによらず一定にする
+
+どれだけ結果がずれるかは parity_report で accurate と比較して確認できる：
+
+    python feature_profiles.py test_images/ --profiles fast
+"""
+
+import argparse
+import json
+import random
+import statistics
+import time
+from typing import Callable, Dict, List, Optional
+
+import numpy as np
+
+from lazy_imports import lazy_import
+
+# OpenCV は最初の特徴量計算で import する（card_generator.py と同じ）
+cv2 = lazy_import('cv2')
+
+# プロファイル名 → extractor(generator, img, image_path) -> 特徴量の辞書
+FEATURE_PROFILES: Dict[str, Callable] = {}
+
+# fast プロファイルの設定
+FAST_COLOR_SAMPLES = 65536    # 色統計に使う画素数の目安
+FAST_EDGE_GRID = 4            # エッジ密度を測るタイルの縦横の数
+FAST_EDGE_TILE = 128          # タイルの一辺（元解像度の画素数）
+
+# strips プロファイルの設定
+STRIP_PIXELS = 1 << 20        # 1つの帯の画素数の目安（帯の行数 = STRIP_PIXELS // 幅）
+STRIP_HALO = 2                # Canny の Sobel（3×3）と非極大抑制に必要な帯の上下の行数
+
+
+def register_profile(name: str):
+    """
+    特徴量抽出プロファイルを登録するデコレーター
+    """
+    def decorator(extractor: Callable) -> Callable:
+        FEATURE_PROFILES[name] = extractor
+        return extractor
+    return decorator
+
+
+def get_feature_profile(name: str) -> Callable:
+    if name not in FEATURE_PROFILES:
+        raise ValueError(f"未知の特徴量プロファイル: {name}（{', '.join(sorted(FEATURE_PROFILES))}）")
+    return FEATURE_PROFILES[name]
+
+
+@register_profile('accurate')
+def extract_accurate(generator, img: np.ndarray, image_path: str) -> Dict:
+    return generator._extract_features(img, image_path)
+
+
+@register_profile('fast')
+def extract_fast(generator, img: np.ndarray, image_path: str) -> Dict:
+    features = {}
+    height, width = img.shape[:2]
+
+    # 色統計は一定間隔で間引いた画素から計算（平均化すると色相が混ざるため縮小は使わない）
+    step = max(1, int(np.sqrt(height * width / FAST_COLOR_SAMPLES)))
+    sample = img[::step, ::step]
+    hsv = cv2.cvtColor(sample, cv2.COLOR_BGR2HSV)
+    gray_sample = cv2.cvtColor(sample, cv2.COLOR_BGR2GRAY)
+
+    features['color_diversity'] = min(np.std(hsv[:, :, 0]) / 50.0, 1.0)
+
+    # エッジ密度は元解像度のまま等間隔のタイルだけでCannyを計算して推定
+    # （縮小するとノイズ由来の細かいエッジが消えて accurate と大きくずれるため）
+    with generator._stage('canny', image_path):
+        features['complexity'] = min(_sampled_edge_density(img) * 10, 1.0)
+
+    features['contrast'] = min(np.std(gray_sample) / 100.0, 1.0)
+    features['saturation'] = np.mean(hsv[:, :, 1]) / 255.0
+    features['resolution'] = min(height * width / 1000000.0, 1.0)
+
+    hue_values = hsv[:, :, 0].flatten()
+    features['dominant_hue'] = np.mean(hue_values)
+    features['hue_distribution'] = generator._analyze_hue_distribution(hue_values)
+    features['warmth'] = generator._calculate_warmth(hsv)
+
+    return features
+
+
+@register_profile('strips')
+def extract_strips(generator, img: np.ndarray, image_path: str) -> Dict:
+    """
+    accurate と同じ特徴量を、横長の帯ごとに全画素で計算する（一眼レフ・パノラマなどの大きな画像向け）
+
+    HSV・グレースケール・エッジ画像は1つの帯の分しか作らず、色相・彩度・明度は整数の度数分布を
+    足し合わせるだけなので、作業用メモリは画像の高さによらず一定（帯の行数は幅に合わせて決める）。
+    平均・割合は accurate と同じ値になり、標準偏差は度数分布から求めるため丸め誤差の範囲でだけ異なる。
+    Canny のヒステリシスは帯をまたいで何百行もつながることがあるので、帯ごとに
+    エッジ候補（非極大抑制を通り下限を超えた画素）の連結成分を求めて前の帯の成分とつなぎ、
+    強いエッジを含む成分の画素数を数える（_StripEdges）。結果は全体の Canny と一致する。
+    """
+    features = {}
+    height, width = img.shape[:2]
+    rows = max(1, STRIP_PIXELS // width)
+
+    hue_counts = np.zeros(256, dtype=np.int64)
+    vivid_hue_counts = np.zeros(256, dtype=np.int64)  # 彩度 > 50 の画素の色相
+    saturation_sum = 0
+    for top in range(0, height, rows):
+        hsv = cv2.cvtColor(img[top:top + rows], cv2.COLOR_BGR2HSV)
+        hue, saturation = hsv[:, :, 0], hsv[:, :, 1]
+        hue_counts += np.bincount(hue.ravel(), minlength=256)
+        vivid_hue_counts += np.bincount(hue[saturation > 50], minlength=256)
+        saturation_sum += int(saturation.sum(dtype=np.int64))
+
+    gray_counts = np.zeros(256, dtype=np.int64)
+    edges = _StripEdges(width)
+    with generator._stage('canny', image_path):
+        for top in range(0, height, rows):
+            bottom = min(top + rows, height)
+            halo_top, halo_bottom = max(0, top - STRIP_HALO), min(height, bottom + STRIP_HALO)
+            gray = cv2.cvtColor(img[halo_top:halo_bottom], cv2.COLOR_BGR2GRAY)
+            inner = slice(top - halo_top, bottom - halo_top)
+            gray_counts += np.bincount(gray[inner].ravel(), minlength=256)
+            edges.add(cv2.Canny(gray, 50, 50)[inner], cv2.Canny(gray, 150, 150)[inner])
+        edge_pixels = edges.finish()
+
+    total_pixels = height * width
+    hue_mean, hue_std = _histogram_mean_std(hue_counts, total_pixels)
+    _, gray_std = _histogram_mean_std(gray_counts, total_pixels)
+
+    features['color_diversity'] = min(hue_std / 50.0, 1.0)
+    features['complexity'] = min(np.float64(edge_pixels) / total_pixels * 10, 1.0)
+    features['contrast'] = min(gray_std / 100.0, 1.0)
+    features['saturation'] = np.float64(saturation_sum) / total_pixels / 255.0
+    features['resolution'] = min(total_pixels / 1000000.0, 1.0)
+    features['dominant_hue'] = hue_mean
+
+    # _analyze_hue_distribution・_calculate_warmth と同じ範囲を度数分布から数える
+    red, blue, green = _hue_range_counts(hue_counts)
+    features['hue_distribution'] = {
+        'red_ratio': red / np.int64(total_pixels),
+        'blue_ratio': blue / np.int64(total_pixels),
+        'green_ratio': green / np.int64(total_pixels),
+    }
+    warm, cool, _ = _hue_range_counts(vivid_hue_counts)
+    features['warmth'] = 0.5 if warm + cool == 0 else warm / (warm + cool)
+
+    return features
+
+
+class _StripEdges:
+    """
+    帯ごとの Canny の結果から、画像全体の Canny(50, 150) のエッジ画素数を数える
+
+    全体の Canny の出力は、エッジ候補 Canny(50, 50) の8近傍の連結成分のうち、
+    強いエッジ Canny(150, 150)（非極大抑制を通り上限を超えた画素）を含むものの和集合と同じ。
+    候補・強いエッジは帯の上下に STRIP_HALO 行足して計算すれば全体で計算した場合と一致する。
+    前の帯の最終行にかかっている成分（まだ下に伸びうる成分）だけを画素数・強いエッジの有無と一緒に
+    持ち越し、次の帯の先頭に前の帯の最終行を重ねてラベル付けしてつなぐ。最終行から離れた成分は
+    それ以上伸びないので、その時点で数えて捨てる（持ち越すのは幅に比例する分だけ）。
+    """
+
+    def __init__(self, width: int):
+        self.edge_pixels = 0
+        self._last_row = np.zeros(width, dtype=np.int32)   # 前の帯の最終行の成分番号（0 は候補なし）
+        self._area = np.zeros(1, dtype=np.int64)            # 持ち越している成分の画素数
+        self._strong = np.zeros(1, dtype=bool)              # 持ち越している成分が強いエッジを含むか
+
+    def add(self, candidates: np.ndarray, seeds: np.ndarray) -> None:
+        carried = self._last_row
+        stacked = np.vstack([(carried > 0).astype(np.uint8)[np.newaxis], candidates])
+        count, labels, stats, _ = cv2.connectedComponentsWithStats(stacked, connectivity=8)
+        area = stats[:, cv2.CC_STAT_AREA].astype(np.int64)
+        area -= np.bincount(labels[0], minlength=count)  # 重ねた行は前の帯で数え済み
+        strong = np.bincount(labels[1:][seeds > 0], minlength=count) > 0
+
+        # 前の帯で1つだった成分がこの帯で複数のラベルに分かれていたらまとめる
+        root = np.arange(count)
+        links = np.unique(np.stack([carried, labels[0]], axis=1)[carried > 0], axis=0)
+        first_label = {}
+        for previous, label in links.tolist():
+            other = first_label.setdefault(previous, label)
+            a, b = _find(root, other), _find(root, label)
+            if a != b:
+                root[max(a, b)] = min(a, b)
+        for label in np.unique(links[:, 1]).tolist():
+            root[label] = _find(root, label)
+
+        area = np.bincount(root, weights=area, minlength=count).astype(np.int64)
+        strong = np.bincount(root, weights=strong, minlength=count) > 0
+        if len(links):
+            # 持ち越した成分の画素数・強いエッジの有無を引き継ぐ
+            previous, first = np.unique(links[:, 0], return_index=True)
+            targets = root[links[first, 1]]
+            np.add.at(area, targets, self._area[previous])
+            np.logical_or.at(strong, targets, self._strong[previous])
+
+        last = root[labels[-1]]
+        is_root = root == np.arange(count)
+        is_root[0] = False
+        still_open = np.zeros(count, dtype=bool)
+        still_open[last] = True
+        still_open[0] = False
+        closed = is_root & ~still_open
+        self.edge_pixels += int(area[closed & strong].sum())
+
+        # 最終行にかかっている成分を 1, 2, ... に詰め直して持ち越す
+        renumber = np.zeros(count, dtype=np.int32)
+        renumber[still_open] = np.arange(1, still_open.sum() + 1)
+        self._last_row = renumber[last]
+        self._area = np.concatenate([[0], area[still_open]])
+        self._strong = np.concatenate([[False], strong[still_open]])
+
+    def finish(self) -> int:
+        self.edge_pixels += int(self._area[self._strong].sum())
+        self._area = self._area[:1]
+        self._strong = self._strong[:1]
+        return self.edge_pixels
+
+
+def _find(root: np.ndarray, label: int) -> int:
+    while root[label] != label:
+        root[label] = root[root[label]]
+        label = root[label]
+    return label
+
+
+def _histogram_mean_std(counts: np.ndarray, total: int):
+    values = np.arange(len(counts), dtype=np.float64)
+    mean = np.float64((counts * np.arange(len(counts), dtype=np.int64)).sum()) / total
+    variance = (counts * (values - mean) ** 2).sum() / total
+    return mean, np.sqrt(variance)
+
+
+def _hue_range_counts(counts: np.ndarray):
+    """
+    色相の度数分布から (赤系, 青系, 緑系) の画素数
+    """
+    red = counts[:30].sum() + counts[151:].sum()
+    blue = counts[90:131].sum()
+    green = counts[30:91].sum()
+    return red, blue, green
+
+
+def _sampled_edge_density(img: np.ndarray) -> float:
+    height, width = img.shape[:2]
+    if height <= FAST_EDGE_GRID * FAST_EDGE_TILE or width <= FAST_EDGE_GRID * FAST_EDGE_TILE:
+        edges = cv2.Canny(cv2.cvtColor(img, cv2.COLOR_BGR2GRAY), 50, 150)
+        return np.count_nonzero(edges) / edges.size
+
+    edge_pixels = 0
+    for y in np.linspace(0, height - FAST_EDGE_TILE, FAST_EDGE_GRID).astype(int):
+        for x in np.linspace(0, width - FAST_EDGE_TILE, FAST_EDGE_GRID).astype(int):
+            tile = cv2.cvtColor(img[y:y + FAST_EDGE_TILE, x:x + FAST_EDGE_TILE], cv2.COLOR_BGR2GRAY)
+            edge_pixels += np.count_nonzero(cv2.Canny(tile, 50, 150))
+    return edge_pixels / (FAST_EDGE_GRID * FAST_EDGE_GRID * FAST_EDGE_TILE * FAST_EDGE_TILE)
+
+
+def parity_report(image_paths: List[str], profiles: Optional[List[str]] = None) -> Dict:
+    """
+    各プロファイルの属性一致率・攻撃力誤差・処理時間を accurate と比較する
+    """
+    from card_generator import CardGenerator
+
+    profiles = profiles or [name for name in FEATURE_PROFILES if name != 'accurate']
+    reference = CardGenerator(feature_profile='accurate')
+    candidates = {name: CardGenerator(feature_profile=name) for name in profiles}
+
+    timings = {name: [] for name in ['accurate'] + profiles}
+    agreements = {name: 0 for name in profiles}
+    errors = {name: [] for name in profiles}
+    evaluated = 0
+
+    for image_path in image_paths:
+        img = cv2.imread(image_path)
+        if img is None:
+            continue
+        evaluated += 1
+
+        started = time.perf_counter()
+        expected = reference.extract_features(img, image_path)
+        timings['accurate'].append(time.perf_counter() - started)
+        expected_attribute = reference.determine_attribute(expected)
+        # 攻撃力の乱数ぶれを揃えるため、同じ乱数状態から計算する
+        random_state = random.getstate()
+        expected_attack = reference.calculate_attack_power(expected)
+
+        for name, generator in candidates.items():
+            started = time.perf_counter()
+            features = generator.extract_features(img, image_path)
+            timings[name].append(time.perf_counter() - started)
+            if generator.determine_attribute(features) == expected_attribute:
+                agreements[name] += 1
+            random.setstate(random_state)
+            errors[name].append(abs(generator.calculate_attack_power(features) - expected_attack))
+
+    if evaluated == 0:
+        return {'images': 0, 'profiles': {}}
+
+    reference_seconds = statistics.fmean(timings['accurate'])
+    report = {'images': evaluated, 'profiles': {
+        'accurate': {'mean_seconds': reference_seconds, 'speedup': 1.0,
+                     'attribute_agreement': 1.0, 'attack_power_mae': 0.0, 'attack_power_max_error': 0},
+    }}
+    for name in profiles:
+        mean_seconds = statistics.fmean(timings[name])
+        report['profiles'][name] = {
+            'mean_seconds': mean_seconds,
+            'speedup': reference_seconds / mean_seconds if mean_seconds else None,
+            'attribute_agreement': agreements[name] / evaluated,
+            'attack_power_mae': statistics.fmean(errors[name]),
+            'attack_power_max_error': max(errors[name]),
+        }
+    return report
+
+
+def main():
+    from card_generator import collect_image_paths
+
+    parser = argparse.ArgumentParser(description='特徴量プロファイルの精度・速度レポート')
+    parser.add_argument('inputs', nargs='*', default=['test_images'], help='画像ディレクトリ・globパターン・ファイル')
+    parser.add_argument('--profiles', nargs='+', choices=sorted(FEATURE_PROFILES), help='比較するプロファイル')
+    parser.add_argument('--output', help='結果JSONの出力先')
+    args = parser.parse_args()
+
+    report = parity_report(collect_image_paths(args.inputs), args.profiles)
+    print(f"📊 Feature profile parity ({report['images']} images, reference: accurate)")
+    for name, stats in report['profiles'].items():
+        print(f"  {name:<10} {stats['mean_seconds'] * 1000:8.2f}ms  x{stats['speedup']:.1f}  "
+              f"attribute {stats['attribute_agreement']:.1%}  "
+              f"attack MAE {stats['attack_power_mae']:.2f} (max {stats['attack_power_max_error']})")
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,152 @@
+import os
+import struct
+import threading
+import time
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from card_generator import CardAttribute
+
+# ファイル先頭のヘッダー（マジック・バージョン・レコード長）
+_MAGIC = b'PBFS'
+_VERSION = 1
+HEADER_SIZE = 16
+
+# 属性は整数コードで保存する（CardAttribute の定義順）
+ATTRIBUTE_CODES = {attribute.value: code for code, attribute in enumerate(CardAttribute)}
+ATTRIBUTES = [attribute.value for attribute in CardAttribute]
+
+FEATURE_FIELDS = ['color_diversity', 'complexity', 'contrast', 'saturation', 'resolution',
+                  'dominant_hue', 'warmth', 'red_ratio', 'blue_ratio', 'green_ratio']
+
+RECORD_DTYPE = np.dtype([
+    ('created_at', '<f8'),
+    ('session_id', 'S36'),
+    ('card_index', 'u1'),
+    ('attribute', 'u1'),
+    ('attack_power', '<u2'),
+] + [(field, '<f4') for field in FEATURE_FIELDS])
+
+
+class FeatureStore:
+    """
+    全カードの特徴量・属性・攻撃力を固定長レコードで追記していく列指向ストア
+
+    ファイルはヘッダー + NumPy構造化配列の生バイト列なので、np.memmap で
+    JSONを一切パースせずにそのまま集計できる。
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._mapped = None
+        self._mapped_count = -1
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        if not os.path.exists(path) or os.path.getsize(path) < HEADER_SIZE:
+            with open(path, 'wb') as f:
+                f.write(struct.pack('<4sII4x', _MAGIC, _VERSION, RECORD_DTYPE.itemsize))
+        else:
+            self._check_header()
+
+    def _check_header(self):
+        with open(self.path, 'rb') as f:
+            magic, version, record_size = struct.unpack('<4sII4x', f.read(HEADER_SIZE))
+        if magic != _MAGIC or version != _VERSION or record_size != RECORD_DTYPE.itemsize:
+            raise ValueError(f"特徴量ストアの形式が一致しません: {self.path}")
+
+        size = os.path.getsize(self.path)
+        count = (size - HEADER_SIZE) // RECORD_DTYPE.itemsize
+        if HEADER_SIZE + count * RECORD_DTYPE.itemsize != size:
+            # 書き込み途中で止まったレコードを切り捨て、次の追記の位置をそろえる
+            with open(self.path, 'rb+') as f:
+                f.truncate(HEADER_SIZE + count * RECORD_DTYPE.itemsize)
+
+    def append(self, cards_info: List[Dict], session_id: str, created_at: Optional[float] = None) -> int:
+        """
+        generate_cards_batch の結果をまとめて追記し、追記件数を返す
+        """
+        records = np.zeros(len(cards_info), dtype=RECORD_DTYPE)
+        records['created_at'] = created_at if created_at is not None else time.time()
+        records['session_id'] = session_id.encode('ascii')[:36]
+        for i, card_info in enumerate(cards_info):
+            features = card_info['features']
+            hue_distribution = features.get('hue_distribution', {})
+            records[i]['card_index'] = i
+            records[i]['attribute'] = ATTRIBUTE_CODES[card_info['attribute']]
+            records[i]['attack_power'] = card_info['attack_power']
+            for field in FEATURE_FIELDS:
+                value = features[field] if field in features else hue_distribution.get(field, 0.0)
+                records[i][field] = value
+
+        with self._lock:
+            with open(self.path, 'ab') as f:
+                f.write(records.tobytes())
+        return len(records)
+
+    def records(self) -> np.ndarray:
+        """
+        全レコードを読み取り専用のmemmapとして返す（書き込み途中の末尾は含めない）
+        """
+        count = (os.path.getsize(self.path) - HEADER_SIZE) // RECORD_DTYPE.itemsize
+        if count != self._mapped_count:
+            if count == 0:
+                self._mapped = np.zeros(0, dtype=RECORD_DTYPE)
+            else:
+                self._mapped = np.memmap(self.path, dtype=RECORD_DTYPE, mode='r',
+                                         offset=HEADER_SIZE, shape=(count,))
+            self._mapped_count = count
+        return self._mapped
+
+    def __len__(self) -> int:
+        return len(self.records())
+
+    def query(self, attribute: Optional[str] = None, since: Optional[float] = None,
+              until: Optional[float] = None, min_attack: Optional[int] = None,
+              max_attack: Optional[int] = None) -> np.ndarray:
+        """
+        条件に合うレコードを返す（attribute は '火' などの属性名または 'fire' などの英名）
+        """
+        records = self.records()
+        mask = np.ones(len(records), dtype=bool)
+        if attribute is not None:
+            mask &= records['attribute'] == self._attribute_code(attribute)
+        if since is not None:
+            mask &= records['created_at'] >= since
+        if until is not None:
+            mask &= records['created_at'] < until
+        if min_attack is not None:
+            mask &= records['attack_power'] >= min_attack
+        if max_attack is not None:
+            mask &= records['attack_power'] <= max_attack
+        return records[mask]
+
+    def _attribute_code(self, attribute: str) -> int:
+        if attribute in ATTRIBUTE_CODES:
+            return ATTRIBUTE_CODES[attribute]
+        return ATTRIBUTE_CODES[CardAttribute[attribute.upper()].value]
+
+    def attribute_fractions(self, since: Optional[float] = None, until: Optional[float] = None) -> Dict[str, float]:
+        """
+        属性ごとのカードの割合
+        """
+        records = self.query(since=since, until=until)
+        counts = np.bincount(records['attribute'], minlength=len(ATTRIBUTES))
+        total = counts.sum()
+        return {attribute: (float(counts[code]) / total if total else 0.0)
+                for code, attribute in enumerate(ATTRIBUTES)}
+
+    def attack_power_histogram(self, bin_width: int = 10, since: Optional[float] = None,
+                               until: Optional[float] = None) -> Dict[str, List[int]]:
+        """
+        攻撃力の分布（10-100をbin_width刻みで集計）
+        """
+        if not 1 <= bin_width <= 90:
+            raise ValueError('bin_width must be between 1 and 90')
+        records = self.query(since=since, until=until)
+        edges = np.arange(10, 100 + bin_width, bin_width)
+        counts, _ = np.histogram(records['attack_power'], bins=edges)
+        return {'bin_edges': edges.tolist(), 'counts': counts.tolist()}
@@ -0,0 +1,177 @@
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+import requests
+from requests.adapters import HTTPAdapter
+
+# ワーカーの /internal/generate に送る共有シークレットのヘッダー（PHOTOBATTLE_WORKER_SECRET）
+WORKER_SECRET_HEADER = 'X-Photobattle-Worker-Secret'
+
+
+class GenerationError(Exception):
+    """
+    ワーカーがカード生成を拒否・失敗したときのエラー（status_code はワーカーの応答）
+    """
+
+    def __init__(self, message: str, status_code: int = 500):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+class NoHealthyWorkers(GenerationError):
+    """
+    応答できるワーカーが1つもない
+    """
+
+    def __init__(self):
+        super().__init__('No healthy generation workers', 503)
+
+
+class GenerationWorker:
+    def __init__(self, url: str):
+        self.url = url.rstrip('/')
+        self.healthy = True
+        self.in_flight = 0
+        self.failures = 0
+        self.last_error: Optional[str] = None
+
+    def to_dict(self) -> Dict:
+        return {
+            'url': self.url,
+            'healthy': self.healthy,
+            'in_flight': self.in_flight,
+            'failures': self.failures,
+            'last_error': self.last_error,
+        }
+
+
+class GenerationClient:
+    """
+    カード生成ワーカー（api_interface.py）へ処理を振り分けるクライアント
+
+    - requests.Session の接続プールでワーカーとの接続を使い回す（HTTP keep-alive）
+    - 処理中のリクエストが最も少ない正常なワーカーを選ぶ
+    - 接続できなかったワーカーは異常扱いにして別のワーカーで再試行し、
+      ヘルスチェックで応答が戻れば再び振り分け対象にする
+    - secret を指定すると全リクエストに WORKER_SECRET_HEADER を付ける
+    """
+
+    def __init__(self, worker_urls: List[str], timeout: float = 120.0,
+                 health_interval: float = 5.0, pool_size: int = 16, secret: Optional[str] = None):
+        if not worker_urls:
+            raise ValueError('worker_urls が空です')
+        self.workers = [GenerationWorker(url) for url in worker_urls]
+        self.timeout = timeout
+        self.health_interval = health_interval
+        self._lock = threading.Lock()
+        self._next = 0
+        self._running = False
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=len(self.workers), pool_maxsize=pool_size)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        if secret:
+            self.session.headers[WORKER_SECRET_HEADER] = secret
+
+    def _acquire(self, exclude: set) -> Optional[GenerationWorker]:
+        with self._lock:
+            candidates = [worker for worker in self.workers
+                          if worker.healthy and worker.url not in exclude]
+            if not candidates:
+                return None
+            # 処理中の件数が同じなら正常なワーカーの間でラウンドロビンする
+            offset = self._next % len(candidates)
+            self._next += 1
+            index = min(range(len(candidates)),
+                        key=lambda i: (candidates[i].in_flight, (i - offset) % len(candidates)))
+            worker = candidates[index]
+            worker.in_flight += 1
+            return worker
+
+    def _release(self, worker: GenerationWorker, error: Optional[str] = None):
+        with self._lock:
+            worker.in_flight -= 1
+            if error is not None:
+                worker.healthy = False
+                worker.failures += 1
+                worker.last_error = error
+
+    def generate(self, session_id: str, filenames: List[str],
+                 original_sizes: Optional[List[Optional[Tuple[int, int]]]] = None) -> Tuple[List[Dict], str]:
+        """
+        uploads/<session_id>/ に保存済みの画像からカードを生成させ、(cards_info, ワーカーURL) を返す
+        （original_sizes はブラウザで縮小される前の元画像サイズ）
+
+        接続エラー・タイムアウトのときだけ別のワーカーで再試行する（同じセッションフォルダに
+        書き直すだけなので再実行しても結果は壊れない）。
+        """
+        tried = set()
+        while True:
+            worker = self._acquire(tried)
+            if worker is None:
+                raise NoHealthyWorkers()
+            tried.add(worker.url)
+
+            try:
+                response = self.session.post(f'{worker.url}/internal/generate',
+                                             json={'session_id': session_id, 'filenames': filenames,
+                                                   'original_sizes': original_sizes},
+                                             timeout=self.timeout)
+            except requests.exceptions.RequestException as e:
+                self._release(worker, str(e))
+                continue
+
+            self._release(worker)
+            try:
+                body = response.json()
+            except ValueError:
+                body = {}
+            if response.status_code != 200:
+                raise GenerationError(body.get('error', f'Worker error {response.status_code}'),
+                                      response.status_code)
+            return body['cards_info'], worker.url
+
+    def check_health(self) -> None:
+        """
+        全ワーカーの /api/health を確認して正常・異常を更新する
+        """
+        for worker in self.workers:
+            try:
+                healthy = self.session.get(f'{worker.url}/api/health', timeout=2).ok
+                error = None if healthy else 'health check failed'
+            except requests.exceptions.RequestException as e:
+                healthy, error = False, str(e)
+            with self._lock:
+                if not healthy:
+                    worker.failures += 1
+                    worker.last_error = error
+                worker.healthy = healthy
+
+    def run_health_checks(self, sleep: Optional[Callable[[float], None]] = None) -> None:
+        """
+        ヘルスチェックのループ本体（バックグラウンドタスクとして1本だけ起動する）
+        """
+        sleep = sleep or time.sleep
+        while self._running:
+            self.check_health()
+            sleep(self.health_interval)
+
+    def start(self, start_task: Callable, sleep: Optional[Callable[[float], None]] = None) -> bool:
+        """
+        ヘルスチェックが未起動なら start_task(self.run_health_checks, sleep) で起動する
+        """
+        with self._lock:
+            if self._running:
+                return False
+            self._running = True
+        start_task(self.run_health_checks, sleep)
+        return True
+
+    def stop(self) -> None:
+        self._running = False
+
+    def status(self) -> List[Dict]:
+        with self._lock:
+            return [worker.to_dict() for worker in self.workers]
@@ -0,0 +1,258 @@
+import itertools
+import os
+import struct
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+# 64ビットのハッシュを16ビットずつ4つのブロックに分けて索引する
+HASH_BITS = 64
+BLOCK_BITS = 16
+BLOCK_COUNT = HASH_BITS // BLOCK_BITS
+_BLOCK_MASK = (1 << BLOCK_BITS) - 1
+
+# 同じ写真とみなすハミング距離（dHash の 64 ビット中）
+DUPLICATE_RADIUS = 6
+
+# 整列済みの索引に入っていない追加分がこの件数を超えたら索引を作り直す
+REBUILD_THRESHOLD = 65536
+
+_MAGIC = b'PBIH'
+_VERSION = 1
+HEADER_SIZE = 16
+
+RECORD_DTYPE = np.dtype([
+    ('hash', '<u8'),
+    ('created_at', '<f8'),
+    ('session_id', 'S36'),
+    ('card_index', 'u1'),
+    ('player_id', 'S16'),
+])
+
+# 1バイトごとの立っているビット数
+_POPCOUNT = np.array([bin(i).count('1') for i in range(256)], dtype=np.uint8)
+
+
+def hamming_distances(hashes: np.ndarray, query: int) -> np.ndarray:
+    """
+    uint64 配列の各ハッシュと query のハミング距離
+    """
+    differences = np.ascontiguousarray(hashes ^ np.uint64(query))
+    return _POPCOUNT[differences.view(np.uint8)].reshape(-1, 8).sum(axis=1)
+
+
+def _blocks(value: int) -> List[int]:
+    return [(value >> (BLOCK_BITS * i)) & _BLOCK_MASK for i in range(BLOCK_COUNT)]
+
+
+def _neighbours(value: int, distance: int) -> List[int]:
+    """
+    1ブロック（16ビット）の値から距離 distance 以内の値をすべて列挙する
+    """
+    values = [value]
+    for flips in range(1, distance + 1):
+        for positions in itertools.combinations(range(BLOCK_BITS), flips):
+            flipped = value
+            for position in positions:
+                flipped ^= 1 << position
+            values.append(flipped)
+    return values
+
+
+class PerceptualHashIndex:
+    """
+    アップロードされた写真の知覚ハッシュ（dHash）の多重索引ハッシュテーブル
+
+    ハッシュを4つのブロックに分けると、距離 r 以内のハッシュは少なくとも1つのブロックが
+    距離 r // 4 以内で一致する（鳩の巣原理）。そこでブロックごとに「値 → レコード番号」の
+    索引を持ち、近傍の値の索引だけを引いて集めた候補とのハミング距離を NumPy でまとめて測る。
+    候補は全件のごく一部なので、数百万件あっても1回の検索は1ミリ秒未満で終わる。
+
+    ハッシュは固定長レコードでファイルに追記し、起動時に読み込んで索引を作る。
+    索引はブロックごとの argsort 結果と値ごとの開始位置（np.searchsorted）で、
+    起動後の追加分は辞書に溜め、REBUILD_THRESHOLD 件を超えたら整列済みの索引に取り込む。
+    取り込み（全件の argsort）は start_task で起動したバックグラウンドタスクがロックの外で行い、
+    できた索引を差し替えるときだけロックを取るので、その間も追加・検索は止まらない
+    （start_task を渡さなければ add() の中でそのまま作り直す）。
+    """
+
+    def __init__(self, path: str, rebuild_threshold: int = REBUILD_THRESHOLD,
+                 start_task: Optional[Callable] = None):
+        self.path = path
+        self.rebuild_threshold = rebuild_threshold
+        self.start_task = start_task
+        self.rebuilds = 0
+        self._rebuilding = False
+        self._lock = threading.Lock()
+        self._records = np.zeros(0, dtype=RECORD_DTYPE)
+        self._hashes = np.zeros(0, dtype=np.uint64)
+        self._count = 0
+        self._indexed = 0
+        self._order: List[np.ndarray] = []
+        self._starts: List[List[int]] = []
+        self._recent: List[Dict[int, List[int]]] = [{} for _ in range(BLOCK_COUNT)]
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        if not os.path.exists(path) or os.path.getsize(path) < HEADER_SIZE:
+            with open(path, 'wb') as f:
+                f.write(struct.pack('<4sII4x', _MAGIC, _VERSION, RECORD_DTYPE.itemsize))
+        else:
+            self._load()
+        self._rebuild()
+
+    def _load(self) -> None:
+        with open(self.path, 'rb') as f:
+            magic, version, record_size = struct.unpack('<4sII4x', f.read(HEADER_SIZE))
+        if magic != _MAGIC or version != _VERSION or record_size != RECORD_DTYPE.itemsize:
+            raise ValueError(f"知覚ハッシュの索引ファイルの形式が一致しません: {self.path}")
+
+        size = os.path.getsize(self.path)
+        count = (size - HEADER_SIZE) // RECORD_DTYPE.itemsize
+        if HEADER_SIZE + count * RECORD_DTYPE.itemsize != size:
+            # 書き込み途中で止まったレコードを切り捨て、次の追記の位置をそろえる
+            with open(self.path, 'rb+') as f:
+                f.truncate(HEADER_SIZE + count * RECORD_DTYPE.itemsize)
+        self._records = np.fromfile(self.path, dtype=RECORD_DTYPE, count=count, offset=HEADER_SIZE)
+        self._hashes = self._records['hash'].copy()
+        self._count = count
+
+    def _rebuild(self) -> None:
+        """
+        全レコードでブロックごとの整列済み索引を作り直す
+        """
+        self._order, self._starts = self._build(self._hashes[:self._count])
+        self._indexed = self._count
+        self._recent = [{} for _ in range(BLOCK_COUNT)]
+        self.rebuilds += 1
+
+    @staticmethod
+    def _build(hashes: np.ndarray) -> Tuple[List[np.ndarray], List[List[int]]]:
+        order_by_block, starts_by_block = [], []
+        # starts[v]:starts[v + 1] がブロック値 v のレコード
+        all_values = np.arange((1 << BLOCK_BITS) + 1, dtype=np.uint64)
+        for block in range(BLOCK_COUNT):
+            values = (hashes >> np.uint64(BLOCK_BITS * block)) & np.uint64(_BLOCK_MASK)
+            order = np.argsort(values, kind='stable').astype(np.uint32)
+            order_by_block.append(order)
+            starts_by_block.append(np.searchsorted(values[order], all_values).tolist())
+        return order_by_block, starts_by_block
+
+    def _rebuild_in_background(self) -> None:
+        """
+        ロックの外で索引を作り、差し替えるときだけロックを取る
+        """
+        try:
+            with self._lock:
+                count = self._count
+                # 既存のレコードは書き換わらない（配列を広げるときは新しい配列に写す）ので参照だけ持つ
+                hashes = self._hashes[:count]
+            order, starts = self._build(hashes)
+
+            with self._lock:
+                self._order, self._starts = order, starts
+                self._indexed = count
+                # 作っている間に追加された分だけを辞書に残す
+                self._recent = [{} for _ in range(BLOCK_COUNT)]
+                for index in range(count, self._count):
+                    self._add_recent(index)
+                self.rebuilds += 1
+        except Exception as e:
+            print(f"⚠️ 知覚ハッシュの索引の再構築に失敗しました: {e}")
+        finally:
+            self._rebuilding = False
+
+    def _add_recent(self, index: int) -> None:
+        for block, value in enumerate(_blocks(int(self._hashes[index]))):
+            self._recent[block].setdefault(value, []).append(index)
+
+    def __len__(self) -> int:
+        return self._count
+
+    def add(self, cards_info: List[Dict], session_id: str, player_id: Optional[str] = None,
+            created_at: Optional[float] = None) -> int:
+        """
+        generate_cards_batch の結果の dHash をまとめて登録し、登録件数を返す
+        （features に dhash がないカードは飛ばす）
+        """
+        records = []
+        for i, card_info in enumerate(cards_info):
+            dhash = card_info.get('features', {}).get('dhash')
+            if dhash is not None:
+                records.append((int(dhash, 16), created_at if created_at is not None else time.time(),
+                                session_id.encode('ascii')[:36], i, (player_id or '').encode('ascii')[:16]))
+        if not records:
+            return 0
+        records = np.array(records, dtype=RECORD_DTYPE)
+
+        with self._lock:
+            with open(self.path, 'ab') as f:
+                f.write(records.tobytes())
+
+            needed = self._count + len(records)
+            if needed > len(self._records):
+                grown = np.zeros(max(needed, len(self._records) * 2, 1024), dtype=RECORD_DTYPE)
+                grown[:self._count] = self._records[:self._count]
+                self._records = grown
+                grown_hashes = np.zeros(len(grown), dtype=np.uint64)
+                grown_hashes[:self._count] = self._hashes[:self._count]
+                self._hashes = grown_hashes
+            self._records[self._count:needed] = records
+            self._hashes[self._count:needed] = records['hash']
+            for index in range(self._count, needed):
+                self._add_recent(index)
+            self._count = needed
+
+            rebuild = self._count - self._indexed > self.rebuild_threshold and not self._rebuilding
+            if rebuild and self.start_task is None:
+                self._rebuild()
+            elif rebuild:
+                self._rebuilding = True
+
+        if rebuild and self.start_task is not None:
+            self.start_task(self._rebuild_in_background)
+        return len(records)
+
+    def lookup(self, dhash: str, radius: int = DUPLICATE_RADIUS, limit: int = 10,
+               exclude_session: Optional[str] = None) -> List[Dict]:
+        """
+        dhash（16進文字列）からハミング距離 radius 以内の登録済みハッシュを近い順に返す
+        """
+        query = int(dhash, 16)
+        probe_distance = radius // BLOCK_COUNT
+
+        with self._lock:
+            candidates = []
+            for block, value in enumerate(_blocks(query)):
+                order, starts, recent = self._order[block], self._starts[block], self._recent[block]
+                for neighbour in _neighbours(value, probe_distance):
+                    start, end = starts[neighbour], starts[neighbour + 1]
+                    if end > start:
+                        candidates.append(order[start:end])
+                    if neighbour in recent:
+                        candidates.append(np.array(recent[neighbour], dtype=np.uint32))
+            if not candidates:
+                return []
+
+            # 距離は候補のハッシュだけで測り、残ったものだけレコードを読む
+            indices = np.concatenate(candidates)
+            distances = hamming_distances(self._hashes[indices], query)
+            keep = distances <= radius
+            indices = np.unique(indices[keep])
+            found = self._records[indices]
+
+        distances = hamming_distances(found['hash'], query)
+        if exclude_session is not None:
+            keep = found['session_id'] != exclude_session.encode('ascii')[:36]
+            found, distances = found[keep], distances[keep]
+        ranked = np.lexsort((found['created_at'], distances))[:limit]
+        return [{
+            'distance': int(distances[i]),
+            'session_id': found[i]['session_id'].decode('ascii'),
+            'card_index': int(found[i]['card_index']),
+            'player_id': found[i]['player_id'].decode('ascii') or None,
+            'created_at': float(found[i]['created_at']),
+        } for i in ranked]
@@ -0,0 +1,78 @@
+import importlib
+import threading
+from types import ModuleType
+from typing import Any, Callable
+
+
+class LazyModule:
+    """
+    最初に属性を参照したときに import するモジュールの代理
+
+    cv2・PIL のように読み込むだけで数十〜百数十ミリ秒かかるモジュールを、
+    サーバーの起動（app.py の import）ではなく最初のカード生成かウォームアップまで遅らせる。
+    """
+
+    def __init__(self, name: str):
+        self._name = name
+        self._module = None
+        self._lock = threading.Lock()
+
+    def load(self) -> ModuleType:
+        if self._module is None:
+            with self._lock:
+                if self._module is None:
+                    self._module = importlib.import_module(self._name)
+        return self._module
+
+    @property
+    def loaded(self) -> bool:
+        return self._module is not None
+
+    def __getattr__(self, attr: str):
+        return getattr(self.load(), attr)
+
+    def __repr__(self) -> str:
+        return f"<LazyModule {self._name!r}{' (loaded)' if self.loaded else ''}>"
+
+
+def lazy_import(name: str) -> LazyModule:
+    return LazyModule(name)
+
+
+class LazyObject:
+    """
+    最初に属性を参照したとき（か load() を呼んだとき）に factory で作るオブジェクトの代理
+
+    ファイルやDBを全部読み込むストア（特徴量・知覚ハッシュ・コレクション・ランキング）の構築を
+    app.py の import から外し、ウォームアップで先に済ませるために使う。
+    """
+
+    def __init__(self, factory: Callable[[], Any], name: str):
+        self._factory = factory
+        self._name = name
+        self._object = None
+        self._lock = threading.Lock()
+
+    def load(self) -> Any:
+        if self._object is None:
+            with self._lock:
+                if self._object is None:
+                    self._object = self._factory()
+        return self._object
+
+    @property
+    def loaded(self) -> bool:
+        return self._object is not None
+
+    def __getattr__(self, attr: str):
+        return getattr(self.load(), attr)
+
+    def __len__(self) -> int:
+        return len(self.load())
+
+    def __repr__(self) -> str:
+        return f"<LazyObject {self._name!r}{' (loaded)' if self.loaded else ''}>"
+
+
+def lazy_object(factory: Callable[[], Any], name: str) -> LazyObject:
+    return LazyObject(factory, name)
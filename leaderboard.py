@@ -0,0 +1,303 @@
+import os
+import sqlite3
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+from background_writer import BackgroundWriter
+
+# Elo レーティングの設定
+INITIAL_RATING = 1500
+K_FACTOR = 32
+MIN_RATING = 0
+MAX_RATING = 4000
+
+# 1回のトランザクションでまとめる最大件数
+MAX_BATCH = 512
+
+
+def elo_update(rating_a: float, rating_b: float, score_a: float,
+               k_factor: float = K_FACTOR) -> Tuple[float, float]:
+    """
+    1試合分の Elo 更新（score_a は A から見た結果：勝ち 1・引き分け 0.5・負け 0）
+    """
+    expected_a = 1.0 / (1.0 + 10 ** ((rating_b - rating_a) / 400.0))
+    delta = k_factor * (score_a - expected_a)
+    return rating_a + delta, rating_b - delta
+
+
+class FenwickTree:
+    """
+    件数の Fenwick 木（Binary Indexed Tree）。加算・累積和・k番目の位置をすべて O(log n) で求める
+    """
+
+    def __init__(self, size: int):
+        self.size = size
+        self._tree = [0] * (size + 1)
+        self._top_bit = 1 << (size.bit_length() - 1) if size else 0
+
+    def add(self, index: int, delta: int) -> None:
+        index += 1
+        while index <= self.size:
+            self._tree[index] += delta
+            index += index & -index
+
+    def prefix(self, index: int) -> int:
+        """
+        0〜index（含む）の合計（index < 0 なら 0）
+        """
+        index += 1
+        total = 0
+        while index > 0:
+            total += self._tree[index]
+            index -= index & -index
+        return total
+
+    def find_kth(self, k: int) -> int:
+        """
+        累積和が k 以上になる最小の位置（k は 1 始まり、合計より大きければ size）
+        """
+        position = 0
+        bit = self._top_bit
+        while bit:
+            next_position = position + bit
+            if next_position <= self.size and self._tree[next_position] < k:
+                position = next_position
+                k -= self._tree[next_position]
+            bit >>= 1
+        return position
+
+
+class Leaderboard:
+    """
+    Elo レーティングのランキング
+
+    レーティングは整数に丸めて 1 点刻みのバケツに入れ、バケツごとの人数を Fenwick 木で持つ。
+    自分の順位（自分より高いバケツの人数 + 1）は O(log バケツ数)、上位N人・自分の前後N人は
+    O(N log バケツ数) で、どちらもプレイヤー数に関係なく求まる（同じレーティングは同順位）。
+    試合結果はメモリ上ですぐに反映し、SQLite への保存は BackgroundWriter の1本のバックグラウンド
+    タスクが溜まった更新を1トランザクションにまとめて行う。起動時は SQLite から全員を読み込む。
+    """
+
+    def __init__(self, path: str, initial_rating: int = INITIAL_RATING, k_factor: float = K_FACTOR,
+                 min_rating: int = MIN_RATING, max_rating: int = MAX_RATING, max_batch: int = MAX_BATCH):
+        self.path = path
+        self.initial_rating = initial_rating
+        self.k_factor = k_factor
+        self.min_rating = min_rating
+        self.max_rating = max_rating
+        self._lock = threading.Lock()
+        # キューには ratings テーブルの1行分のタプルを積む
+        self._writer = BackgroundWriter(self._write_batch, (sqlite3.Error,), 'レーティングの保存', max_batch)
+        self._tree = FenwickTree(max_rating - min_rating + 1)
+        self._buckets: Dict[int, Dict[str, None]] = {}
+        # key → [rating, wins, losses, draws, updated_at]
+        self._players: Dict[str, List] = {}
+        self._writer_connection: Optional[sqlite3.Connection] = None
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._load()
+
+    def _connect(self) -> sqlite3.Connection:
+        connection = sqlite3.connect(self.path, check_same_thread=False)
+        connection.execute('PRAGMA journal_mode=WAL')
+        connection.execute('''CREATE TABLE IF NOT EXISTS ratings (
+            player_id TEXT PRIMARY KEY,
+            rating INTEGER NOT NULL,
+            wins INTEGER NOT NULL,
+            losses INTEGER NOT NULL,
+            draws INTEGER NOT NULL,
+            updated_at REAL NOT NULL)''')
+        return connection
+
+    def _load(self) -> None:
+        connection = self._connect()
+        try:
+            for player_id, rating, wins, losses, draws, updated_at in connection.execute(
+                    'SELECT player_id, rating, wins, losses, draws, updated_at FROM ratings'):
+                self._players[player_id] = [rating, wins, losses, draws, updated_at]
+                self._insert(player_id, rating)
+        finally:
+            connection.close()
+
+    def _index(self, rating: int) -> int:
+        # 高いレーティングほど小さい位置に置く（累積和 = 自分以上の人数）
+        return self.max_rating - rating
+
+    def _insert(self, player_id: str, rating: int) -> None:
+        self._buckets.setdefault(rating, {})[player_id] = None
+        self._tree.add(self._index(rating), 1)
+
+    def _remove(self, player_id: str, rating: int) -> None:
+        bucket = self._buckets[rating]
+        del bucket[player_id]
+        if not bucket:
+            del self._buckets[rating]
+        self._tree.add(self._index(rating), -1)
+
+    def _clamp(self, rating: float) -> int:
+        return max(self.min_rating, min(self.max_rating, int(round(rating))))
+
+    def __len__(self) -> int:
+        return len(self._players)
+
+    def record_game(self, player_a: str, player_b: str, winner: Optional[str]) -> Dict[str, Dict]:
+        """
+        1試合の結果を反映し、{プレイヤーID: {rating, delta, rank, ...}} を返す（winner=None は引き分け）
+        """
+        if player_a == player_b:
+            raise ValueError('同じプレイヤー同士の試合は記録できません')
+        score_a = 0.5 if winner is None else (1.0 if winner == player_a else 0.0)
+
+        with self._lock:
+            now = time.time()
+            before = {}
+            for player_id in (player_a, player_b):
+                if player_id not in self._players:
+                    self._players[player_id] = [self.initial_rating, 0, 0, 0, now]
+                    self._insert(player_id, self.initial_rating)
+                before[player_id] = self._players[player_id][0]
+
+            new_a, new_b = elo_update(before[player_a], before[player_b], score_a, self.k_factor)
+            for player_id, rating, score in ((player_a, new_a, score_a), (player_b, new_b, 1.0 - score_a)):
+                state = self._players[player_id]
+                rating = self._clamp(rating)
+                if rating != state[0]:
+                    self._remove(player_id, state[0])
+                    self._insert(player_id, rating)
+                state[0] = rating
+                state[1 if score == 1.0 else 2 if score == 0.0 else 3] += 1
+                state[4] = now
+                self._writer.put((player_id, *state))
+
+            return {player_id: dict(self._entry(player_id), delta=self._players[player_id][0] - before[player_id])
+                    for player_id in (player_a, player_b)}
+
+    def _rank_of_rating(self, rating: int) -> int:
+        return self._tree.prefix(self._index(rating) - 1) + 1
+
+    def _entry(self, player_id: str, rank: Optional[int] = None) -> Dict:
+        rating, wins, losses, draws, _ = self._players[player_id]
+        return {
+            'player_id': player_id,
+            'rank': rank if rank is not None else self._rank_of_rating(rating),
+            'rating': rating,
+            'wins': wins,
+            'losses': losses,
+            'draws': draws,
+        }
+
+    def rank(self, player_id: str) -> Optional[Dict]:
+        """
+        プレイヤーの順位・レーティング・戦績（未登録なら None）
+        """
+        with self._lock:
+            if player_id not in self._players:
+                return None
+            return dict(self._entry(player_id), total_players=len(self._players))
+
+    def _bucket_entries(self, index: int, members, limit: int, exclude: Optional[str] = None) -> List[Dict]:
+        rank = self._tree.prefix(index - 1) + 1
+        entries = []
+        for player_id in members:
+            if len(entries) >= limit:
+                break
+            if player_id != exclude:
+                entries.append(self._entry(player_id, rank))
+        return entries
+
+    def _entries_from(self, index: int, limit: int, exclude: Optional[str] = None) -> List[Dict]:
+        """
+        位置 index のバケツから下位に向かって limit 人分（次の空でないバケツは Fenwick 木で探す）
+        """
+        entries: List[Dict] = []
+        while len(entries) < limit:
+            bucket = self._buckets[self.max_rating - index]
+            entries += self._bucket_entries(index, iter(bucket), limit - len(entries), exclude)
+            next_k = self._tree.prefix(index) + 1
+            if next_k > len(self._players):
+                break
+            index = self._tree.find_kth(next_k)
+        return entries
+
+    def top(self, limit: int = 10) -> List[Dict]:
+        with self._lock:
+            if not self._players or limit <= 0:
+                return []
+            return self._entries_from(self._tree.find_kth(1), limit)
+
+    def around(self, player_id: str, radius: int = 5) -> List[Dict]:
+        """
+        自分より上位の radius 人・自分・下位の radius 人の順位表（同順位の中では自分を先頭に置く）
+        """
+        with self._lock:
+            if player_id not in self._players:
+                return []
+            my_index = self._index(self._players[player_id][0])
+
+            chunks = []
+            index, found = my_index, 0
+            while found < radius:
+                players_above = self._tree.prefix(index - 1)
+                if players_above == 0:
+                    break
+                index = self._tree.find_kth(players_above)
+                # 上位側はバケツの末尾から逆順にたどる（dict の reversed は末尾から O(1) で始まる）
+                chunk = self._bucket_entries(index, reversed(self._buckets[self.max_rating - index]),
+                                             radius - found)
+                chunks.append(chunk)
+                found += len(chunk)
+            above = [entry for chunk in reversed(chunks) for entry in reversed(chunk)]
+
+            below = self._entries_from(my_index, radius, exclude=player_id)
+            return above + [self._entry(player_id)] + below
+
+    @property
+    def write_failures(self) -> int:
+        return self._writer.write_failures
+
+    def pending(self) -> int:
+        return self._writer.pending()
+
+    def write_pending(self, block: bool = False, timeout: Optional[float] = None) -> int:
+        """
+        溜まっている更新（前回失敗した行が先）を1トランザクションで SQLite に書き込み、書いた件数を返す
+        """
+        return self._writer.write_pending(block, timeout)
+
+    def _write_batch(self, rows: List[Tuple], retrying: bool) -> None:
+        """
+        更新を1トランザクションで書き込む（失敗したら接続を閉じて sqlite3.Error を投げる）
+        """
+        try:
+            if self._writer_connection is None:
+                self._writer_connection = self._connect()
+            with self._writer_connection:
+                self._writer_connection.executemany(
+                    'INSERT INTO ratings (player_id, rating, wins, losses, draws, updated_at) '
+                    'VALUES (?, ?, ?, ?, ?, ?) ON CONFLICT(player_id) DO UPDATE SET '
+                    'rating=excluded.rating, wins=excluded.wins, losses=excluded.losses, '
+                    'draws=excluded.draws, updated_at=excluded.updated_at', rows)
+        except sqlite3.Error:
+            # 接続が壊れている場合に備えて、次は接続し直す
+            if self._writer_connection is not None:
+                self._writer_connection.close()
+                self._writer_connection = None
+            raise
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """
+        積んである更新が全て書き込まれるまで待つ（timeout 秒たっても書き終わらなければ False）
+        """
+        return self._writer.flush(timeout)
+
+    def start(self, start_task: Callable) -> bool:
+        """
+        書き込みタスクが未起動なら start_task で起動する
+        """
+        return self._writer.start(start_task)
+
+    def stop(self) -> None:
+        self._writer.stop()
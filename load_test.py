@@ -0,0 +1,395 @@
+#!/usr/bin/env python3
+"""
+Socket.IO 負荷試験ツール
+
+N人の疑似プレイヤーが2人1組でルーム作成・参加 → テスト画像のアップロード →
+cards_ready → 3ラウンドの card_selected → 再戦 までを実際に対戦し、
+card_selected から battle_result までのレイテンシ（p50/p95/p99）、イベントスループット、
+サーバーのメモリ増加量を報告する。python-socketio のクライアントを使う。
+
+    python load_test.py --players 100 --rematches 1
+    python load_test.py --players 20 --spawn-server
+"""
+
+import argparse
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from typing import Dict, List, Optional
+
+import requests
+import socketio
+
+from test_card_generator import create_test_images
+from wire_format import socketio_serializer
+
+
+def percentile(samples: List[float], fraction: float) -> Optional[float]:
+    if not samples:
+        return None
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def percentile_ms(samples: List[float], fraction: float) -> Optional[float]:
+    value = percentile(samples, fraction)
+    return None if value is None else value * 1000
+
+
+def read_rss_bytes(pid: Optional[int]) -> Optional[int]:
+    """
+    /proc からプロセスの常駐メモリ量を取得（Linux以外・pid不明時はNone）
+    """
+    if not pid:
+        return None
+    try:
+        with open(f'/proc/{pid}/status', 'r') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        return None
+    return None
+
+
+class LoadStats:
+    """
+    全プレイヤー共通の計測値
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.battle_latencies: List[float] = []
+        self.events_sent = 0
+        self.events_received = 0
+        self.games_finished = 0
+        self.generation_retries = 0
+        self.errors: List[str] = []
+
+    def sent(self):
+        with self.lock:
+            self.events_sent += 1
+
+    def received(self):
+        with self.lock:
+            self.events_received += 1
+
+    def latency(self, seconds: float):
+        with self.lock:
+            self.battle_latencies.append(seconds)
+
+    def error(self, message: str):
+        with self.lock:
+            self.errors.append(message)
+
+    def generation_retry(self):
+        with self.lock:
+            self.generation_retries += 1
+
+    def game_finished(self):
+        with self.lock:
+            self.games_finished += 1
+
+
+class SimulatedMatch:
+    """
+    2人の疑似プレイヤーによる1試合（再戦を含む）
+    """
+
+    def __init__(self, index: int, server_url: str, image_paths: List[str], rematches: int, stats: LoadStats,
+                 wire_format: str = 'json'):
+        self.index = index
+        self.wire_format = wire_format
+        self.server_url = server_url
+        self.image_paths = image_paths
+        self.rematches_left = rematches
+        self.stats = stats
+        self.room_id = None
+        self.done = threading.Event()
+        self.room_ready = threading.Event()
+        self.room_created = threading.Event()
+        self.selection_lock = threading.Lock()
+        self.selection_sent_at: Dict[int, Dict[int, float]] = {}
+        self.players = [SimulatedPlayer(self, 0), SimulatedPlayer(self, 1)]
+
+    def run(self, timeout: float):
+        host, guest = self.players
+        try:
+            host.connect()
+            guest.connect()
+
+            host.emit('create_room', {})
+            if not self.room_created.wait(timeout):
+                raise TimeoutError('room_created')
+            guest.emit('join_room_request', {'room_id': self.room_id})
+            if not self.room_ready.wait(timeout):
+                raise TimeoutError('game_ready')
+
+            for player in self.players:
+                player.upload_cards()
+            for player in self.players:
+                player.emit('cards_ready', {'room_id': self.room_id, 'cards': player.cards})
+
+            if not self.done.wait(timeout):
+                raise TimeoutError('game_finished')
+        except Exception as e:
+            self.stats.error(f"match {self.index}: {e}")
+        finally:
+            for player in self.players:
+                player.disconnect()
+
+    def record_selection(self, round_number: int, player_index: int):
+        with self.selection_lock:
+            self.selection_sent_at.setdefault(round_number, {})[player_index] = time.perf_counter()
+
+    def record_battle_result(self, round_number: int):
+        """
+        両プレイヤーに届く battle_result のうち、先に届いた方だけでラウンドのレイテンシを記録する
+        """
+        with self.selection_lock:
+            sent = self.selection_sent_at.pop(round_number, {})
+        if len(sent) == 2:
+            self.stats.latency(time.perf_counter() - max(sent.values()))
+
+    def game_finished(self, player_index: int):
+        if player_index != 0:
+            return
+        self.stats.game_finished()
+        if self.rematches_left > 0:
+            self.rematches_left -= 1
+            with self.selection_lock:
+                self.selection_sent_at.clear()
+            self.players[0].emit('request_rematch', {'room_id': self.room_id})
+        else:
+            self.done.set()
+
+
+class SimulatedPlayer:
+    def __init__(self, match: SimulatedMatch, index: int):
+        self.match = match
+        self.index = index
+        self.stats = match.stats
+        self.cards: List[Dict] = []
+        self.used_card_ids = set()
+        self.client = socketio.Client(reconnection=False, serializer=socketio_serializer(match.wire_format))
+        self._register_handlers()
+
+    def _register_handlers(self):
+        client = self.client
+
+        @client.on('room_created')
+        def on_room_created(data):
+            self.stats.received()
+            self.match.room_id = data['room_id']
+            self.match.room_created.set()
+
+        @client.on('game_ready')
+        def on_game_ready(data):
+            self.stats.received()
+            self.match.room_ready.set()
+
+        @client.on('both_players_ready')
+        def on_both_ready(data):
+            self.stats.received()
+            self.select_card(1)
+
+        @client.on('next_round')
+        def on_next_round(data):
+            self.stats.received()
+            self.select_card(data['round'])
+
+        @client.on('battle_result')
+        def on_battle_result(data):
+            self.stats.received()
+            self.match.record_battle_result(data['round'])
+
+        @client.on('game_finished')
+        def on_game_finished(data):
+            self.stats.received()
+            self.match.game_finished(self.index)
+
+        @client.on('rematch_started')
+        def on_rematch_started(data):
+            self.stats.received()
+            self.used_card_ids.clear()
+            self.select_card(1)
+
+        @client.on('error')
+        def on_error(data):
+            self.stats.received()
+            self.stats.error(f"match {self.match.index} player {self.index}: {data.get('message')}")
+
+        @client.on('batch')
+        def on_batch(data):
+            # 1フレームにまとめられたイベントを個別のハンドラーへ渡す
+            for item in data.get('events', []):
+                handler = client.handlers['/'].get(item['event'])
+                if handler is not None:
+                    handler(item['data'])
+
+        @client.on('*')
+        def on_other(event, data=None):
+            self.stats.received()
+
+    def connect(self):
+        self.client.connect(self.match.server_url, wait_timeout=10)
+
+    def disconnect(self):
+        try:
+            self.client.disconnect()
+        except Exception:
+            pass
+
+    def emit(self, event: str, data: Dict):
+        self.stats.sent()
+        self.client.emit(event, data)
+
+    def upload_cards(self, max_retries: int = 10):
+        for _ in range(max_retries + 1):
+            files = [('images', (os.path.basename(path), open(path, 'rb'), 'image/jpeg'))
+                     for path in self.match.image_paths]
+            try:
+                response = requests.post(f'{self.match.server_url}/api/cards/generate', files=files, timeout=120)
+            finally:
+                for _, (_, handle, _) in files:
+                    handle.close()
+            if response.status_code not in (429, 503):
+                break
+            # 混雑中・回数制限中は Retry-After だけ待って再送する（全員が同時に再送しないよう待ち時間をずらす）
+            self.stats.generation_retry()
+            time.sleep(float(response.headers.get('Retry-After', 1)) * random.uniform(1.0, 1.5))
+        response.raise_for_status()
+        self.cards = response.json()['cards']
+
+    def select_card(self, round_number: int):
+        available = [card for card in self.cards if card['id'] not in self.used_card_ids]
+        if not available:
+            return
+        card = available[0]
+        self.used_card_ids.add(card['id'])
+        self.match.record_selection(round_number, self.index)
+        self.emit('card_selected', {'room_id': self.match.room_id, 'card_id': card['id']})
+
+
+def spawn_server(port: int, wire_format: str = 'json') -> subprocess.Popen:
+    """
+    app.py を子プロセスで起動し、ウォームアップが終わって /api/ready が 200 を返すまで待つ
+    """
+    code = ("import app; app.start_warm_up(); app.socketio.run(app.app, host='127.0.0.1', port=%d, "
+            "allow_unsafe_werkzeug=True)" % port)
+    env = dict(os.environ, PHOTOBATTLE_WIRE_FORMAT=wire_format)
+    process = subprocess.Popen([sys.executable, '-c', code], env=env,
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    for _ in range(100):
+        try:
+            if requests.get(f'http://127.0.0.1:{port}/api/ready', timeout=1).ok:
+                return process
+        except requests.exceptions.ConnectionError:
+            pass
+        time.sleep(0.1)
+    process.terminate()
+    raise RuntimeError('サーバーの起動に失敗しました')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Photo Battle Socket.IO 負荷試験')
+    parser.add_argument('--server', default='http://localhost:5000', help='対象サーバーURL')
+    parser.add_argument('--players', type=int, default=20, help='疑似プレイヤー数（2人で1試合）')
+    parser.add_argument('--rematches', type=int, default=1, help='1試合あたりの再戦回数')
+    parser.add_argument('--ramp', type=float, default=5.0, help='全試合を開始し終えるまでの秒数')
+    parser.add_argument('--timeout', type=float, default=180.0, help='1試合のタイムアウト秒数')
+    parser.add_argument('--server-pid', type=int, help='メモリ計測するサーバーのPID')
+    parser.add_argument('--spawn-server', action='store_true', help='app.py を子プロセスで起動して試験する')
+    parser.add_argument('--wire-format', choices=['json', 'msgpack'], default='json',
+                        help='Socket.IO の通信形式（サーバーの PHOTOBATTLE_WIRE_FORMAT と合わせる）')
+    parser.add_argument('--output', help='結果JSONの出力先')
+    args = parser.parse_args()
+
+    server_process = None
+    server_url = args.server
+    server_pid = args.server_pid
+    if args.spawn_server:
+        port = 5055
+        server_process = spawn_server(port, args.wire_format)
+        server_url = f'http://127.0.0.1:{port}'
+        server_pid = server_process.pid
+
+    image_dir = tempfile.mkdtemp(prefix='load_test_images_')
+    create_test_images(image_dir)
+    image_paths = [os.path.join(image_dir, name) for name in
+                   ("fire_image.jpg", "water_image.jpg", "earth_image.jpg")]
+
+    stats = LoadStats()
+    match_count = max(1, args.players // 2)
+    matches = [SimulatedMatch(i, server_url, image_paths, args.rematches, stats, args.wire_format)
+               for i in range(match_count)]
+
+    rss_before = read_rss_bytes(server_pid)
+    started = time.perf_counter()
+    threads = []
+    try:
+        for match in matches:
+            thread = threading.Thread(target=match.run, args=(args.timeout,), daemon=True)
+            thread.start()
+            threads.append(thread)
+            time.sleep(args.ramp / match_count)
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+        rss_after = read_rss_bytes(server_pid)
+    finally:
+        if server_process is not None:
+            server_process.terminate()
+            server_process.wait()
+
+    latencies = stats.battle_latencies
+    report = {
+        'players': match_count * 2,
+        'matches': match_count,
+        'wire_format': args.wire_format,
+        'games_finished': stats.games_finished,
+        'duration_seconds': elapsed,
+        'battle_latency_ms': {
+            'samples': len(latencies),
+            'p50': percentile_ms(latencies, 0.50),
+            'p95': percentile_ms(latencies, 0.95),
+            'p99': percentile_ms(latencies, 0.99),
+        },
+        'generation_retries': stats.generation_retries,
+        'events_sent': stats.events_sent,
+        'events_received': stats.events_received,
+        'events_per_second': (stats.events_sent + stats.events_received) / elapsed if elapsed else 0,
+        'server_rss_before_bytes': rss_before,
+        'server_rss_after_bytes': rss_after,
+        'server_rss_growth_bytes': rss_after - rss_before if rss_before and rss_after else None,
+        'errors': stats.errors[:50],
+        'error_count': len(stats.errors),
+    }
+
+    print("📊 Load Test Results:")
+    print(f"  Matches: {report['matches']} ({report['players']} players), games finished: {report['games_finished']}")
+    print(f"  Duration: {elapsed:.1f}s, events/s: {report['events_per_second']:.1f}")
+    latency = report['battle_latency_ms']
+    if latency['samples']:
+        print(f"  card_selected → battle_result: p50 {latency['p50']:.1f}ms  "
+              f"p95 {latency['p95']:.1f}ms  p99 {latency['p99']:.1f}ms  (n={latency['samples']})")
+    if stats.generation_retries:
+        print(f"  Card generation retries (429/503): {stats.generation_retries}")
+    if report['server_rss_growth_bytes'] is not None:
+        print(f"  Server RSS: {rss_before / 1e6:.1f}MB → {rss_after / 1e6:.1f}MB")
+    if stats.errors:
+        print(f"  ❌ Errors: {len(stats.errors)} (例: {stats.errors[0]})")
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,151 @@
+import math
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional, Tuple
+
+
+def average_attack_power(cards: Optional[List[Dict]]) -> Optional[float]:
+    """
+    デッキの平均攻撃力を算出（カード情報がなければNone）
+    """
+    powers = [card['attack_power'] for card in cards or []
+              if isinstance(card, dict) and isinstance(card.get('attack_power'), (int, float))]
+    if not powers:
+        return None
+    return sum(powers) / len(powers)
+
+
+class MatchmakingQueue:
+    """
+    自動マッチング用の待機キュー
+
+    待機プレイヤーをデッキ強度（平均攻撃力）ごとのバケットに分けて保持する。
+    各バケットは挿入順のOrderedDictなので、追加・削除・最古の待機者の取り出しはO(1)。
+    攻撃力は10-100に収まるため、バケット数は定数で抑えられる。
+
+    組める相手のバケットの距離は最初 max_bucket_distance までで、待ち時間 widen_every 秒ごとに
+    1つずつ広がり、match_any_after 秒待ったら強度に関係なく誰とでも組む。
+    すでに待っている人同士は pair_waiting() を定期的に呼んで組み合わせる。
+    """
+
+    def __init__(self, bucket_width: int = 10, max_bucket_distance: int = 1,
+                 widen_every: float = 5.0, match_any_after: float = 30.0,
+                 clock: Callable[[], float] = time.monotonic):
+        self.bucket_width = bucket_width
+        self.max_bucket_distance = max_bucket_distance
+        self.widen_every = widen_every
+        self.match_any_after = match_any_after
+        self._clock = clock
+        # バケット → {player_id: 待ち始めた時刻}
+        self._buckets: Dict[Optional[int], OrderedDict] = {}
+        self._player_buckets: Dict[str, Optional[int]] = {}
+        self._lock = threading.Lock()
+
+    def bucket_for(self, strength: Optional[float]) -> Optional[int]:
+        if strength is None:
+            return None
+        return int(strength) // self.bucket_width
+
+    def tolerance(self, waited: float) -> float:
+        """
+        waited 秒待った人が組めるバケットの距離
+        """
+        if waited >= self.match_any_after:
+            return math.inf
+        return self.max_bucket_distance + int(waited // self.widen_every)
+
+    def enqueue(self, player_id: str, strength: Optional[float] = None) -> Optional[str]:
+        """
+        プレイヤーをキューに追加し、対戦相手が見つかればそのIDを返す
+
+        強度が近い順（同じバケット → 隣接バケット → …）に、距離が自分か相手の許容範囲に
+        収まるバケットの最古の待機者を探し、見つからなければキューに残してNoneを返す。
+        強度不明のプレイヤーは強度不明同士を優先し、いなければ任意のバケットの待機者と組む。
+        """
+        bucket = self.bucket_for(strength)
+        with self._lock:
+            if player_id in self._player_buckets:
+                return None
+
+            now = self._clock()
+            for candidate_bucket in self._candidate_buckets(bucket):
+                waiting = self._buckets.get(candidate_bucket)
+                if not waiting:
+                    continue
+                opponent_id, since = next(iter(waiting.items()))
+                distance = self._distance(bucket, candidate_bucket)
+                if distance <= max(self.tolerance(0.0), self.tolerance(now - since)):
+                    self._pop(candidate_bucket)
+                    return opponent_id
+
+            self._buckets.setdefault(bucket, OrderedDict())[player_id] = now
+            self._player_buckets[player_id] = bucket
+            return None
+
+    def pair_waiting(self) -> List[Tuple[str, str]]:
+        """
+        待ち時間で許容範囲が広がった待機者同士を組み合わせ、(先に待っていた人, 相手) の一覧を返す
+        """
+        pairs = []
+        with self._lock:
+            now = self._clock()
+            while True:
+                # 各バケットの最古の待機者を、長く待っている順に見る
+                heads = sorted(((waiting[next(iter(waiting))], bucket) for bucket, waiting in self._buckets.items()),
+                               key=lambda head: head[0])
+                pair = None
+                for since, bucket in heads:
+                    others = [(self._distance(bucket, other), other_since, other)
+                              for other_since, other in heads if other != bucket]
+                    for distance, other_since, other in sorted(others, key=lambda o: (o[0], o[1])):
+                        if distance <= max(self.tolerance(now - since), self.tolerance(now - other_since)):
+                            pair = (self._pop(bucket), self._pop(other))
+                            break
+                    if pair:
+                        break
+                if pair is None:
+                    return pairs
+                pairs.append(pair)
+
+    def _pop(self, bucket: Optional[int]) -> str:
+        waiting = self._buckets[bucket]
+        player_id, _ = waiting.popitem(last=False)
+        del self._player_buckets[player_id]
+        if not waiting:
+            del self._buckets[bucket]
+        return player_id
+
+    @staticmethod
+    def _distance(bucket: Optional[int], other: Optional[int]) -> float:
+        # 強度不明のプレイヤーは誰とでも組める
+        if bucket is None or other is None:
+            return 0
+        return abs(bucket - other)
+
+    def _candidate_buckets(self, bucket: Optional[int]) -> List[Optional[int]]:
+        if bucket is None:
+            return [None] + [b for b in self._buckets if b is not None]
+
+        others = sorted((b for b in self._buckets if b is not None and b != bucket), key=lambda b: abs(b - bucket))
+        return [bucket] + others + [None]
+
+    def remove(self, player_id: str) -> bool:
+        """
+        キューから取り除く（マッチングのキャンセル・切断時）
+        """
+        with self._lock:
+            if player_id not in self._player_buckets:
+                return False
+            bucket = self._player_buckets.pop(player_id)
+            waiting = self._buckets[bucket]
+            del waiting[player_id]
+            if not waiting:
+                del self._buckets[bucket]
+            return True
+
+    def __contains__(self, player_id: str) -> bool:
+        return player_id in self._player_buckets
+
+    def __len__(self) -> int:
+        return len(self._player_buckets)
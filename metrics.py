@@ -0,0 +1,219 @@
+import math
+import os
+import threading
+import time
+from bisect import bisect_left
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+# 秒単位のレイテンシ用バケット（1ms〜10s）
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return '+Inf'
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+def _format_labels(labels: Sequence[Tuple[str, str]]) -> str:
+    if not labels:
+        return ''
+    escaped = []
+    for name, value in labels:
+        value = str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+        escaped.append(f'{name}="{value}"')
+    return '{' + ','.join(escaped) + '}'
+
+
+class Histogram:
+    """
+    固定バケットのヒストグラム
+
+    バケット配列は生成時に確保し、observe() はロックも新しいオブジェクトも使わずに
+    カウンタを加算するだけ。GILの下でまれに加算が競合しても監視用途では許容する。
+    """
+
+    def __init__(self, buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.upper_bounds = tuple(sorted(buckets)) + (math.inf,)
+        self.counts = [0] * len(self.upper_bounds)
+        self.sum = 0.0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect_left(self.upper_bounds, value)] += 1
+        self.sum += value
+
+    def snapshot(self) -> Tuple[List[int], float]:
+        return list(self.counts), self.sum
+
+
+class HistogramFamily:
+    """
+    ラベル付きヒストグラムの集合（ラベル値ごとの子ヒストグラムは初回だけ生成）
+    """
+
+    def __init__(self, name: str, documentation: str, label_name: str,
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.label_name = label_name
+        self.buckets = buckets
+        self._children: Dict[str, Histogram] = {}
+
+    def labels(self, value: str) -> Histogram:
+        child = self._children.get(value)
+        if child is None:
+            child = self._children.setdefault(value, Histogram(self.buckets))
+        return child
+
+    def observe(self, value: str, amount: float) -> None:
+        self.labels(value).observe(amount)
+
+    def render(self) -> List[str]:
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} histogram']
+        for label_value, histogram in sorted(self._children.items()):
+            counts, total = histogram.snapshot()
+            cumulative = 0
+            for upper_bound, count in zip(histogram.upper_bounds, counts):
+                cumulative += count
+                labels = _format_labels([(self.label_name, label_value), ('le', _format_value(upper_bound))])
+                lines.append(f'{self.name}_bucket{labels} {cumulative}')
+            labels = _format_labels([(self.label_name, label_value)])
+            lines.append(f'{self.name}_sum{labels} {_format_value(total)}')
+            lines.append(f'{self.name}_count{labels} {cumulative}')
+        return lines
+
+
+class Gauge:
+    """
+    スクレイプ時にコールバックで値を取得するゲージ
+    """
+
+    metric_type = 'gauge'
+
+    def __init__(self, name: str, documentation: str, callback: Callable[[], object],
+                 label_name: Optional[str] = None):
+        self.name = name
+        self.documentation = documentation
+        self.callback = callback
+        self.label_name = label_name
+
+    def render(self) -> List[str]:
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.metric_type}']
+        value = self.callback()
+        if self.label_name is None:
+            lines.append(f'{self.name} {_format_value(value)}')
+        else:
+            for label_value, amount in sorted(value.items()):
+                lines.append(f'{self.name}{_format_labels([(self.label_name, label_value)])} {_format_value(amount)}')
+        return lines
+
+
+class Counter(Gauge):
+    """
+    スクレイプ時にコールバックで起動からの累計を取得するカウンター（rate() で使えるよう counter として書き出す）
+    """
+
+    metric_type = 'counter'
+
+
+class MetricsRegistry:
+    """
+    メトリクスの登録とPrometheusテキスト形式への書き出し
+    """
+
+    def __init__(self):
+        self._metrics = []
+
+    def histogram(self, name: str, documentation: str, label_name: str,
+                  buckets: Sequence[float] = DEFAULT_BUCKETS) -> HistogramFamily:
+        family = HistogramFamily(name, documentation, label_name, buckets)
+        self._metrics.append(family)
+        return family
+
+    def gauge(self, name: str, documentation: str, callback: Callable[[], object],
+              label_name: Optional[str] = None) -> Gauge:
+        gauge = Gauge(name, documentation, callback, label_name)
+        self._metrics.append(gauge)
+        return gauge
+
+    def counter(self, name: str, documentation: str, callback: Callable[[], object],
+                label_name: Optional[str] = None) -> Counter:
+        if not name.endswith('_total'):
+            raise ValueError(f"カウンターの名前は _total で終わる必要があります: {name}")
+        counter = Counter(name, documentation, callback, label_name)
+        self._metrics.append(counter)
+        return counter
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+def directory_size(path: str) -> int:
+    """
+    ディレクトリ配下のファイルの合計バイト数
+    """
+    total = 0
+    for root, _, files in os.walk(path):
+        for filename in files:
+            try:
+                total += os.path.getsize(os.path.join(root, filename))
+            except OSError:
+                continue
+    return total
+
+
+class DirectorySizeMonitor:
+    """
+    フォルダの使用容量をバックグラウンドタスクで interval 秒ごとに測り直して保持する
+
+    os.walk はファイル数に比例して遅くなるので、スクレイプのたびには測らず、
+    ゲージは最後に測った値（snapshot）を返すだけにする。
+    """
+
+    def __init__(self, paths: Sequence[str], interval: float = 60.0):
+        self.paths = tuple(paths)
+        self.interval = interval
+        self.refreshed_at: Optional[float] = None
+        self._sizes: Dict[str, int] = {path: 0 for path in self.paths}
+        self._running = False
+        self._lock = threading.Lock()
+
+    def refresh(self) -> Dict[str, int]:
+        sizes = {path: directory_size(path) for path in self.paths}
+        self._sizes = sizes
+        self.refreshed_at = time.time()
+        return sizes
+
+    def snapshot(self) -> Dict[str, int]:
+        return dict(self._sizes)
+
+    def run(self, sleep: Optional[Callable[[float], None]] = None) -> None:
+        """
+        測り直しのループ本体（バックグラウンドタスクとして1本だけ起動する）
+        """
+        sleep = sleep or time.sleep
+        while self._running:
+            try:
+                self.refresh()
+            except Exception as e:
+                print(f"⚠️ 使用容量の計測に失敗しました: {e}")
+            sleep(self.interval)
+
+    def start(self, start_task: Callable, sleep: Optional[Callable[[float], None]] = None) -> bool:
+        """
+        ループが未起動なら start_task(self.run, sleep) で起動する
+        """
+        with self._lock:
+            if self._running:
+                return False
+            self._running = True
+        start_task(self.run, sleep)
+        return True
+
+    def stop(self) -> None:
+        self._running = False
@@ -0,0 +1,123 @@
+import hashlib
+import re
+import secrets
+import threading
+from typing import Dict, Optional, Tuple
+
+TOKEN_PATTERN = re.compile(r'^[A-Za-z0-9_-]{16,64}$')
+
+
+def public_player_id(token: str) -> str:
+    """
+    プレイヤートークン（再接続用の秘密の値）から公開してよいプレイヤーIDを作る
+    （ランキング・カードコレクションはこのIDでプレイヤーを識別する）
+    """
+    return hashlib.sha256(token.encode('utf-8')).hexdigest()[:16]
+
+
+def rebind_player(room: Dict, old_sid: str, new_sid: str) -> None:
+    """
+    再接続したプレイヤーのルーム内データを新しいsidに付け替える
+    """
+    players = room.get('players', [])
+    if old_sid in players:
+        players[players.index(old_sid)] = new_sid
+    elif new_sid not in players and len(players) < 2:
+        players.append(new_sid)
+
+    scores = room.setdefault('scores', {})
+    scores[new_sid] = scores.pop(old_sid, scores.get(new_sid, 0))
+
+    player_cards = room.setdefault('player_cards', {})
+    if old_sid in player_cards:
+        player_cards[new_sid] = player_cards.pop(old_sid)
+
+    round_selections = room.get('current_selections', {}).get(f"round_{room.get('current_round')}", {})
+    if old_sid in round_selections:
+        round_selections[new_sid] = round_selections.pop(old_sid)
+        round_selections[new_sid]['player_id'] = new_sid
+
+
+class PlayerRegistry:
+    """
+    ルーム参加時に発行するプレイヤートークンの管理
+
+    token → プレイヤー状態（所属ルームと現在のsid）と sid → token の2つの索引を持ち、
+    再接続時の本人確認を辞書の参照1回で行う。
+    """
+
+    def __init__(self):
+        self._players: Dict[str, Dict] = {}
+        self._sid_tokens: Dict[str, str] = {}
+        self._lock = threading.Lock()
+
+    def issue(self, room_id: str, sid: str, token: Optional[str] = None) -> str:
+        """
+        ルーム参加したプレイヤーにトークンを発行する
+
+        クライアントが既存のトークンを提示した場合はそれを引き継ぐ（ルームの移動）。
+        ただし同じルームに既に紐付いているトークンは再利用しない。
+        """
+        with self._lock:
+            state = self._players.get(token) if token else None
+            reusable = bool(token) and TOKEN_PATTERN.match(token) and \
+                (state is None or state['room_id'] != room_id)
+            if not reusable:
+                token = secrets.token_urlsafe(16)
+            elif state:
+                self._sid_tokens.pop(state['sid'], None)
+            self._players[token] = {'token': token, 'room_id': room_id, 'sid': sid}
+            self._sid_tokens[sid] = token
+            return token
+
+    def bind(self, token: str, room_id: str, sid: str) -> Tuple[Optional[Dict], Optional[str]]:
+        """
+        トークンを新しいsidに紐付け直し、(プレイヤー状態, 以前のsid) を返す
+
+        トークンが不明、または別ルームのものであれば (None, None)。
+        """
+        with self._lock:
+            state = self._players.get(token) if token else None
+            if state is None or state['room_id'] != room_id:
+                return None, None
+
+            old_sid = state['sid']
+            if old_sid != sid:
+                self._sid_tokens.pop(old_sid, None)
+            state['sid'] = sid
+            self._sid_tokens[sid] = token
+            return state, old_sid
+
+    def token_for(self, sid: str) -> Optional[str]:
+        return self._sid_tokens.get(sid)
+
+    def get(self, token: str) -> Optional[Dict]:
+        return self._players.get(token)
+
+    def disconnect(self, sid: str) -> None:
+        """
+        切断したsidの索引だけを外す
+
+        プレイヤー状態には最後のsidを残し、再接続時にルーム内データの付け替え元にする。
+        """
+        with self._lock:
+            self._sid_tokens.pop(sid, None)
+
+    def discard(self, token: str, room_id: str) -> bool:
+        """
+        ルームが閉じられたときにトークンを破棄する
+
+        トークンはその後に別のルームへ移っていることがあるので、まだ room_id に
+        紐付いている場合だけ破棄する（破棄したらTrue）。
+        """
+        with self._lock:
+            state = self._players.get(token)
+            if state is None or state['room_id'] != room_id:
+                return False
+            del self._players[token]
+            if self._sid_tokens.get(state['sid']) == token:
+                del self._sid_tokens[state['sid']]
+            return True
+
+    def __len__(self) -> int:
+        return len(self._players)
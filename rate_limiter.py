@@ -0,0 +1,82 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, Hashable, Optional, Tuple
+
+# 保持するバケツ数の上限（超えたら最も長く使われていないものから捨てる）
+MAX_BUCKETS = 100000
+
+
+class TokenBucketLimiter:
+    """
+    クライアント（IP・プレイヤーID・sid）× 名前（エンドポイント・イベント）ごとのトークンバケツ
+
+    budgets は 名前 → (1秒あたりの補充数, バケツの容量)。1回の確認は辞書の参照と
+    OrderedDict の末尾への移動だけなので O(1)。しばらく使われず満タンに戻ったバケツは
+    新しく作るのと同じなので、先頭（最も長く使われていないもの）から捨てていき、
+    それでも max_buckets を超えたら先頭から捨てる（メモリは上限つき）。
+    """
+
+    def __init__(self, budgets: Dict[str, Tuple[float, float]], default: Optional[Tuple[float, float]] = None,
+                 max_buckets: int = MAX_BUCKETS, clock: Callable[[], float] = time.monotonic):
+        self.budgets = dict(budgets)
+        self.default = default
+        self.max_buckets = max_buckets
+        self._clock = clock
+        self._lock = threading.Lock()
+        # (名前, クライアント) → [残りトークン, 最終更新時刻, 満タンに戻る時刻]
+        self._buckets: "OrderedDict[Tuple[str, Hashable], list]" = OrderedDict()
+        self.limited: Dict[str, int] = {}
+
+    def budget(self, name: str) -> Optional[Tuple[float, float]]:
+        return self.budgets.get(name, self.default)
+
+    def check(self, client: Hashable, name: str) -> float:
+        """
+        トークンを1つ使えたら 0.0、使えなければ次のトークンが貯まるまでの秒数を返す
+        （予算のない名前は常に 0.0）
+        """
+        budget = self.budget(name)
+        if budget is None:
+            return 0.0
+        rate, capacity = budget
+        key = (name, client)
+
+        with self._lock:
+            now = self._clock()
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                tokens = capacity
+                self._evict(now)
+            else:
+                tokens = min(capacity, bucket[0] + (now - bucket[1]) * rate)
+                self._buckets.move_to_end(key)
+
+            if tokens >= 1.0:
+                tokens -= 1.0
+                wait = 0.0
+            else:
+                wait = (1.0 - tokens) / rate
+                self.limited[name] = self.limited.get(name, 0) + 1
+
+            full_at = now + (capacity - tokens) / rate
+            if bucket is None:
+                self._buckets[key] = [tokens, now, full_at]
+            else:
+                bucket[0], bucket[1], bucket[2] = tokens, now, full_at
+            return wait
+
+    def allow(self, client: Hashable, name: str) -> bool:
+        return self.check(client, name) == 0.0
+
+    def _evict(self, now: float) -> None:
+        # 満タンに戻ったバケツは捨てても結果が変わらない。先頭から見て、まだ満タンでないものがあれば止める
+        buckets = self._buckets
+        while buckets:
+            key, bucket = next(iter(buckets.items()))
+            if bucket[2] > now and len(buckets) < self.max_buckets:
+                break
+            buckets.popitem(last=False)
+
+    def __len__(self) -> int:
+        return len(self._buckets)
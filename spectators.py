@@ -0,0 +1,118 @@
+import copy
+import queue
+import threading
+from typing import Callable, Dict, Optional, Set
+
+# キューを閉じるときの合図
+_CLOSE = object()
+
+
+def spectator_group(room_id: str) -> str:
+    """
+    観戦者だけが入る Socket.IO ルーム名（プレイヤーのルームとは別）
+    """
+    return f'spectate:{room_id}'
+
+
+class SpectatorHub:
+    """
+    観戦者の管理と、観戦者向けの一斉送信
+
+    プレイヤーへの送信を終えたあとに broadcast() でイベントを積むだけにして、
+    実際の送信は1本のバックグラウンドタスクが順番に行う。観戦者が何百人いても
+    プレイヤー側のハンドラーは観戦者への送信ループを待たない。
+    送信は emit(event, data, to=グループ) 1回なので、python-socketio がペイロードを
+    1度だけエンコードして全員に同じパケットを使い回す（コールバックを付けない場合）。
+    """
+
+    def __init__(self, emit: Callable, close_room: Callable):
+        self._emit = emit
+        self._close_room = close_room
+        self._queue: "queue.Queue" = queue.Queue()
+        self._lock = threading.Lock()
+        self._running = False
+        self.rooms: Dict[str, Set[str]] = {}
+        self._room_of: Dict[str, str] = {}
+
+    def add(self, room_id: str, sid: str) -> None:
+        with self._lock:
+            self._discard(sid)
+            self.rooms.setdefault(room_id, set()).add(sid)
+            self._room_of[sid] = room_id
+
+    def remove(self, sid: str) -> Optional[str]:
+        """
+        観戦をやめた・切断した観戦者を外し、観戦していたルームIDを返す
+        """
+        with self._lock:
+            return self._discard(sid)
+
+    def _discard(self, sid: str) -> Optional[str]:
+        room_id = self._room_of.pop(sid, None)
+        if room_id is not None:
+            members = self.rooms.get(room_id)
+            if members is not None:
+                members.discard(sid)
+                if not members:
+                    del self.rooms[room_id]
+        return room_id
+
+    def is_spectator(self, room_id: str, sid: str) -> bool:
+        return self._room_of.get(sid) == room_id
+
+    def count(self, room_id: Optional[str] = None) -> int:
+        if room_id is None:
+            return len(self._room_of)
+        return len(self.rooms.get(room_id, ()))
+
+    def broadcast(self, room_id: str, event: str, data: Dict) -> None:
+        """
+        観戦者へのイベントを積む（観戦者がいなければ何もしない）
+
+        送信までの間にルームの状態が変わっても影響しないよう、積む時点の内容を複製しておく
+        """
+        if not self.rooms.get(room_id):
+            return
+        self._queue.put((spectator_group(room_id), event, copy.deepcopy(data)))
+
+    def close(self, room_id: str) -> None:
+        """
+        ルーム終了時に観戦者のグループを閉じる（積んであるイベントを送り終えてから）
+        """
+        with self._lock:
+            members = self.rooms.pop(room_id, set())
+            for sid in members:
+                self._room_of.pop(sid, None)
+        if members:
+            self._queue.put((spectator_group(room_id), _CLOSE, None))
+
+    def run(self) -> None:
+        """
+        送信ループ本体（バックグラウンドタスクとして1本だけ起動する）
+        """
+        while self._running:
+            try:
+                group, event, data = self._queue.get(timeout=1.0)
+            except queue.Empty:
+                continue
+            try:
+                if event is _CLOSE:
+                    self._close_room(group)
+                else:
+                    self._emit(event, data, to=group)
+            except Exception as e:
+                print(f"⚠️ 観戦者への送信に失敗しました: {e}")
+
+    def start(self, start_task: Callable) -> bool:
+        """
+        送信ループが未起動なら start_task(self.run) で起動する
+        """
+        with self._lock:
+            if self._running:
+                return False
+            self._running = True
+        start_task(self.run)
+        return True
+
+    def stop(self) -> None:
+        self._running = False
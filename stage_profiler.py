@@ -0,0 +1,168 @@
+"""
+CardGenerator の計測フック
+
+CardGenerator(profiler=...) には「段階名と画像パスを受け取ってコンテキストマネージャーを返す」
+呼び出し可能オブジェクトを渡す。段階名は batch / card / decode / analyze / canny / score /
+render / thumbnail / text / save。
+"""
+
+import cProfile
+import os
+import threading
+import time
+import tracemalloc
+from collections import deque
+from contextlib import ExitStack
+from datetime import datetime
+from typing import Callable, ContextManager, Dict, List, Optional
+
+
+class _TimedStage:
+    __slots__ = ('callback', 'stage', 'started')
+
+    def __init__(self, callback: Callable[[str, float], None], stage: str):
+        self.callback = callback
+        self.stage = stage
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.callback(self.stage, time.perf_counter() - self.started)
+        return False
+
+
+class TimingHook:
+    """
+    段階ごとの所要時間を callback(stage, seconds) に渡すだけの軽量フック
+    """
+
+    def __init__(self, callback: Callable[[str, float], None]):
+        self.callback = callback
+
+    def __call__(self, stage: str, image_path: str) -> ContextManager:
+        return _TimedStage(self.callback, stage)
+
+
+def combine_hooks(*hooks: Callable[[str, str], ContextManager]) -> Callable[[str, str], ContextManager]:
+    """
+    複数のフックを1つにまとめる（Noneは無視）
+    """
+    hooks = [hook for hook in hooks if hook is not None]
+    if len(hooks) == 1:
+        return hooks[0]
+
+    def combined(stage: str, image_path: str) -> ContextManager:
+        stack = ExitStack()
+        for hook in hooks:
+            stack.enter_context(hook(stage, image_path))
+        return stack
+
+    return combined
+
+
+class _ProfiledStage:
+    def __init__(self, profiler: 'StageProfiler', stage: str, image_path: str):
+        self.profiler = profiler
+        self.stage = stage
+        self.image_path = image_path
+
+    def __enter__(self):
+        self.profiler._enter(self)
+        self.memory_before = tracemalloc.get_traced_memory()[0] if self.profiler.track_memory else 0
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        elapsed = time.perf_counter() - self.started
+        memory_delta = tracemalloc.get_traced_memory()[0] - self.memory_before if self.profiler.track_memory else None
+        self.profiler._exit(self, elapsed, memory_delta)
+        return False
+
+
+class StageProfiler:
+    """
+    カード1枚ごとの段階別の所要時間・メモリ増減を集めるコレクター
+
+    track_memory=True でtracemallocによるメモリ増減も記録する（その分遅くなる）。
+    profile_next_batches(n) を呼ぶと、次のn回の generate_cards_batch を
+    cProfileで計測して dump_dir に .pstats として書き出す。
+    """
+
+    def __init__(self, track_memory: bool = False, dump_dir: str = 'profiles',
+                 max_reports: int = 1000, on_card: Optional[Callable[[Dict], None]] = None):
+        self.track_memory = track_memory
+        self.dump_dir = dump_dir
+        self.on_card = on_card
+        self.reports = deque(maxlen=max_reports)
+        self.dumps: List[str] = []
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._batches_to_profile = 0
+
+        if track_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+    def __call__(self, stage: str, image_path: str) -> ContextManager:
+        return _ProfiledStage(self, stage, image_path)
+
+    def profile_next_batches(self, count: int = 1) -> None:
+        with self._lock:
+            self._batches_to_profile += count
+
+    def _enter(self, stage: _ProfiledStage) -> None:
+        if stage.stage == 'card':
+            self._local.card = {'image_path': stage.image_path, 'stages': {}}
+        elif stage.stage == 'batch':
+            stage.cprofile = None
+            with self._lock:
+                if self._batches_to_profile > 0:
+                    self._batches_to_profile -= 1
+                    stage.cprofile = cProfile.Profile()
+            if stage.cprofile is not None:
+                stage.cprofile.enable()
+
+    def _exit(self, stage: _ProfiledStage, elapsed: float, memory_delta: Optional[int]) -> None:
+        if stage.stage == 'batch':
+            if stage.cprofile is not None:
+                stage.cprofile.disable()
+                self._dump(stage.cprofile)
+            return
+
+        card = getattr(self._local, 'card', None)
+        if card is None:
+            return
+
+        record = card['stages'].setdefault(stage.stage, {'seconds': 0.0, 'memory_delta': None})
+        record['seconds'] += elapsed
+        if memory_delta is not None:
+            record['memory_delta'] = (record['memory_delta'] or 0) + memory_delta
+
+        if stage.stage == 'card':
+            self._local.card = None
+            self.reports.append(card)
+            if self.on_card is not None:
+                self.on_card(card)
+
+    def _dump(self, profile: cProfile.Profile) -> None:
+        os.makedirs(self.dump_dir, exist_ok=True)
+        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S_%f')
+        dump_path = os.path.join(self.dump_dir, f'batch_{timestamp}.pstats')
+        profile.dump_stats(dump_path)
+        self.dumps.append(dump_path)
+
+    def summary(self) -> Dict[str, Dict]:
+        """
+        記録済みカードの段階別集計（件数・合計・平均・最大）
+        """
+        totals: Dict[str, Dict] = {}
+        for card in list(self.reports):
+            for stage, record in card['stages'].items():
+                total = totals.setdefault(stage, {'count': 0, 'total_seconds': 0.0, 'max_seconds': 0.0})
+                total['count'] += 1
+                total['total_seconds'] += record['seconds']
+                total['max_seconds'] = max(total['max_seconds'], record['seconds'])
+        for total in totals.values():
+            total['mean_seconds'] = total['total_seconds'] / total['count']
+        return totals
@@ -0,0 +1,129 @@
+import gzip
+import hashlib
+import os
+from typing import Dict, List, Optional
+
+from flask import Response, redirect
+
+try:
+    import brotli
+except ImportError:  # brotli は任意（未インストールなら gzip のみ）
+    brotli = None
+
+# フィンガープリント付きURLのキャッシュ期間（1年）
+IMMUTABLE_MAX_AGE = 365 * 24 * 60 * 60
+
+
+def parse_accept_encoding(header: Optional[str]) -> Dict[str, float]:
+    """
+    Accept-Encoding を {エンコーディング: q値} に変換
+    """
+    encodings = {}
+    for part in (header or '').split(','):
+        name, _, params = part.strip().partition(';')
+        name = name.strip().lower()
+        if not name:
+            continue
+        quality = 1.0
+        params = params.strip()
+        if params.startswith('q='):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        encodings[name] = quality
+    return encodings
+
+
+class StaticPage:
+    def __init__(self, filename: str, body: bytes):
+        self.filename = filename
+        digest = hashlib.sha256(body).hexdigest()[:20]
+        # 表現ごとに別のETagを付ける（gzip と identity を取り違えないように）
+        self.variants = {'identity': (body, f'"{digest}"')}
+        self.variants['gzip'] = (gzip.compress(body, 9, mtime=0), f'"{digest}-gz"')
+        if brotli is not None:
+            self.variants['br'] = (brotli.compress(body, quality=11), f'"{digest}-br"')
+
+    def select(self, accept_encoding: Optional[str]) -> str:
+        """
+        Accept-Encoding に合う最も小さい表現を選ぶ
+        """
+        accepted = parse_accept_encoding(accept_encoding)
+        wildcard = accepted.get('*', 0.0)
+        for encoding in ('br', 'gzip'):
+            if encoding in self.variants and accepted.get(encoding, wildcard) > 0:
+                return encoding
+        return 'identity'
+
+
+class StaticPages:
+    """
+    HTMLページ（インラインのCSS/JSを含む）を起動時に一度だけ圧縮してメモリに保持する
+
+    - 全ページの内容から作ったフィンガープリントで /pages/<fingerprint>/<ページ> を提供し、
+      長期キャッシュ（immutable）を許可する
+    - 各ページに <base href="/pages/<fingerprint>/"> を埋め込むので、ページ間の相対リンク
+      （battle.html?room=... など）は自動的にフィンガープリント付きURLになる
+    - 入口のURL（/ や /battle）は no-cache + ETag で毎回検証させる
+    - head_html があれば <base> の直後に埋め込む（フィンガープリントにも含める）
+    """
+
+    def __init__(self, directory: str, filenames: List[str], url_prefix: str = '/pages',
+                 head_html: str = ''):
+        self.url_prefix = url_prefix
+        sources = {}
+        build_hash = hashlib.sha256(head_html.encode('utf-8'))
+        for filename in filenames:
+            with open(os.path.join(directory, filename), 'rb') as f:
+                sources[filename] = f.read()
+            build_hash.update(filename.encode('utf-8') + b'\0' + sources[filename])
+        self.fingerprint = build_hash.hexdigest()[:12]
+
+        base_tag = f'<head>\n    <base href="{self.base_url}">'
+        if head_html:
+            base_tag += f'\n    {head_html}'
+        base_tag = base_tag.encode('utf-8')
+        self.pages = {filename: StaticPage(filename, source.replace(b'<head>', base_tag, 1))
+                      for filename, source in sources.items()}
+
+    @property
+    def base_url(self) -> str:
+        return f'{self.url_prefix}/{self.fingerprint}/'
+
+    def url_for(self, filename: str) -> str:
+        return self.base_url + filename
+
+    def response(self, filename: str, request, immutable: bool = False) -> Response:
+        """
+        Accept-Encoding に応じた表現を返す（If-None-Match が一致すれば304）
+        """
+        page = self.pages[filename]
+        encoding = page.select(request.headers.get('Accept-Encoding'))
+        body, etag = page.variants[encoding]
+
+        if immutable:
+            cache_control = f'public, max-age={IMMUTABLE_MAX_AGE}, immutable'
+        else:
+            cache_control = 'no-cache'
+
+        if_none_match = request.headers.get('If-None-Match', '')
+        matched = any(tag.strip().removeprefix('W/') in (etag, '*') for tag in if_none_match.split(','))
+        response = Response(status=304) if matched else Response(body, mimetype='text/html')
+        response.headers['ETag'] = etag
+        response.headers['Cache-Control'] = cache_control
+        response.headers['Vary'] = 'Accept-Encoding'
+        if not matched and encoding != 'identity':
+            response.headers['Content-Encoding'] = encoding
+        return response
+
+    def fingerprinted_response(self, fingerprint: str, filename: str, request) -> Response:
+        """
+        /pages/<fingerprint>/<ページ> の応答（古いフィンガープリントは現在のURLへ転送）
+        """
+        if fingerprint != self.fingerprint:
+            target = self.url_for(filename)
+            if request.query_string:
+                target += '?' + request.query_string.decode('utf-8')
+            return redirect(target)
+        return self.response(filename, request, immutable=True)
@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+"""
+カード生成の受付制御のテスト
+"""
+
+import threading
+import time
+
+from admission import AdmissionController, Overloaded
+
+
+def _run_jobs(controller, count):
+    """
+    count 件を到着順に投入し、(同時実行数の最大値, 実行を始めた順) を返す
+    """
+    lock = threading.Lock()
+    running, peak, started = [0], [0], []
+    release = threading.Event()
+
+    def job(index):
+        with controller.admit():
+            with lock:
+                running[0] += 1
+                peak[0] = max(peak[0], running[0])
+                started.append(index)
+            release.wait()
+            with lock:
+                running[0] -= 1
+
+    threads = []
+    for index in range(count):
+        thread = threading.Thread(target=job, args=(index,))
+        thread.start()
+        threads.append(thread)
+        # 到着順を決めるため、前のスレッドが実行中か待ち行列に入るまで待つ
+        while controller.in_flight() + controller.queued() < index + 1:
+            time.sleep(0.001)
+
+    status = controller.status()
+    assert status['in_flight'] == controller.max_concurrent
+    assert status['queued'] == count - controller.max_concurrent
+    release.set()
+    for thread in threads:
+        thread.join()
+    assert controller.status()['in_flight'] == 0 and controller.admitted == count
+    return peak[0], started
+
+
+def test_limits_concurrency_and_keeps_arrival_order():
+    """
+    同時実行数を超えた分は到着順に待ち、同時に実行されるのは max_concurrent 件まで
+    """
+    peak, started = _run_jobs(AdmissionController(max_concurrent=2, max_queue=10), 6)
+    assert peak == 2 and sorted(started) == list(range(6))
+
+    # 1件ずつなら実行を始める順番は到着順と同じ
+    peak, started = _run_jobs(AdmissionController(max_concurrent=1, max_queue=10), 5)
+    assert peak == 1 and started == list(range(5))
+
+
+def test_rejects_immediately_when_queue_is_full():
+    """
+    実行枠も待ち行列も埋まっていたら待たずに Overloaded（Retry-After と見積もり待ち時間付き）
+    """
+    controller = AdmissionController(max_concurrent=1, max_queue=1, initial_service_time=2.0)
+    release = threading.Event()
+
+    def hold():
+        with controller.admit():
+            release.wait()
+
+    threads = [threading.Thread(target=hold) for _ in range(2)]
+    for thread in threads:
+        thread.start()
+    while controller.queued() < 1:
+        time.sleep(0.001)
+    assert controller.saturated()
+
+    started = time.perf_counter()
+    try:
+        with controller.admit():
+            raise AssertionError('満杯なのに受け付けられた')
+    except Overloaded as e:
+        assert e.status_code == 503
+        # 実行中1件 + 待ち1件が先にあるので、2件分の処理時間を待つ見積もり
+        assert e.estimated_wait == 4.0 and e.retry_after == 4
+    assert time.perf_counter() - started < 0.5
+    assert controller.rejected == 1
+
+    release.set()
+    for thread in threads:
+        thread.join()
+    assert not controller.saturated() and controller.estimated_wait() == 0.0
+
+
+def test_service_time_average_follows_recent_requests():
+    controller = AdmissionController(max_concurrent=1, max_queue=0, initial_service_time=1.0)
+    for _ in range(30):
+        with controller.admit():
+            pass
+    assert controller.average_service_time < 0.01
+
+
+if __name__ == "__main__":
+    test_limits_concurrency_and_keeps_arrival_order()
+    test_rejects_immediately_when_queue_is_full()
+    test_service_time_average_follows_recent_requests()
+    print("✅ カード生成の受付制御のテスト完了")
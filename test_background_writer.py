@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+"""
+バックグラウンド書き込みキューのテスト
+"""
+
+import threading
+from unittest import mock
+
+import background_writer
+from background_writer import BackgroundWriter
+
+
+class FlakyStore:
+    """
+    fail_times 回だけ書き込みに失敗する書き込み先
+    """
+
+    def __init__(self, fail_times: int = 0):
+        self.fail_times = fail_times
+        self.batches = []
+
+    def write_batch(self, items, retrying):
+        if self.fail_times > 0:
+            self.fail_times -= 1
+            raise OSError('disk full')
+        self.batches.append((list(items), retrying))
+
+
+def test_failed_batch_is_kept_and_retried_first():
+    """
+    失敗した項目は捨てずに持ち、次の書き込みで先頭から書き直してから完了にする
+    """
+    store = FlakyStore(fail_times=1)
+    writer = BackgroundWriter(store.write_batch, (OSError,), 'テストの書き込み', max_batch=3)
+    for item in range(4):
+        writer.put(item)
+
+    try:
+        writer.write_pending()
+        assert False, 'OSError が発生するはず'
+    except OSError:
+        pass
+    assert writer.pending() == 4 and writer.write_failures == 1
+    assert writer._queue.unfinished_tasks == 4
+
+    writer.put(4)
+    assert writer.write_pending() == 3
+    assert writer.write_pending() == 2
+    assert writer.write_pending() == 0
+    assert store.batches == [([0, 1, 2], True), ([3, 4], False)]
+    assert writer.pending() == 0 and writer._queue.unfinished_tasks == 0
+
+
+def test_other_errors_are_not_retried():
+    def broken(items, retrying):
+        raise ValueError('bug')
+
+    writer = BackgroundWriter(broken, (OSError,), 'テストの書き込み', max_batch=8)
+    writer.put('a')
+    try:
+        writer.write_pending()
+        assert False, 'ValueError が発生するはず'
+    except ValueError:
+        pass
+    assert writer.write_failures == 0
+
+
+def test_background_writer_backs_off_and_flush_times_out():
+    """
+    書き込みタスクは失敗が続く間は間隔を空けて再試行し、flush は書き終わるまで（timeout まで）待つ
+    """
+    store = FlakyStore(fail_times=10 ** 6)
+    writer = BackgroundWriter(store.write_batch, (OSError,), 'テストの書き込み', max_batch=8)
+    threads = []
+    with mock.patch.object(background_writer, 'RETRY_DELAY', 0.05):
+        started = writer.start(lambda target: threads.append(threading.Thread(target=target, daemon=True))
+                               or threads[-1].start())
+        assert started and not writer.start(lambda target: None)
+        writer.put('a')
+        assert not writer.flush(timeout=0.3)
+        assert writer.pending() == 1 and writer.write_failures >= 1
+        store.fail_times = 0
+        assert writer.flush(timeout=5.0)
+    writer.stop()
+    threads[0].join(timeout=5)
+    assert [items for items, _ in store.batches] == [['a']]
+
+
+def test_flush_writes_inline_when_not_started():
+    store = FlakyStore()
+    writer = BackgroundWriter(store.write_batch, (OSError,), 'テストの書き込み', max_batch=2)
+    for item in range(5):
+        writer.put(item)
+    assert writer.flush()
+    assert [items for items, _ in store.batches] == [[0, 1], [2, 3], [4]]
+
+
+if __name__ == "__main__":
+    test_failed_batch_is_kept_and_retried_first()
+    test_other_errors_are_not_retried()
+    test_background_writer_backs_off_and_flush_times_out()
+    test_flush_writes_inline_when_not_started()
+    print("✅ バックグラウンド書き込みキューのテスト完了")
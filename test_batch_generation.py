@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+"""
+一括生成CLI（画像の収集・チェックポイント・再開）のテスト
+"""
+
+import json
+import os
+import shutil
+import tempfile
+
+from card_generator import (card_filename_for, collect_image_paths, load_checkpoint,
+                            normalize_image_path, run_batch)
+from test_card_generator import create_test_images
+
+
+def _photo_tree() -> str:
+    root = tempfile.mkdtemp()
+    create_test_images(os.path.join(root, 'photos'))
+    os.makedirs(os.path.join(root, 'photos', 'nested'))
+    shutil.copy(os.path.join(root, 'photos', 'fire_image.jpg'), os.path.join(root, 'photos', 'nested', 'copy.JPG'))
+    with open(os.path.join(root, 'photos', 'notes.txt'), 'w') as f:
+        f.write('not an image')
+    return root
+
+
+def test_collect_image_paths():
+    """
+    ディレクトリ・glob・ファイルのどれで指定しても、正規化した同じパスになる
+    """
+    root = _photo_tree()
+    photos = os.path.join(root, 'photos')
+    from_directory = collect_image_paths([photos])
+    assert len(from_directory) == 4
+    assert all(os.path.isabs(path) for path in from_directory)
+    assert normalize_image_path(os.path.join(photos, 'nested', 'copy.JPG')) in from_directory
+
+    cwd = os.getcwd()
+    os.chdir(root)
+    try:
+        assert collect_image_paths(['./photos/**/*.*']) == from_directory
+        assert collect_image_paths(['photos/../photos', 'photos/fire_image.jpg']) == from_directory
+    finally:
+        os.chdir(cwd)
+    assert card_filename_for(os.path.join(photos, 'nested', '..', 'fire_image.jpg')) == \
+        card_filename_for(os.path.join(photos, 'fire_image.jpg'))
+
+
+def test_load_checkpoint():
+    """
+    成功した行だけを正規化したパスで読み、失敗・途中で切れた行は無視する
+    """
+    root = _photo_tree()
+    results_path = os.path.join(root, 'cards_info.jsonl')
+    fire = os.path.join(root, 'photos', 'fire_image.jpg')
+    with open(results_path, 'w', encoding='utf-8') as f:
+        f.write(json.dumps({'image_path': os.path.join(root, 'photos', '.', 'fire_image.jpg')}) + '\n')
+        f.write(json.dumps({'image_path': os.path.join(root, 'photos', 'water_image.jpg'), 'error': 'broken'}) + '\n')
+        f.write('{"image_path": "trunc')
+    assert load_checkpoint(results_path) == {normalize_image_path(fire)}
+    assert load_checkpoint(os.path.join(root, 'missing.jsonl')) == set()
+
+
+def test_resume_from_another_directory():
+    """
+    別の作業ディレクトリ・別の glob で再開しても、生成済みの画像は飛ばす
+    """
+    root = _photo_tree()
+    output_dir = os.path.join(root, 'cards')
+    first = run_batch([os.path.join(root, 'photos')], output_dir, workers=1)
+    assert (first['total'], first['generated'], first['failed']) == (4, 4, 0)
+    with open(first['results_path'], encoding='utf-8') as f:
+        records = [json.loads(line) for line in f]
+    assert all(os.path.exists(os.path.join(output_dir, card_filename_for(r['image_path']))) for r in records)
+
+    # 中断で末尾の行が切れた状態から、新しい画像を1枚足して別の場所から再開する
+    with open(first['results_path'], 'a', encoding='utf-8') as f:
+        f.write('{"image_path": "trunc')
+    shutil.copy(os.path.join(root, 'photos', 'water_image.jpg'), os.path.join(root, 'photos', 'nested', 'new.png'))
+    cwd = os.getcwd()
+    os.chdir(os.path.join(root, 'photos', 'nested'))
+    try:
+        second = run_batch(['../**/*.*'], '../../cards', workers=1, resume=True)
+    finally:
+        os.chdir(cwd)
+    assert (second['total'], second['skipped'], second['generated']) == (5, 4, 1)
+
+    with open(first['results_path'], encoding='utf-8') as f:
+        lines = f.read().splitlines()
+    assert lines[-2] == '{"image_path": "trunc'
+    assert json.loads(lines[-1])['image_path'] == normalize_image_path(os.path.join(root, 'photos', 'nested', 'new.png'))
+
+
+if __name__ == "__main__":
+    test_collect_image_paths()
+    test_load_checkpoint()
+    test_resume_from_another_directory()
+    print("✅ 一括生成CLIのテスト完了")
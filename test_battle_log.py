@@ -0,0 +1,176 @@
+#!/usr/bin/env python3
+"""
+バトルログ（追記専用 JSON Lines）のテスト
+"""
+
+import json
+import os
+import tempfile
+import threading
+from unittest import mock
+
+from battle_log import FINISHED, ROUND, BattleLog, battle_summary
+
+
+def sample_result(round_number, winner='sid-a'):
+    card = {'id': round_number, 'name': f'card{round_number}', 'attribute': '火', 'attack_power': 50,
+            'card_image_url': f'/cards/x/{round_number}.png', 'features': {'complexity': 0.5}}
+    battle_power = {'base_power': 50, 'effective_power': 60, 'multiplier': 1.2}
+    return {
+        'round': round_number,
+        'players': {'sid-a': {'card': card, 'battle_power': battle_power, 'player_id': 'sid-a'},
+                    'sid-b': {'card': dict(card), 'battle_power': battle_power, 'player_id': 'sid-b'}},
+        'winner': winner, 'winner_card': card, 'loser_card': card,
+        'scores': {'sid-a': round_number, 'sid-b': 0}, 'is_draw': False,
+        'battle_timestamp': '2026-10-19T12:00:00', 'room_id': 'ROOM1',
+    }
+
+
+def test_replay_latest_finished_match():
+    """
+    ログは呼び出し時点の内容で残り、リプレイは最後に終了した試合だけを記録順に返す
+    """
+    path = os.path.join(tempfile.mkdtemp(), 'logs', 'battles.jsonl')
+    log = BattleLog(path)
+
+    result = sample_result(1)
+    log.append('ROOM1', 'match-1', ROUND, result)
+    result['players']['sid-a']['card']['used'] = False  # 積んだあとの変更はログに影響しない
+    log.append('ROOM10', 'other', ROUND, sample_result(1))
+    log.append('ROOM1', 'match-1', ROUND, sample_result(2))
+    log.append('ROOM1', 'match-1', FINISHED, {'winner': 'sid-a'})
+    log.append('ROOM1', 'match-2', ROUND, sample_result(1))
+    assert log.pending() == 5
+
+    log.flush()
+    assert log.pending() == 0
+    assert log.records_written == 5
+    assert log.fsyncs == 1
+
+    records = list(log.replay('ROOM1'))
+    assert [(r['match_id'], r['kind']) for r in records] == [
+        ('match-1', ROUND), ('match-1', ROUND), ('match-1', FINISHED)]
+    assert 'used' not in records[0]['data']['players']['sid-a']['card']
+    assert [r['kind'] for r in log.replay('ROOM1', 'match-2')] == [ROUND]
+    assert list(log.replay('ROOM2')) == []
+
+    matches = log.matches('ROOM1')
+    assert [(m['match_id'], m['rounds'], m['finished']) for m in matches] == [
+        ('match-1', 2, True), ('match-2', 1, False)]
+
+
+def test_background_writer_and_torn_line():
+    path = os.path.join(tempfile.mkdtemp(), 'battles.jsonl')
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write('{"room_id": "ROOM1", "match_id": "old", "kin')  # 途中で止まった行
+
+    log = BattleLog(path)
+    threads = []
+    log.start(lambda target: threads.append(threading.Thread(target=target, daemon=True)) or threads[-1].start())
+    log.append('ROOM1', 'match-1', ROUND, sample_result(1))
+    log.append('ROOM1', 'match-1', FINISHED, {'winner': 'sid-a'})
+    log.flush()
+    log.stop()
+    threads[0].join(timeout=5)
+
+    assert [r['kind'] for r in log.replay('ROOM1')] == [ROUND, FINISHED]
+    with open(path, encoding='utf-8') as f:
+        assert json.loads(f.read().splitlines()[-1])['kind'] == FINISHED
+
+
+def test_failed_write_is_retried():
+    """
+    書き込みに失敗したら書きかけの部分を切り詰め、書き直した行だけが索引に入る
+    """
+    path = os.path.join(tempfile.mkdtemp(), 'battles.jsonl')
+    log = BattleLog(path)
+    log.append('ROOM1', 'match-1', ROUND, sample_result(1))
+    log.flush()
+    size = os.path.getsize(path)
+
+    log.append('ROOM1', 'match-1', ROUND, sample_result(2))
+    log.append('ROOM1', 'match-1', FINISHED, {'winner': 'sid-a'})
+    with mock.patch('os.fsync', side_effect=OSError('disk full')):
+        try:
+            log.write_pending()
+            assert False, 'OSError が発生するはず'
+        except OSError:
+            pass
+    assert log.pending() == 2 and log.write_failures == 1
+    assert os.path.getsize(path) == size
+    assert [r['data']['round'] for r in log.replay('ROOM1', 'match-1')] == [1]
+
+    log.append('ROOM1', 'match-2', ROUND, sample_result(1))
+    assert log.write_pending() == 3
+    assert log.pending() == 0
+    assert [(r['match_id'], r['kind']) for r in log.replay('ROOM1')] == [
+        ('match-1', ROUND), ('match-1', ROUND), ('match-1', FINISHED)]
+    with open(path, encoding='utf-8') as f:
+        assert len(f.read().splitlines()) == 4
+
+
+def test_retry_after_failed_truncate_starts_on_a_new_line():
+    """
+    書きかけの行を切り詰められなかったときも、書き直す行は新しい行から始まりリプレイから消えない
+    """
+    path = os.path.join(tempfile.mkdtemp(), 'battles.jsonl')
+    log = BattleLog(path)
+    log.append('ROOM1', 'match-1', ROUND, sample_result(1))
+    log.flush()
+    size = os.path.getsize(path)
+
+    def torn_fsync(fd):
+        os.ftruncate(fd, size + 20)  # 行の途中までしか書けなかった
+        raise OSError('disk full')
+
+    log.append('ROOM1', 'match-1', ROUND, sample_result(2))
+    with mock.patch('os.fsync', side_effect=torn_fsync), mock.patch.object(log, '_truncate'):
+        try:
+            log.write_pending()
+            assert False, 'OSError が発生するはず'
+        except OSError:
+            pass
+    assert os.path.getsize(path) == size + 20
+
+    assert log.write_pending() == 1
+    assert [r['data']['round'] for r in log.replay('ROOM1', 'match-1')] == [1, 2]
+    assert [r['data']['round'] for r in BattleLog(path).replay('ROOM1', 'match-1')] == [1, 2]
+
+
+def test_index_is_rebuilt_at_startup():
+    """
+    再起動後もルームごとの索引から、そのルームの行だけを読んでリプレイする
+    """
+    path = os.path.join(tempfile.mkdtemp(), 'battles.jsonl')
+    log = BattleLog(path)
+    for i in range(50):
+        log.append(f'ROOM{i % 5}', f'match-{i % 5}', ROUND, sample_result(i))
+    log.append('ROOM3', 'match-3', FINISHED, {'winner': 'sid-b'})
+    log.flush()
+
+    reopened = BattleLog(path)
+    assert {room: list(offsets) for room, offsets in reopened._offsets.items()} == \
+        {room: list(offsets) for room, offsets in log._offsets.items()}
+    assert len(reopened._offsets['ROOM3']) == 11
+    records = list(reopened.replay('ROOM3'))
+    assert [r['data']['round'] for r in records[:-1]] == list(range(3, 50, 5))
+    assert records[-1]['kind'] == FINISHED
+    assert list(reopened.replay('ROOM1')) == []  # 終了した試合がない
+
+
+def test_battle_summary_keeps_display_fields():
+    summary = battle_summary(sample_result(2))
+    assert summary['players']['sid-a']['card'] == {
+        'id': 2, 'name': 'card2', 'attribute': '火', 'attack_power': 50, 'card_image_url': '/cards/x/2.png'}
+    assert summary['players']['sid-a']['battle_power'] == {'effective_power': 60}
+    assert summary['winner'] == 'sid-a' and summary['scores'] == {'sid-a': 2, 'sid-b': 0}
+
+
+if __name__ == "__main__":
+    test_replay_latest_finished_match()
+    test_background_writer_and_torn_line()
+    test_failed_write_is_retried()
+    test_retry_after_failed_truncate_starts_on_a_new_line()
+    test_index_is_rebuilt_at_startup()
+    test_battle_summary_keeps_display_fields()
+    print("✅ バトルログのテスト完了")
@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+"""
+カードコレクションのテスト
+"""
+
+import os
+import random
+import sqlite3
+import tempfile
+
+from card_collection import CardCollection, CollectionError
+
+
+def make_cards(folder, count, rng):
+    cards = []
+    for i in range(count):
+        card_path = os.path.join(folder, f'generated_{i}.png')
+        with open(card_path, 'wb') as f:
+            f.write(b'\x89PNG' + bytes([i % 256]))
+        attribute = rng.choice(['火', '水', '土'])
+        attack_power = rng.randint(10, 100)
+        cards.append({
+            'name': f'photo_{i}', 'attribute': attribute, 'attack_power': attack_power,
+            'image_path': f'/uploads/x/photo_{i}.jpg', 'card_path': card_path,
+            'features': {'complexity': 0.5},
+            'game_data': {'id': None, 'attack_power': attack_power, 'attribute': attribute,
+                          'attribute_en': 'fire', 'effectiveness_multipliers': {}, 'used': False,
+                          'card_image_url': None},
+        })
+    return cards
+
+
+def collect_pages(collection, player_id, **filters):
+    cards, cursor = collection.query(player_id, limit=7, **filters)
+    pages = [cards]
+    while cursor is not None:
+        cards, cursor = collection.query(player_id, limit=7, cursor=cursor, **filters)
+        pages.append(cards)
+    return [card for page in pages for card in page]
+
+
+def test_cursor_pagination_matches_sorted_query():
+    """
+    カーソルで全ページをたどると、絞り込み・並び替えた全件と重複・欠落なく一致する
+    """
+    folder = tempfile.mkdtemp()
+    collection = CardCollection(os.path.join(folder, 'cards.sqlite3'), os.path.join(folder, 'images'))
+    rng = random.Random(3)
+    all_cards = make_cards(folder, 60, rng)
+    for start in range(0, 60, 3):
+        collection.add_cards('alice', all_cards[start:start + 3], created_at=1000.0 + start // 3)
+    collection.add_cards('bob', make_cards(folder, 3, rng))
+    assert collection.count('alice') == 60
+
+    pages = collect_pages(collection, 'alice', sort='attack_power')
+    expected = sorted(pages, key=lambda card: (card['attack_power'], card['card_id']), reverse=True)
+    assert pages == expected and len(pages) == 60
+
+    fire = collect_pages(collection, 'alice', attribute='fire', sort='created_at', descending=False)
+    assert fire and all(card['attribute'] == '火' for card in fire)
+    assert fire == sorted(fire, key=lambda card: (card['created_at'], card['card_id']))
+    assert len(fire) == sum(1 for card in all_cards if card['attribute'] == '火')
+
+    strong = collect_pages(collection, 'alice', min_attack=50, max_attack=80, since=1005.0)
+    assert all(50 <= card['attack_power'] <= 80 and card['created_at'] >= 1005.0 for card in strong)
+    assert len(strong) == sum(1 for i, card in enumerate(all_cards)
+                              if 50 <= card['attack_power'] <= 80 and 1000.0 + i // 3 >= 1005.0)
+
+
+def test_build_deck_reuses_stored_images():
+    folder = tempfile.mkdtemp()
+    collection = CardCollection(os.path.join(folder, 'cards.sqlite3'), os.path.join(folder, 'images'))
+    cards = make_cards(folder, 4, random.Random(1))
+    card_ids = collection.add_cards('alice', cards)
+    for card in cards:
+        os.remove(card['card_path'])  # セッションのファイルが消えてもコレクションの画像は残る
+
+    deck_folder = os.path.join(folder, 'deck')
+    deck = collection.build_deck('alice', [card_ids[3], card_ids[0], card_ids[1]], deck_folder)
+    assert [card['name'] for card in deck] == ['photo_3', 'photo_0', 'photo_1']
+    assert 'image_path' not in deck[0] and deck[0]['game_data']['attack_power'] == cards[3]['attack_power']
+    with open(os.path.join(deck_folder, 'card_1.png'), 'rb') as f:
+        assert f.read() == b'\x89PNG\x03'
+
+    for bad_ids in ([card_ids[0], card_ids[0], card_ids[1]], [card_ids[0], 9999, card_ids[1]]):
+        try:
+            collection.build_deck('alice', bad_ids, deck_folder)
+            assert False, 'CollectionError が発生するはず'
+        except CollectionError:
+            pass
+    try:
+        collection.build_deck('bob', card_ids[:3], deck_folder)
+        assert False, '他のプレイヤーのカードは使えない'
+    except CollectionError as e:
+        assert e.status_code == 404
+
+
+def test_image_keys_are_unguessable():
+    """
+    画像は card_id ではなく推測できない image_key で引き、古いDBの既存カードにも鍵を付ける
+    """
+    folder = tempfile.mkdtemp()
+    db_path = os.path.join(folder, 'cards.sqlite3')
+    connection = sqlite3.connect(db_path)
+    connection.execute('CREATE TABLE cards (card_id INTEGER PRIMARY KEY, player_id TEXT NOT NULL, '
+                       'name TEXT NOT NULL, attribute INTEGER NOT NULL, attack_power INTEGER NOT NULL, '
+                       'created_at REAL NOT NULL, metadata TEXT NOT NULL)')
+    connection.execute("INSERT INTO cards VALUES (1, 'old', 'photo', 0, 50, 1.0, '{}')")
+    connection.commit()
+    connection.close()
+
+    collection = CardCollection(db_path, os.path.join(folder, 'images'))
+    card_ids = collection.add_cards('alice', make_cards(folder, 3, random.Random(2)))
+    cards, _ = collection.query('alice')
+    keys = {card['card_id']: card['image_key'] for card in cards}
+    assert len(set(keys.values())) == 3 and all(len(key) >= 20 for key in keys.values())
+    assert collection.image_path_for_key(keys[card_ids[1]]) == collection.image_path('alice', card_ids[1])
+    assert collection.image_path_for_key(str(card_ids[1])) is None
+
+    old_cards, _ = collection.query('old')
+    assert old_cards[0]['image_key'] and old_cards[0]['image_key'] not in keys.values()
+    # 開き直しても鍵は変わらない
+    reopened = CardCollection(db_path, os.path.join(folder, 'images'))
+    assert reopened.query('old')[0][0]['image_key'] == old_cards[0]['image_key']
+
+
+def test_invalid_query_arguments():
+    folder = tempfile.mkdtemp()
+    collection = CardCollection(os.path.join(folder, 'cards.sqlite3'), os.path.join(folder, 'images'))
+    for kwargs in ({'sort': 'name'}, {'cursor': 'not-a-cursor'}, {'attribute': 'wind'}):
+        try:
+            collection.query('alice', **kwargs)
+            assert False, kwargs
+        except CollectionError as e:
+            assert e.status_code == 400
+
+
+if __name__ == "__main__":
+    test_cursor_pagination_matches_sorted_query()
+    test_build_deck_reuses_stored_images()
+    test_image_keys_are_unguessable()
+    test_invalid_query_arguments()
+    print("✅ カードコレクションのテスト完了")
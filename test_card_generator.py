@@ -10,53 +10,59 @@ import requests
 from PIL import Image, ImageDraw
 import numpy as np
 
-def create_test_images():
+def create_test_images(test_dir="test_images", size=(300, 300)):
     """
-    テスト用の画像を生成
+    テスト用の画像を生成（sizeを変えると同じ図柄を拡大して描く）
     """
-    test_dir = "test_images"
     os.makedirs(test_dir, exist_ok=True)
     
+    width, height = size
+    sx = width / 300
+    sy = height / 300
+    
+    def box(x1, y1, x2, y2):
+        return [int(x1 * sx), int(y1 * sy), int(x2 * sx), int(y2 * sy)]
+    
     print("テスト画像生成中...")
     
     try:
         # 火属性画像（赤系・複雑）
-        img1 = Image.new('RGB', (300, 300))
+        img1 = Image.new('RGB', (width, height))
         draw1 = ImageDraw.Draw(img1)
-        draw1.rectangle([0, 0, 300, 300], fill=(200, 50, 50))
+        draw1.rectangle(box(0, 0, 300, 300), fill=(200, 50, 50))
         for i in range(10):
             x = i * 30
             y = i * 30
-            draw1.rectangle([x, y, x+20, y+20], fill=(255, 100, 0))
-            draw1.ellipse([x+10, y+10, x+25, y+25], fill=(255, 200, 0))
+            draw1.rectangle(box(x, y, x+20, y+20), fill=(255, 100, 0))
+            draw1.ellipse(box(x+10, y+10, x+25, y+25), fill=(255, 200, 0))
         np.random.seed(1)
         for _ in range(20):
             x1, y1 = np.random.randint(0, 300), np.random.randint(0, 300)
             x2, y2 = np.random.randint(0, 300), np.random.randint(0, 300)
-            draw1.line([x1, y1, x2, y2], fill=(255, 150, 0), width=2)
+            draw1.line(box(x1, y1, x2, y2), fill=(255, 150, 0), width=max(2, int(2 * sx)))
         img1.save(os.path.join(test_dir, "fire_image.jpg"))
         
         # 水属性画像（青系・シンプル）
-        img2 = Image.new('RGB', (300, 300))
+        img2 = Image.new('RGB', (width, height))
         draw2 = ImageDraw.Draw(img2)
-        draw2.rectangle([0, 0, 300, 300], fill=(50, 100, 200))
+        draw2.rectangle(box(0, 0, 300, 300), fill=(50, 100, 200))
         for y in range(0, 300, 40):
             for x in range(0, 300, 30):
                 wave_offset = int(15 * np.sin(x * 0.02))
-                draw2.ellipse([x, y + wave_offset, x+20, y + wave_offset + 20], 
+                draw2.ellipse(box(x, y + wave_offset, x+20, y + wave_offset + 20), 
                              fill=(100, 150, 255))
         img2.save(os.path.join(test_dir, "water_image.jpg"))
         
         # 土属性画像（緑・茶系・中程度）
-        img3 = Image.new('RGB', (300, 300))
+        img3 = Image.new('RGB', (width, height))
         draw3 = ImageDraw.Draw(img3)
-        draw3.rectangle([0, 0, 300, 300], fill=(139, 90, 60))
+        draw3.rectangle(box(0, 0, 300, 300), fill=(139, 90, 60))
         np.random.seed(2)
         for _ in range(15):
             x = np.random.randint(0, 250)
             y = np.random.randint(0, 250)
-            draw3.ellipse([x, y, x+30, y+30], fill=(50, 150, 50))
-            draw3.line([x+15, y+15, x+15, y+45], fill=(101, 67, 33), width=3)
+            draw3.ellipse(box(x, y, x+30, y+30), fill=(50, 150, 50))
+            draw3.line(box(x+15, y+15, x+15, y+45), fill=(101, 67, 33), width=max(3, int(3 * sx)))
         img3.save(os.path.join(test_dir, "earth_image.jpg"))
         
         print("✅ テスト画像生成完了")
@@ -154,7 +160,7 @@ def test_api_server():
     print("APIサーバーテスト実行中...")
     
     try:
-        response = requests.get('http://localhost:5000/health', timeout=5)
+        response = requests.get('http://localhost:5000/api/health', timeout=5)
         if response.status_code == 200:
             print("✅ APIサーバー動作確認")
             return True
@@ -164,7 +170,7 @@ def test_api_server():
             
     except requests.exceptions.ConnectionError:
         print("❌ サーバー接続エラー")
-        print("  → python api_interface.py でサーバーを起動してください")
+        print("  → python app.py でサーバーを起動してください")
         return False
     except Exception as e:
         print(f"❌ エラー: {e}")
@@ -0,0 +1,44 @@
+#!/usr/bin/env python3
+"""
+イベントまとめ送信のテスト
+"""
+
+from emit_batcher import BATCH_EVENT, EmitBatcher
+
+
+def test_events_coalesced_per_recipient():
+    """
+    まとめ中のイベントは受信者ごとに順番どおり1フレームで送られ、1件だけなら元のイベントのまま送られる
+    """
+    sent = []
+    batcher = EmitBatcher(lambda event, data, room=None, skip_sid=None: sent.append((event, data, room)))
+
+    with batcher.batch():
+        batcher.emit('opponent_card_selected', {'card_id': 1}, 'ROOM1', ['sid-a', 'sid-b'], skip_sid='sid-b')
+        with batcher.batch():
+            batcher.emit('battle_result', {'round': 1}, 'ROOM1', ['sid-a', 'sid-b'])
+        batcher.emit('sync_card_status', {'used': [1]}, 'sid-a')
+        assert sent == []
+
+    assert sent == [
+        (BATCH_EVENT, {'events': [{'event': 'opponent_card_selected', 'data': {'card_id': 1}},
+                                  {'event': 'battle_result', 'data': {'round': 1}},
+                                  {'event': 'sync_card_status', 'data': {'used': [1]}}]}, 'sid-a'),
+        ('battle_result', {'round': 1}, 'sid-b'),
+    ]
+    assert batcher.frames_sent == 2
+    assert batcher.events_coalesced == 2
+
+
+def test_emit_outside_batch_is_immediate():
+    sent = []
+    batcher = EmitBatcher(lambda event, data, room=None, skip_sid=None: sent.append((event, room, skip_sid)))
+    batcher.emit('opponent_cards_ready', {}, 'ROOM1', ['sid-a', 'sid-b'], skip_sid='sid-a')
+    assert sent == [('opponent_cards_ready', 'ROOM1', 'sid-a')]
+    assert batcher.frames_sent == 0
+
+
+if __name__ == "__main__":
+    test_events_coalesced_per_recipient()
+    test_emit_outside_batch_is_immediate()
+    print("✅ イベントまとめ送信のテスト完了")
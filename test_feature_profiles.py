@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+"""
+特徴量プロファイルのテスト
+"""
+
+import os
+import tempfile
+
+import cv2
+import numpy as np
+
+import feature_profiles
+from card_generator import CardGenerator, difference_hash
+from feature_profiles import FEATURE_PROFILES, parity_report
+from test_card_generator import create_test_images
+
+
+def test_accurate_profile_is_default():
+    """
+    既定の accurate プロファイルは従来の特徴量計算と同じ結果になる
+    """
+    image_dir = tempfile.mkdtemp()
+    create_test_images(image_dir)
+    image_path = os.path.join(image_dir, 'fire_image.jpg')
+
+    generator = CardGenerator()
+    assert generator.feature_profile == 'accurate'
+    assert set(FEATURE_PROFILES) >= {'accurate', 'fast', 'strips'}
+
+    img = cv2.imread(image_path)
+    features = generator.analyze_image_features(image_path)
+    # analyze_image_features は特徴量に重複検出用の dHash を加える
+    assert features.pop('dhash') == f'{difference_hash(img):016x}'
+    assert features == generator._extract_features(img, image_path)
+
+
+def test_fast_profile_parity():
+    """
+    fast プロファイルは accurate と属性が一致し、攻撃力の誤差が小さい
+    """
+    image_dir = tempfile.mkdtemp()
+    create_test_images(image_dir, (1600, 1200))
+    image_paths = [os.path.join(image_dir, name) for name in
+                   ("fire_image.jpg", "water_image.jpg", "earth_image.jpg")]
+
+    report = parity_report(image_paths, ['fast'])
+    assert report['images'] == 3
+    fast = report['profiles']['fast']
+    assert fast['attribute_agreement'] == 1.0
+    assert fast['attack_power_max_error'] <= 3
+
+
+def _assert_features_close(expected, actual):
+    assert expected.keys() == actual.keys()
+    for key, value in expected.items():
+        if isinstance(value, dict):
+            _assert_features_close(value, actual[key])
+        else:
+            assert np.isclose(value, actual[key], rtol=1e-12, atol=0), key
+
+
+def test_strips_profile_matches_accurate():
+    """
+    strips プロファイルは帯に分けても accurate と同じ特徴量になる（標準偏差は丸め誤差まで）
+    """
+    image_dir = tempfile.mkdtemp()
+    create_test_images(image_dir, (400, 900))
+    generator = CardGenerator()
+
+    original_strip_pixels = feature_profiles.STRIP_PIXELS
+    feature_profiles.STRIP_PIXELS = 400 * 37  # 小さな画像でも帯が何本もできるようにする
+    try:
+        for name in ("fire_image.jpg", "water_image.jpg", "earth_image.jpg"):
+            image_path = os.path.join(image_dir, name)
+            img = cv2.imread(image_path)
+            expected = generator._extract_features(img, image_path)
+            actual = FEATURE_PROFILES['strips'](generator, img, image_path)
+            _assert_features_close(expected, actual)
+    finally:
+        feature_profiles.STRIP_PIXELS = original_strip_pixels
+
+
+if __name__ == "__main__":
+    test_accurate_profile_is_default()
+    test_fast_profile_parity()
+    test_strips_profile_matches_accurate()
+    print("✅ 特徴量プロファイルのテスト完了")
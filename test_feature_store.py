@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+"""
+特徴量ストアのテスト
+"""
+
+import os
+import tempfile
+
+import numpy as np
+
+from feature_store import FeatureStore
+
+
+def _card(attribute: str, attack_power: int) -> dict:
+    return {
+        'attribute': attribute,
+        'attack_power': attack_power,
+        'features': {
+            'color_diversity': 0.5, 'complexity': 0.3, 'contrast': 0.4, 'saturation': 0.6,
+            'resolution': 0.9, 'dominant_hue': 12.0, 'warmth': 0.7,
+            'hue_distribution': {'red_ratio': 0.6, 'blue_ratio': 0.1, 'green_ratio': 0.3},
+        },
+    }
+
+
+def test_append_and_query():
+    """
+    追記したレコードをmemmap経由で集計・絞り込みできる
+    """
+    path = os.path.join(tempfile.mkdtemp(), 'cards.bin')
+    store = FeatureStore(path)
+    assert len(store) == 0
+
+    store.append([_card('火', 80), _card('水', 30), _card('土', 55)], 'session-a', created_at=100.0)
+    store.append([_card('火', 20), _card('火', 95), _card('水', 60)], 'session-b', created_at=200.0)
+
+    reopened = FeatureStore(path)
+    assert isinstance(reopened.records(), np.memmap)
+    assert len(reopened) == 6
+
+    fractions = reopened.attribute_fractions()
+    assert fractions == {'火': 0.5, '水': 2 / 6, '土': 1 / 6}
+    assert reopened.attribute_fractions(since=150.0)['火'] == 2 / 3
+
+    fire = reopened.query(attribute='fire', min_attack=50)
+    assert sorted(fire['attack_power'].tolist()) == [80, 95]
+    assert fire[0]['red_ratio'] == np.float32(0.6)
+    assert reopened.query(until=150.0)['session_id'].tolist() == [b'session-a'] * 3
+
+    histogram = reopened.attack_power_histogram(bin_width=30)
+    assert histogram['bin_edges'] == [10, 40, 70, 100]
+    assert histogram['counts'] == [2, 2, 2]
+    for bin_width in (0, -10, 91):
+        try:
+            reopened.attack_power_histogram(bin_width=bin_width)
+        except ValueError:
+            continue
+        raise AssertionError(f'bin_width={bin_width} should be rejected')
+
+
+def test_torn_tail_is_truncated_on_open():
+    """
+    書き込み途中で止まった末尾のレコードは開くときに切り捨て、その後の追記を正しい位置に書く
+    """
+    path = os.path.join(tempfile.mkdtemp(), 'cards.bin')
+    FeatureStore(path).append([_card('火', 77)], 'session-a')
+    with open(path, 'ab') as f:
+        f.write(b'\x00' * 7)
+
+    store = FeatureStore(path)
+    store.append([_card('水', 42)], 'session-b')
+    assert store.records()['attack_power'].tolist() == [77, 42]
+    assert FeatureStore(path).records()['session_id'].tolist() == [b'session-a', b'session-b']
+
+
+if __name__ == "__main__":
+    test_append_and_query()
+    test_torn_tail_is_truncated_on_open()
+    print("✅ 特徴量ストアのテスト完了")
@@ -0,0 +1,55 @@
+#!/usr/bin/env python3
+"""
+生成ワーカー振り分けのテスト
+"""
+
+from generation_client import GenerationClient, NoHealthyWorkers, WORKER_SECRET_HEADER
+
+
+def test_round_robin_skips_unhealthy_workers():
+    """
+    処理中の件数が同じなら正常なワーカーの間で順番に振り分ける
+    """
+    client = GenerationClient(['http://a', 'http://b', 'http://c'])
+    client.workers[2].healthy = False
+
+    picked = []
+    for _ in range(4):
+        worker = client._acquire(set())
+        picked.append(worker.url)
+        client._release(worker)
+    assert picked == ['http://a', 'http://b', 'http://a', 'http://b']
+
+    busy = client._acquire(set())
+    other = client._acquire(set())
+    assert {busy.url, other.url} == {'http://a', 'http://b'}
+
+
+def test_unreachable_workers_are_marked_unhealthy():
+    """
+    接続できないワーカーは異常扱いになり、全滅したら NoHealthyWorkers
+    """
+    client = GenerationClient(['http://127.0.0.1:1', 'http://127.0.0.1:2'], timeout=1)
+    try:
+        client.generate('00000000-0000-0000-0000-000000000000', ['a.jpg'])
+        assert False, 'should raise NoHealthyWorkers'
+    except NoHealthyWorkers as e:
+        assert e.status_code == 503
+    assert [worker['healthy'] for worker in client.status()] == [False, False]
+    assert all(worker['in_flight'] == 0 for worker in client.status())
+
+
+def test_secret_is_sent_only_when_configured():
+    """
+    secret を指定したときだけ、ワーカーへのリクエストに共有シークレットのヘッダーを付ける
+    """
+    assert WORKER_SECRET_HEADER not in GenerationClient(['http://a']).session.headers
+    client = GenerationClient(['http://a'], secret='s3cret')
+    assert client.session.headers[WORKER_SECRET_HEADER] == 's3cret'
+
+
+if __name__ == "__main__":
+    test_round_robin_skips_unhealthy_workers()
+    test_unreachable_workers_are_marked_unhealthy()
+    test_secret_is_sent_only_when_configured()
+    print("✅ 生成ワーカー振り分けのテスト完了")
@@ -0,0 +1,157 @@
+#!/usr/bin/env python3
+"""
+知覚ハッシュ索引のテスト
+"""
+
+import os
+import random
+import tempfile
+import threading
+import time
+
+import cv2
+
+from card_generator import difference_hash
+from image_hashes import PerceptualHashIndex, DUPLICATE_RADIUS, RECORD_DTYPE
+
+
+def _card(dhash: int) -> dict:
+    return {'features': {'dhash': f'{dhash:016x}'}}
+
+
+def _flip_bits(value: int, count: int, rng: random.Random) -> int:
+    for position in rng.sample(range(64), count):
+        value ^= 1 << position
+    return value
+
+
+def test_difference_hash_survives_reencoding():
+    """
+    縮小・JPEG再圧縮した同じ写真は近く、別の写真は遠い
+    """
+    img = cv2.imread('test_images/colorful.jpg')
+    original = difference_hash(img)
+
+    small = cv2.resize(img, (img.shape[1] // 3, img.shape[0] // 3), interpolation=cv2.INTER_AREA)
+    _, encoded = cv2.imencode('.jpg', small, [cv2.IMWRITE_JPEG_QUALITY, 40])
+    reencoded = difference_hash(cv2.imdecode(encoded, cv2.IMREAD_COLOR))
+    assert bin(original ^ reencoded).count('1') <= DUPLICATE_RADIUS
+
+    other = difference_hash(cv2.imread('test_images/complex.jpg'))
+    assert bin(original ^ other).count('1') > DUPLICATE_RADIUS
+
+
+def test_lookup_matches_brute_force_and_persists():
+    """
+    索引の検索結果が全件の総当たりと一致し、開き直しても同じ結果になる
+    """
+    rng = random.Random(7)
+    path = os.path.join(tempfile.mkdtemp(), 'hashes.bin')
+    # 再構築を何度か起こすため閾値を小さくする
+    index = PerceptualHashIndex(path, rebuild_threshold=50)
+
+    hashes = []
+    for session in range(200):
+        batch = [rng.getrandbits(64) for _ in range(3)]
+        if session % 10 == 0:
+            batch[0] = _flip_bits(hashes[-1], rng.randint(0, 8), rng) if hashes else batch[0]
+        index.add([_card(value) for value in batch], f'session-{session}', player_id=f'p{session % 5}',
+                  created_at=float(session))
+        hashes.extend(batch)
+    assert len(index) == 600
+
+    reopened = PerceptualHashIndex(path)
+    for _ in range(100):
+        query = _flip_bits(rng.choice(hashes), rng.randint(0, 9), rng)
+        for radius in (0, 3, DUPLICATE_RADIUS, 9):
+            expected = sorted(bin(query ^ value).count('1') for value in hashes
+                              if bin(query ^ value).count('1') <= radius)
+            for target in (index, reopened):
+                found = target.lookup(f'{query:016x}', radius, limit=len(hashes))
+                assert [match['distance'] for match in found] == expected
+
+    match = index.lookup(f'{hashes[4]:016x}', 0)[0]
+    assert match == {'distance': 0, 'session_id': 'session-1', 'card_index': 1,
+                     'player_id': 'p1', 'created_at': 1.0}
+    assert all(match['session_id'] != 'session-1'
+               for match in index.lookup(f'{hashes[4]:016x}', 0, exclude_session='session-1'))
+
+
+def test_background_rebuild_keeps_lookups_complete():
+    """
+    索引の再構築はバックグラウンドタスクで行い、その前後・途中に追加した分も検索で見つかる
+    """
+    rng = random.Random(11)
+    path = os.path.join(tempfile.mkdtemp(), 'hashes.bin')
+    tasks = []
+    index = PerceptualHashIndex(path, rebuild_threshold=30, start_task=tasks.append)
+    rebuilds = index.rebuilds
+
+    hashes = [rng.getrandbits(64) for _ in range(90)]
+    index.add([_card(value) for value in hashes[:31]], 'session-0')
+    assert len(tasks) == 1 and index.rebuilds == rebuilds  # add() の中では作り直さない
+    index.add([_card(value) for value in hashes[31:60]], 'session-1')
+    assert len(tasks) == 1  # 再構築中は重ねて起動しない
+
+    def assert_all_found():
+        for value in hashes[:len(index)]:
+            assert index.lookup(f'{value:016x}', 0)[0]['distance'] == 0
+
+    assert_all_found()
+    tasks.pop()()
+    assert index.rebuilds == rebuilds + 1 and index._indexed == 60
+    assert_all_found()
+
+    index.add([_card(value) for value in hashes[60:]], 'session-2')
+    assert len(tasks) == 0 and len(index) == 90
+    assert_all_found()
+
+    # 索引を作っている最中に追加された分は、差し替え後も辞書に残る
+    building, release = threading.Event(), threading.Event()
+    build = index._build
+
+    def slow_build(values):
+        building.set()
+        release.wait(5)
+        return build(values)
+
+    index._build = slow_build
+    index.start_task = lambda task: threading.Thread(target=task, daemon=True).start()
+    hashes += [rng.getrandbits(64) for _ in range(40)]
+    index.add([_card(value) for value in hashes[90:121]], 'session-3')
+    assert building.wait(5)
+    index.add([_card(value) for value in hashes[121:]], 'session-4')
+    assert_all_found()
+    release.set()
+    for _ in range(500):
+        if index._indexed == 121:
+            break
+        time.sleep(0.01)
+    assert index._indexed == 121 and len(index) == 130
+    assert_all_found()
+
+
+def test_cards_without_hash_and_torn_tail():
+    """
+    dhash のないカードは登録せず、書き込み途中で止まったレコードは読み込み時に切り捨てる
+    """
+    path = os.path.join(tempfile.mkdtemp(), 'hashes.bin')
+    index = PerceptualHashIndex(path)
+    assert index.add([{'features': {}}, _card(0xff)], 'session-a') == 1
+    assert index.lookup('00000000000000ff', 0)[0]['card_index'] == 1
+
+    with open(path, 'ab') as f:
+        f.write(b'\x00' * (RECORD_DTYPE.itemsize // 2))
+    reopened = PerceptualHashIndex(path)
+    assert len(reopened) == 1
+    reopened.add([_card(0xfe)], 'session-b')
+    assert len(PerceptualHashIndex(path)) == 2
+    assert [match['session_id'] for match in reopened.lookup('00000000000000ff', 1)] == ['session-a', 'session-b']
+
+
+if __name__ == "__main__":
+    test_difference_hash_survives_reencoding()
+    test_lookup_matches_brute_force_and_persists()
+    test_background_rebuild_keeps_lookups_complete()
+    test_cards_without_hash_and_torn_tail()
+    print("✅ 知覚ハッシュ索引のテスト完了")
@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+"""
+遅延 import とウォームアップのテスト
+"""
+
+import os
+import subprocess
+import sys
+
+from lazy_imports import lazy_import, lazy_object
+
+
+def test_lazy_module_imports_on_first_attribute():
+    """
+    属性を参照するまで import せず、参照後は本物のモジュールの属性を返す
+    """
+    sys.modules.pop('this_module_does_not_exist', None)
+    missing = lazy_import('this_module_does_not_exist')
+    assert not missing.loaded
+
+    module = lazy_import('json')
+    assert module.dumps({'a': 1}) == '{"a": 1}'
+    assert module.loaded and module.load() is sys.modules['json']
+
+
+def test_lazy_object_builds_once_on_first_use():
+    """
+    参照するまで factory を呼ばず、load() や属性・len() の参照では1回だけ作る
+    """
+    built = []
+
+    def factory():
+        built.append(1)
+        return [1, 2, 3]
+
+    store = lazy_object(factory, 'store')
+    assert not store.loaded and built == []
+
+    assert len(store) == 3
+    assert store.count(2) == 1
+    assert store.load() == [1, 2, 3]
+    assert store.loaded and built == [1]
+
+
+def test_app_import_defers_store_loading_until_warm_up():
+    """
+    app の import だけではストアを読み込まず、warm_up() で読み込み終えてから ready になる
+    """
+    code = (
+        "import glob, os, shutil, tempfile\n"
+        "root = os.getcwd()\n"
+        "os.chdir(tempfile.mkdtemp())\n"
+        "for page in glob.glob(os.path.join(root, '*.html')):\n"
+        "    shutil.copy(page, '.')\n"
+        "import app\n"
+        "stores = (app.feature_store, app.image_hash_index, app.card_collection, app.battle_log, app.leaderboard)\n"
+        "assert not any(store.loaded for store in stores)\n"
+        "assert 'photobattle_rated_players 0' in app.metrics_registry.render()\n"
+        "assert not any(store.loaded for store in stores)\n"
+        "app.warm_up()\n"
+        "assert app.readiness['state'] == 'ready', app.readiness\n"
+        "assert all(store.loaded for store in stores)\n"
+    )
+    root = os.path.dirname(os.path.abspath(__file__))
+    result = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True, cwd=root,
+                            env=dict(os.environ, PYTHONPATH=root))
+    assert result.returncode == 0, result.stderr
+
+
+def test_ready_probe_starts_warm_up():
+    """
+    python app.py 以外で起動しても、/api/ready への最初の問い合わせでウォームアップが始まり ready になる
+    """
+    code = (
+        "import glob, os, shutil, tempfile, time\n"
+        "root = os.getcwd()\n"
+        "os.chdir(tempfile.mkdtemp())\n"
+        "for page in glob.glob(os.path.join(root, '*.html')):\n"
+        "    shutil.copy(page, '.')\n"
+        "import app\n"
+        "client = app.app.test_client()\n"
+        "assert app.readiness['state'] == 'cold'\n"
+        "assert client.get('/api/ready').status_code == 503\n"
+        "deadline = time.time() + 60\n"
+        "while client.get('/api/ready').status_code != 200:\n"
+        "    assert time.time() < deadline, app.readiness\n"
+        "    time.sleep(0.05)\n"
+        "assert app.readiness['state'] == 'ready'\n"
+    )
+    root = os.path.dirname(os.path.abspath(__file__))
+    result = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True, cwd=root,
+                            env=dict(os.environ, PYTHONPATH=root))
+    assert result.returncode == 0, result.stderr
+
+
+def test_card_generator_defers_heavy_imports_until_warm_up():
+    """
+    card_generator の import だけでは cv2・PIL を読み込まず、ウォームアップで読み込みとフォントの準備が終わる
+    """
+    code = (
+        "import sys\n"
+        "from card_generator import CardGenerator, load_card_fonts\n"
+        "assert 'cv2' not in sys.modules and 'PIL.Image' not in sys.modules\n"
+        "generator = CardGenerator()\n"
+        "assert 'cv2' not in sys.modules\n"
+        "assert generator.warm_up() > 0\n"
+        "assert 'cv2' in sys.modules and 'PIL.Image' in sys.modules\n"
+        "assert load_card_fonts.cache_info().currsize == 1\n"
+    )
+    result = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True)
+    assert result.returncode == 0, result.stderr
+
+
+if __name__ == "__main__":
+    test_lazy_module_imports_on_first_attribute()
+    test_lazy_object_builds_once_on_first_use()
+    test_app_import_defers_store_loading_until_warm_up()
+    test_ready_probe_starts_warm_up()
+    test_card_generator_defers_heavy_imports_until_warm_up()
+    print("✅ 遅延 import とウォームアップのテスト完了")
@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+"""
+Elo ランキングのテスト
+"""
+
+import os
+import random
+import sqlite3
+import tempfile
+
+from leaderboard import FenwickTree, Leaderboard, elo_update
+from player_tokens import public_player_id
+
+
+def expected_ranks(board):
+    """
+    全員をレーティング順に並べた単純な実装での順位（同じレーティングは同順位）
+    """
+    ratings = {player_id: board.rank(player_id)['rating'] for player_id in board._players}
+    return {player_id: 1 + sum(1 for other in ratings.values() if other > rating)
+            for player_id, rating in ratings.items()}
+
+
+def test_fenwick_tree():
+    tree = FenwickTree(10)
+    for index, count in ((0, 2), (3, 1), (9, 4)):
+        tree.add(index, count)
+    assert tree.prefix(-1) == 0
+    assert tree.prefix(3) == 3
+    assert tree.prefix(9) == 7
+    assert [tree.find_kth(k) for k in range(1, 8)] == [0, 0, 3, 9, 9, 9, 9]
+
+
+def test_elo_update():
+    winner, loser = elo_update(1500, 1500, 1.0)
+    assert (winner, loser) == (1516, 1484)
+    favourite, underdog = elo_update(1800, 1400, 0.5)
+    assert favourite < 1800 < underdog + 400
+
+
+def test_ranks_match_brute_force_and_persist():
+    """
+    ランダムな試合の後でも順位・上位・前後の一覧が全件ソートと一致し、再起動後も復元される
+    """
+    path = os.path.join(tempfile.mkdtemp(), 'leaderboard.sqlite3')
+    board = Leaderboard(path)
+    rng = random.Random(7)
+    players = [public_player_id(f'token-{i:04d}-abcdefgh') for i in range(60)]
+    for _ in range(600):
+        a, b = rng.sample(players, 2)
+        board.record_game(a, b, rng.choice([a, b, None]))
+
+    ranks = expected_ranks(board)
+    for player_id, rank in ranks.items():
+        assert board.rank(player_id)['rank'] == rank
+
+    ordered = sorted(ranks, key=lambda player_id: ranks[player_id])
+    top = board.top(10)
+    assert [entry['rank'] for entry in top] == [ranks[player_id] for player_id in ordered[:10]]
+    assert [entry['rank'] for entry in board.top(100)] == sorted(ranks.values())
+
+    me = ordered[30]
+    around = board.around(me, 3)
+    assert len(around) == 7
+    assert around[3]['player_id'] == me
+    assert [entry['rank'] for entry in around] == sorted(entry['rank'] for entry in around)
+    assert len({entry['player_id'] for entry in around}) == 7
+
+    board.flush()
+    restored = Leaderboard(path)
+    assert len(restored) == len(board) == 60
+    for player_id in players:
+        assert restored.rank(player_id) == board.rank(player_id)
+
+
+def test_record_game_result():
+    board = Leaderboard(os.path.join(tempfile.mkdtemp(), 'leaderboard.sqlite3'))
+    result = board.record_game('alice', 'bob', 'alice')
+    assert result['alice']['delta'] == 16 and result['alice']['rank'] == 1
+    assert result['bob']['delta'] == -16 and result['bob']['rank'] == 2
+    assert board.rank('bob')['losses'] == 1
+    assert board.around('carol') == []
+    assert [entry['player_id'] for entry in board.around('bob', 5)] == ['alice', 'bob']
+
+
+class LockedConnection:
+    """
+    書き込みが必ず失敗する SQLite 接続の代わり
+    """
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        return False
+
+    def executemany(self, sql, rows):
+        raise sqlite3.OperationalError('database is locked')
+
+    def close(self):
+        pass
+
+
+def test_failed_write_is_retried():
+    """
+    保存に失敗したら接続を閉じ、次の書き込みで接続し直して失敗した更新も保存する
+    """
+    path = os.path.join(tempfile.mkdtemp(), 'leaderboard.sqlite3')
+    board = Leaderboard(path)
+    board.record_game('alice', 'bob', 'alice')
+    board._writer_connection = LockedConnection()
+    try:
+        board.write_pending()
+        assert False, 'sqlite3.Error が発生するはず'
+    except sqlite3.Error:
+        pass
+    assert board.pending() == 2 and board.write_failures == 1
+    assert board._writer_connection is None
+
+    board.record_game('alice', 'carol', None)
+    assert board.write_pending() == 4
+    assert board.pending() == 0
+    restored = Leaderboard(path)
+    for player_id in ('alice', 'bob', 'carol'):
+        assert restored.rank(player_id) == board.rank(player_id)
+
+
+if __name__ == "__main__":
+    test_fenwick_tree()
+    test_elo_update()
+    test_ranks_match_brute_force_and_persist()
+    test_record_game_result()
+    test_failed_write_is_retried()
+    print("✅ Elo ランキングのテスト完了")
@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+"""
+マッチングキューのテスト
+"""
+
+from matchmaking import MatchmakingQueue, average_attack_power
+
+
+def test_pairs_oldest_waiting_player():
+    """
+    2人目が来た時点で最古の待機者とマッチする
+    """
+    queue = MatchmakingQueue()
+    assert queue.enqueue('a') is None
+    assert queue.enqueue('a') is None
+    assert len(queue) == 1
+    assert queue.enqueue('b') == 'a'
+    assert len(queue) == 0
+
+
+def test_buckets_by_deck_strength():
+    """
+    デッキ強度が近いプレイヤー同士を優先してマッチする
+    """
+    now = [0.0]
+    queue = MatchmakingQueue(bucket_width=10, max_bucket_distance=1, clock=lambda: now[0])
+    assert queue.enqueue('weak', 20) is None
+    assert queue.enqueue('strong', 90) is None
+    assert queue.enqueue('strong2', 85) == 'strong'
+    assert queue.enqueue('mid', 55) is None
+    assert 'weak' in queue and 'mid' in queue
+    assert queue.pair_waiting() == []
+
+
+def test_tolerance_widens_with_wait_time():
+    """
+    待ち時間が延びると離れたバケットの相手とも組み、最後は誰とでも組む
+    """
+    now = [0.0]
+    queue = MatchmakingQueue(bucket_width=10, max_bucket_distance=1, widen_every=5.0,
+                             match_any_after=30.0, clock=lambda: now[0])
+    assert queue.enqueue('weak', 20) is None
+    now[0] = 4.0
+    assert queue.enqueue('mid', 45) is None  # 距離2（weak の許容範囲はまだ1）
+    assert queue.pair_waiting() == []
+
+    now[0] = 5.0
+    # weak の許容範囲が2に広がったので、待っている mid と組む
+    assert queue.pair_waiting() == [('weak', 'mid')]
+
+    assert queue.enqueue('low', 10) is None
+    now[0] = 6.0
+    # 新しく来たプレイヤーも、どちらの許容範囲にも入らなければ待つ（距離3）
+    assert queue.enqueue('high', 40) is None
+    now[0] = 14.0
+    assert queue.pair_waiting() == []  # low の許容範囲は 1 + 1 = 2
+    now[0] = 15.0
+    assert queue.pair_waiting() == [('low', 'high')]
+    assert len(queue) == 0
+
+    # 長く待っている人の許容範囲は、新しく来たプレイヤーとのマッチにも使う
+    assert queue.enqueue('patient', 20) is None
+    now[0] += 5.0
+    assert queue.enqueue('newcomer', 45) == 'patient'
+
+    # match_any_after を過ぎたら距離に関係なく組む
+    queue = MatchmakingQueue(bucket_width=10, widen_every=1000.0, match_any_after=30.0, clock=lambda: now[0])
+    queue.enqueue('weak', 10)
+    queue.enqueue('strong', 100)
+    now[0] += 29.0
+    assert queue.pair_waiting() == []
+    now[0] += 1.0
+    assert queue.pair_waiting() == [('weak', 'strong')]
+
+
+def test_remove_and_average_attack_power():
+    """
+    キャンセルしたプレイヤーはマッチ対象にならない
+    """
+    queue = MatchmakingQueue()
+    queue.enqueue('a', 50)
+    assert queue.remove('a')
+    assert not queue.remove('a')
+    assert queue.enqueue('b', 50) is None
+
+    cards = [{'attack_power': 30}, {'attack_power': 60}, {'attack_power': 90}]
+    assert average_attack_power(cards) == 60
+    assert average_attack_power(None) is None
+
+
+if __name__ == "__main__":
+    test_pairs_oldest_waiting_player()
+    test_buckets_by_deck_strength()
+    test_tolerance_widens_with_wait_time()
+    test_remove_and_average_attack_power()
+    print("✅ マッチングキューのテスト完了")
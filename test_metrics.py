@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+"""
+メトリクス（Prometheusテキスト形式）のテスト
+"""
+
+import os
+import tempfile
+
+from metrics import DirectorySizeMonitor, Histogram, MetricsRegistry, directory_size
+
+
+def test_histogram_buckets_are_cumulative():
+    """
+    ヒストグラムはバケットごとの累積数・合計・件数を書き出す
+    """
+    histogram = Histogram((0.1, 1.0))
+    for value in (0.05, 0.1, 0.5, 3.0):
+        histogram.observe(value)
+    assert histogram.snapshot() == ([2, 1, 1], 3.65)
+
+    registry = MetricsRegistry()
+    family = registry.histogram('latency_seconds', 'Latency', 'route', buckets=(0.1, 1.0))
+    family.observe('/b', 0.5)
+    family.observe('/a', 0.05)
+    family.observe('/a', 2.0)
+    lines = registry.render().splitlines()
+    assert lines[:2] == ['# HELP latency_seconds Latency', '# TYPE latency_seconds histogram']
+    assert lines[2:7] == [
+        'latency_seconds_bucket{route="/a",le="0.1"} 1',
+        'latency_seconds_bucket{route="/a",le="1"} 1',
+        'latency_seconds_bucket{route="/a",le="+Inf"} 2',
+        'latency_seconds_sum{route="/a"} 2.05',
+        'latency_seconds_count{route="/a"} 2',
+    ]
+    assert 'latency_seconds_count{route="/b"} 1' in lines
+
+
+def test_gauges_and_label_escaping():
+    """
+    ゲージはスクレイプ時にコールバックを呼び、ラベル値をエスケープする
+    """
+    values = {'count': 3}
+    registry = MetricsRegistry()
+    registry.gauge('rooms', 'Rooms', lambda: values['count'])
+    registry.gauge('bytes', 'Bytes', lambda: {'b"1': 2.5, 'a\\': 0}, label_name='folder')
+    values['count'] = 4
+    assert registry.render().splitlines() == [
+        '# HELP rooms Rooms', '# TYPE rooms gauge', 'rooms 4',
+        '# HELP bytes Bytes', '# TYPE bytes gauge',
+        'bytes{folder="a\\\\"} 0', 'bytes{folder="b\\"1"} 2.5',
+    ]
+
+
+def test_counters_are_exported_as_counter_type():
+    """
+    カウンターはゲージと同じくコールバックで値を取るが counter 型で書き出し、名前は _total で終わる
+    """
+    rejected = {'count': 0}
+    registry = MetricsRegistry()
+    registry.counter('rejected_total', 'Rejected requests', lambda: rejected['count'])
+    registry.counter('limited_total', 'Limited requests', lambda: {'ip:upload': 2}, label_name='name')
+    rejected['count'] = 5
+    assert registry.render().splitlines() == [
+        '# HELP rejected_total Rejected requests', '# TYPE rejected_total counter', 'rejected_total 5',
+        '# HELP limited_total Limited requests', '# TYPE limited_total counter', 'limited_total{name="ip:upload"} 2',
+    ]
+    try:
+        registry.counter('rejected', 'Rejected requests', lambda: 0)
+        assert False, 'ValueError が発生するはず'
+    except ValueError:
+        pass
+
+
+def test_directory_size_monitor():
+    """
+    使用容量は refresh したときだけ測り直し、snapshot は保持している値を返す
+    """
+    folder = tempfile.mkdtemp()
+    os.makedirs(os.path.join(folder, 'session'))
+    with open(os.path.join(folder, 'session', 'card.png'), 'wb') as f:
+        f.write(b'x' * 100)
+    assert directory_size(folder) == 100
+    assert directory_size(os.path.join(folder, 'missing')) == 0
+
+    monitor = DirectorySizeMonitor([folder], interval=60.0)
+    assert monitor.snapshot() == {folder: 0}
+    assert monitor.refresh() == {folder: 100}
+    with open(os.path.join(folder, 'upload.jpg'), 'wb') as f:
+        f.write(b'x' * 50)
+    assert monitor.snapshot() == {folder: 100}
+
+    # start はループを1本だけ起動する
+    started = []
+    assert monitor.start(lambda run, sleep: started.append(run))
+    assert not monitor.start(lambda run, sleep: started.append(run))
+    assert len(started) == 1
+    monitor.run(lambda seconds: monitor.stop())
+    assert monitor.snapshot() == {folder: 150}
+
+
+if __name__ == "__main__":
+    test_histogram_buckets_are_cumulative()
+    test_gauges_and_label_escaping()
+    test_counters_are_exported_as_counter_type()
+    test_directory_size_monitor()
+    print("✅ メトリクスのテスト完了")
@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+"""
+プレイヤートークンのテスト
+"""
+
+from player_tokens import PlayerRegistry, public_player_id, rebind_player
+
+
+def test_issue_and_bind():
+    """
+    再接続はトークンで本人確認し、以前のsidを返す
+    """
+    registry = PlayerRegistry()
+    token = registry.issue('ROOM1', 'sid-a')
+    assert registry.token_for('sid-a') == token
+    assert registry.get(token) == {'token': token, 'room_id': 'ROOM1', 'sid': 'sid-a'}
+
+    registry.disconnect('sid-a')
+    assert registry.token_for('sid-a') is None
+    state, old_sid = registry.bind(token, 'ROOM1', 'sid-b')
+    assert old_sid == 'sid-a' and state['sid'] == 'sid-b'
+    assert registry.token_for('sid-b') == token
+
+    # 不明なトークン・別ルームのトークンでは再接続できない
+    assert registry.bind('unknown-token-0000', 'ROOM1', 'sid-c') == (None, None)
+    assert registry.bind(token, 'ROOM2', 'sid-c') == (None, None)
+
+    # 同じルームに紐付いているトークンは再利用せず、新しく発行する
+    assert registry.issue('ROOM1', 'sid-d', token) != token
+    assert len(public_player_id(token)) == 16
+
+
+def test_discard_keeps_token_moved_to_another_room():
+    """
+    別のルームへ移ったトークンは、前のルームが閉じても破棄されない
+    """
+    registry = PlayerRegistry()
+    token = registry.issue('ROOMX', 'sid-a')
+    assert registry.issue('ROOMY', 'sid-b', token) == token
+    assert registry.token_for('sid-a') is None
+
+    assert not registry.discard(token, 'ROOMX')
+    state, old_sid = registry.bind(token, 'ROOMY', 'sid-c')
+    assert state is not None and old_sid == 'sid-b'
+
+    assert registry.discard(token, 'ROOMY')
+    assert registry.get(token) is None and registry.token_for('sid-c') is None
+    assert len(registry) == 0
+
+
+def test_rebind_player_moves_room_state():
+    """
+    再接続したプレイヤーの席・スコア・カード・選択を新しいsidに付け替える
+    """
+    room = {
+        'players': ['old', 'other'],
+        'scores': {'old': 2, 'other': 1},
+        'player_cards': {'old': [{'name': 'A'}], 'other': [{'name': 'B'}]},
+        'current_round': 2,
+        'current_selections': {'round_2': {'old': {'player_id': 'old', 'card_index': 0}}},
+    }
+    rebind_player(room, 'old', 'new')
+    assert room['players'] == ['new', 'other']
+    assert room['scores'] == {'new': 2, 'other': 1}
+    assert room['player_cards'] == {'new': [{'name': 'A'}], 'other': [{'name': 'B'}]}
+    assert room['current_selections']['round_2'] == {'new': {'player_id': 'new', 'card_index': 0}}
+
+    # 以前のsidが席にいなければ、空いている席に座る
+    room = {'players': ['other']}
+    rebind_player(room, 'gone', 'new')
+    assert room['players'] == ['other', 'new']
+    assert room['scores'] == {'new': 0}
+
+
+if __name__ == "__main__":
+    test_issue_and_bind()
+    test_discard_keeps_token_moved_to_another_room()
+    test_rebind_player_moves_room_state()
+    print("✅ プレイヤートークンのテスト完了")
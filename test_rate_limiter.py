@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+"""
+トークンバケツによる回数制限のテスト
+"""
+
+from rate_limiter import TokenBucketLimiter
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_bucket_refills_at_budget_rate():
+    """
+    容量ぶんは続けて通り、その後は補充された分だけ通る（待ち時間は次のトークンまで）
+    """
+    clock = FakeClock()
+    limiter = TokenBucketLimiter({'get_room_status': (2.0, 3)}, clock=clock)
+    assert [limiter.allow('sid-a', 'get_room_status') for _ in range(4)] == [True, True, True, False]
+    assert limiter.check('sid-a', 'get_room_status') == 0.5
+    assert limiter.allow('sid-b', 'get_room_status')
+
+    clock.now += 0.5
+    assert limiter.allow('sid-a', 'get_room_status')
+    assert not limiter.allow('sid-a', 'get_room_status')
+    assert limiter.limited == {'get_room_status': 3}
+
+    # 予算のない名前は制限しない（default を指定すればそれを使う）
+    assert all(limiter.allow('sid-a', 'card_selected') for _ in range(100))
+    with_default = TokenBucketLimiter({}, default=(1.0, 1), clock=clock)
+    assert with_default.allow('sid-a', 'card_selected') and not with_default.allow('sid-a', 'card_selected')
+
+
+def test_idle_buckets_are_evicted_and_memory_is_bounded():
+    """
+    満タンに戻ったバケツは捨て、上限を超えたら最も長く使われていないものから捨てる
+    """
+    clock = FakeClock()
+    limiter = TokenBucketLimiter({'request_card_sync': (1.0, 5)}, max_buckets=100, clock=clock)
+    for i in range(50):
+        limiter.allow(f'sid-{i}', 'request_card_sync')
+    assert len(limiter) == 50
+
+    # 1秒で満タンに戻るので、次に新しいバケツを作るときにまとめて捨てられる
+    clock.now += 1.0
+    limiter.allow('sid-new', 'request_card_sync')
+    assert len(limiter) == 1
+
+    for i in range(1000):
+        limiter.allow(f'spam-{i}', 'request_card_sync')
+    assert len(limiter) <= 100
+
+    # 捨てられていない（最近の）クライアントの状態は残る
+    for _ in range(4):
+        limiter.allow('spam-999', 'request_card_sync')
+    assert not limiter.allow('spam-999', 'request_card_sync')
+
+
+if __name__ == "__main__":
+    test_bucket_refills_at_budget_rate()
+    test_idle_buckets_are_evicted_and_memory_is_bounded()
+    print("✅ トークンバケツによる回数制限のテスト完了")
@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+"""
+観戦者向け送信のテスト
+"""
+
+import threading
+
+from spectators import SpectatorHub, spectator_group
+
+
+def test_broadcast_in_order_from_background_task():
+    """
+    観戦者向けのイベントは積んだ時点の内容で、順番どおり1グループ宛てに送られる
+    """
+    sent = []
+    closed = []
+    done = threading.Event()
+
+    def fake_emit(event, data, to=None):
+        sent.append((event, data, to))
+
+    def fake_close(group):
+        closed.append(group)
+        done.set()
+
+    hub = SpectatorHub(fake_emit, fake_close)
+    hub.broadcast('ROOM1', 'battle_result', {'round': 1})
+    assert hub.count() == 0
+
+    hub.add('ROOM1', 'sid-a')
+    hub.add('ROOM1', 'sid-b')
+    assert hub.is_spectator('ROOM1', 'sid-a')
+    assert hub.count('ROOM1') == 2
+
+    scores = {'p1': 1}
+    hub.broadcast('ROOM1', 'battle_result', {'round': 1, 'scores': scores})
+    scores['p1'] = 2
+    hub.broadcast('ROOM1', 'next_round', {'round': 2})
+    hub.close('ROOM1')
+    assert hub.count() == 0
+
+    hub.start(lambda target: threading.Thread(target=target, daemon=True).start())
+    assert done.wait(5)
+    hub.stop()
+
+    group = spectator_group('ROOM1')
+    assert sent == [('battle_result', {'round': 1, 'scores': {'p1': 1}}, group),
+                    ('next_round', {'round': 2}, group)]
+    assert closed == [group]
+
+
+def test_remove_on_disconnect():
+    hub = SpectatorHub(lambda *args, **kwargs: None, lambda group: None)
+    hub.add('ROOM1', 'sid-a')
+    hub.add('ROOM2', 'sid-a')
+    assert hub.count('ROOM1') == 0
+    assert hub.remove('sid-a') == 'ROOM2'
+    assert hub.remove('sid-a') is None
+    assert hub.rooms == {}
+
+
+if __name__ == "__main__":
+    test_broadcast_in_order_from_background_task()
+    test_remove_on_disconnect()
+    print("✅ 観戦者向け送信のテスト完了")
@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+"""
+段階別プロファイラーのテスト
+"""
+
+import os
+import tempfile
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+from card_generator import CardGenerator, _null_stage
+from stage_profiler import StageProfiler, TimingHook, combine_hooks
+from test_card_generator import create_test_images
+
+
+def test_timing_hook_and_combined_hooks():
+    """
+    TimingHook は段階ごとの所要時間を渡し、combine_hooks はすべてのフックを呼ぶ
+    """
+    timings = []
+    hook = TimingHook(lambda stage, seconds: timings.append((stage, seconds)))
+    with hook('render', 'a.jpg'):
+        time.sleep(0.01)
+    assert timings[0][0] == 'render' and timings[0][1] >= 0.01
+
+    entered = []
+
+    @contextmanager
+    def recording_hook(stage, image_path):
+        entered.append((stage, image_path))
+        yield
+
+    assert combine_hooks(None, hook) is hook
+    combined = combine_hooks(hook, None, recording_hook)
+    with combined('save', 'b.jpg'):
+        pass
+    assert entered == [('save', 'b.jpg')]
+    assert [stage for stage, _ in timings] == ['render', 'save']
+
+
+def test_profiler_aggregates_stages_per_card():
+    """
+    カード1枚ごとに段階別の時間を合計し、summary で件数・平均・最大を集計する
+    """
+    cards = []
+    profiler = StageProfiler(max_reports=2, on_card=cards.append)
+    with profiler('canny', 'outside.jpg'):
+        pass  # カードの外の段階は記録しない
+    assert len(profiler.reports) == 0
+
+    for delay in (0.01, 0.02, 0.03):
+        with profiler('card', f'{delay}.jpg'):
+            for _ in range(2):
+                with profiler('text', f'{delay}.jpg'):
+                    time.sleep(delay)
+            with profiler('save', f'{delay}.jpg'):
+                pass
+
+    assert len(cards) == 3
+    assert cards[0]['image_path'] == '0.01.jpg'
+    assert set(cards[0]['stages']) == {'card', 'text', 'save'}
+    assert cards[0]['stages']['text']['seconds'] >= 0.02  # 同じ段階は合計する
+    assert cards[0]['stages']['text']['memory_delta'] is None
+
+    # reports は max_reports 件だけ残る
+    assert [card['image_path'] for card in profiler.reports] == ['0.02.jpg', '0.03.jpg']
+    summary = profiler.summary()
+    assert summary['text']['count'] == 2
+    assert summary['text']['max_seconds'] >= 0.06
+    assert summary['text']['mean_seconds'] == summary['text']['total_seconds'] / 2
+
+
+def test_profiler_with_card_generator():
+    """
+    CardGenerator の各段階が記録され、profile_next_batches で cProfile の結果を書き出す
+    """
+    image_dir = tempfile.mkdtemp()
+    output_dir = tempfile.mkdtemp()
+    create_test_images(image_dir)
+    image_path = os.path.join(image_dir, 'fire_image.jpg')
+
+    was_tracing = tracemalloc.is_tracing()
+    profiler = StageProfiler(track_memory=True, dump_dir=os.path.join(output_dir, 'profiles'))
+    generator = CardGenerator(profiler=profiler)
+    profiler.profile_next_batches(1)
+    try:
+        generator.generate_cards_batch([image_path], output_dir)
+        generator.generate_cards_batch([image_path], output_dir)
+    finally:
+        if not was_tracing:
+            tracemalloc.stop()
+
+    assert len(profiler.reports) == 2
+    stages = profiler.reports[0]['stages']
+    assert {'card', 'decode', 'analyze', 'canny', 'render', 'save'} <= set(stages)
+    assert isinstance(stages['card']['memory_delta'], int)
+    assert len(profiler.dumps) == 1 and os.path.exists(profiler.dumps[0])
+
+
+def test_disabled_profiler_is_noop():
+    """
+    プロファイラー未指定なら何もしないコンテキストを使い回す
+    """
+    generator = CardGenerator()
+    assert generator.profiler is None
+    assert generator._stage is _null_stage
+    assert _null_stage('card', 'a.jpg') is _null_stage('save', 'b.jpg')
+    with generator._stage('card', 'a.jpg') as value:
+        assert value is None
+
+
+if __name__ == "__main__":
+    test_timing_hook_and_combined_hooks()
+    test_profiler_aggregates_stages_per_card()
+    test_profiler_with_card_generator()
+    test_disabled_profiler_is_noop()
+    print("✅ 段階別プロファイラーのテスト完了")
@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+"""
+圧縮済みHTMLページ配信のテスト
+"""
+
+import gzip
+import os
+import tempfile
+
+from flask import Flask, request
+
+from static_pages import StaticPages, parse_accept_encoding
+
+
+def _pages() -> StaticPages:
+    directory = tempfile.mkdtemp()
+    for name in ('a.html', 'b.html'):
+        with open(os.path.join(directory, name), 'w', encoding='utf-8') as f:
+            f.write(f'<html><head><title>{name}</title></head><body>{"x" * 2000}</body></html>')
+    return StaticPages(directory, ['a.html', 'b.html'])
+
+
+def test_accept_encoding_negotiation():
+    """
+    q値を考慮して圧縮形式を選び、圧縮しない指定にも対応する
+    """
+    assert parse_accept_encoding('gzip;q=0.5, br, *;q=0') == {'gzip': 0.5, 'br': 1.0, '*': 0.0}
+    page = _pages().pages['a.html']
+    assert page.select('gzip, deflate') == 'gzip'
+    assert page.select('gzip;q=0') == 'identity'
+    assert page.select(None) == 'identity'
+
+
+def test_responses_and_revalidation():
+    """
+    入口URLは no-cache + ETag、フィンガープリント付きURLは長期キャッシュ
+    """
+    pages = _pages()
+    app = Flask(__name__)
+
+    with app.test_request_context('/', headers={'Accept-Encoding': 'gzip'}):
+        response = pages.response('a.html', request)
+        assert response.headers['Content-Encoding'] == 'gzip'
+        assert response.headers['Cache-Control'] == 'no-cache'
+        body = gzip.decompress(response.get_data())
+        assert f'<base href="/pages/{pages.fingerprint}/">'.encode() in body
+        etag = response.headers['ETag']
+
+    with app.test_request_context('/', headers={'Accept-Encoding': 'gzip', 'If-None-Match': etag}):
+        assert pages.response('a.html', request).status_code == 304
+
+    with app.test_request_context('/', headers={'If-None-Match': etag}):
+        assert pages.response('a.html', request).status_code == 200
+
+    with app.test_request_context(f'/pages/{pages.fingerprint}/b.html'):
+        response = pages.fingerprinted_response(pages.fingerprint, 'b.html', request)
+        assert 'immutable' in response.headers['Cache-Control']
+
+    with app.test_request_context('/pages/old/b.html?room=1'):
+        response = pages.fingerprinted_response('old', 'b.html', request)
+        assert response.status_code == 302
+        assert response.headers['Location'] == f'/pages/{pages.fingerprint}/b.html?room=1'
+
+
+if __name__ == "__main__":
+    test_accept_encoding_negotiation()
+    test_responses_and_revalidation()
+    print("✅ 圧縮済みHTMLページ配信のテスト完了")
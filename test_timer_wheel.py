@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+"""
+タイマーホイールのテスト
+"""
+
+from timer_wheel import TimerWheel
+
+
+def test_timer_fires_after_delay():
+    """
+    指定したtick数が経過した時点でコールバックが実行される
+    """
+    wheel = TimerWheel(tick_interval=0.1, wheel_size=8)
+    fired = []
+    wheel.schedule('a', 0.3, fired.append, 'a')
+
+    wheel.tick()
+    wheel.tick()
+    assert fired == []
+    wheel.tick()
+    assert fired == ['a']
+    assert len(wheel) == 0
+
+
+def test_timer_longer_than_one_rotation():
+    """
+    ホイール1周より長いタイマーも正しい時刻に実行される
+    """
+    wheel = TimerWheel(tick_interval=0.1, wheel_size=4)
+    fired = []
+    wheel.schedule('long', 1.0, fired.append, 'long')
+
+    for _ in range(9):
+        wheel.tick()
+    assert fired == []
+    wheel.tick()
+    assert fired == ['long']
+
+
+def test_reschedule_and_cancel():
+    """
+    同じキーでの再登録は古いタイマーを置き換え、キャンセルしたタイマーは実行されない
+    """
+    wheel = TimerWheel(tick_interval=0.1, wheel_size=8)
+    fired = []
+    wheel.schedule(('room', 'selection'), 0.1, fired.append, 'old')
+    wheel.schedule(('room', 'selection'), 0.2, fired.append, 'new')
+    wheel.schedule(('room', 'rematch'), 0.1, fired.append, 'rematch')
+    assert wheel.cancel(('room', 'rematch'))
+    assert not wheel.cancel(('room', 'rematch'))
+
+    wheel.tick()
+    wheel.tick()
+    assert fired == ['new']
+    assert not wheel.pending(('room', 'selection'))
+
+
+if __name__ == "__main__":
+    test_timer_fires_after_delay()
+    test_timer_longer_than_one_rotation()
+    test_reschedule_and_cancel()
+    print("✅ タイマーホイールのテスト完了")
@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+"""
+アップロード事前検査のテスト
+"""
+
+from io import BytesIO
+
+from PIL import Image
+from werkzeug.datastructures import FileStorage, MultiDict
+
+from upload_validation import (UploadRejected, reported_original_sizes, sniff_image, trusted_original_size,
+                               validate_upload)
+
+
+def _encode(image_format: str, size=(64, 48), **save_kwargs) -> BytesIO:
+    buffer = BytesIO()
+    Image.new('RGB', size, (200, 50, 50)).save(buffer, format=image_format, **save_kwargs)
+    buffer.seek(0)
+    return buffer
+
+
+def test_sniff_all_supported_formats():
+    """
+    PNG / JPEG / GIF / BMP の形式とサイズをヘッダーだけで取得できる
+    """
+    for image_format, expected in (('PNG', 'png'), ('JPEG', 'jpeg'), ('GIF', 'gif'), ('BMP', 'bmp')):
+        stream = _encode(image_format)
+        assert sniff_image(stream) == (expected, 64, 48)
+        assert stream.tell() == 0
+
+
+def test_sniff_jpeg_with_large_exif():
+    """
+    SOFより前に大きなAPPセグメントがあっても読み飛ばせる
+    """
+    exif = b'Exif\x00\x00' + b'\x00' * 60000
+    stream = _encode('JPEG', size=(4000, 3000), exif=exif)
+    assert sniff_image(stream) == ('jpeg', 4000, 3000)
+
+
+def test_rejects_mismatch_and_too_many_pixels():
+    """
+    拡張子と中身の不一致・画素数超過・壊れたヘッダーは拒否する
+    """
+    png_as_jpg = FileStorage(stream=_encode('PNG'), filename='photo.jpg')
+    try:
+        validate_upload(png_as_jpg, 50)
+        assert False, 'mismatch should be rejected'
+    except UploadRejected as e:
+        assert e.status_code == 400
+
+    huge = FileStorage(stream=_encode('PNG', size=(800, 700)), filename='huge.png')
+    try:
+        validate_upload(huge, 0.5)
+        assert False, 'too many pixels should be rejected'
+    except UploadRejected as e:
+        assert e.status_code == 413
+
+    broken = FileStorage(stream=BytesIO(b'\xff\xd8\xff\xe0\x00'), filename='broken.jpg')
+    try:
+        validate_upload(broken, 50)
+        assert False, 'corrupt header should be rejected'
+    except UploadRejected:
+        pass
+
+    ok = FileStorage(stream=_encode('JPEG'), filename='ok.JPG')
+    assert validate_upload(ok, 50) == ('jpeg', 64, 48)
+
+
+def test_reported_original_sizes():
+    """
+    縮小前のサイズは縮小元として矛盾しないときだけ採用する
+    """
+    form = MultiDict([('original_width', '4032'), ('original_height', '3024'),
+                      ('original_width', ''), ('original_height', '')])
+    assert reported_original_sizes(form, 3) == [(4032, 3024), None, None]
+
+    assert trusted_original_size((1600, 1200), (4032, 3024)) == (4032, 3024)
+    assert trusted_original_size((1600, 1067), (6000, 4000)) == (6000, 4000)
+    assert trusted_original_size((1600, 1200), (4000, 2000)) is None
+    assert trusted_original_size((1600, 1200), (800, 600)) is None
+    assert trusted_original_size((1600, 1200), None) is None
+
+
+if __name__ == "__main__":
+    test_sniff_all_supported_formats()
+    test_sniff_jpeg_with_large_exif()
+    test_rejects_mismatch_and_too_many_pixels()
+    test_reported_original_sizes()
+    print("✅ アップロード事前検査のテスト完了")
@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+"""
+Socket.IO 通信形式（MessagePack + 短縮スキーマ）のテスト
+"""
+
+from socketio import packet
+
+from wire_format import (CompactMsgPackPacket, KEY_ALIASES, client_head_html, compact, expand,
+                         msgpack, payload_sizes, socketio_serializer)
+
+
+def sample_battle_result():
+    card = {
+        'id': 0, 'name': 'fire_image', 'attack_power': 64, 'attribute': '火', 'used': True,
+        'card_image_url': '/cards/abc/card_0.png',
+        'attribute_info': {'name': '火', 'name_en': 'fire', 'color': [220, 50, 50],
+                           'effectiveness': {'火': 1.0, '水': 0.8, '土': 1.2}},
+        'features': {'complexity': 0.8, 'hue_distribution': {'red_ratio': 1.0}},
+        'game_data': {'id': None, 'attack_power': 64, 'attribute': '火', 'used': False},
+    }
+    return {
+        'round': 1,
+        'players': {'sid-a': {'card': card, 'player_id': 'sid-a',
+                              'battle_power': {'base_power': 64, 'effective_power': 76,
+                                               'multiplier': 1.2, 'effectiveness': '効果抜群',
+                                               'is_effective': True}}},
+        'winner': 'sid-a', 'winner_card': card, 'loser_card': None,
+        'scores': {'sid-a': 1}, 'is_draw': False, 'room_id': 'ROOM1',
+        'battle_timestamp': '2026-10-19T02:33:11.960404',
+    }
+
+
+def test_compact_round_trip():
+    """
+    短縮したキー・属性コード・エポック秒は expand() で元に戻り、動的なキー（sid）はそのまま
+    """
+    data = sample_battle_result()
+    compacted = compact(data)
+    assert compacted['ps']['sid-a']['c']['at'] == 0
+    assert isinstance(compacted['t'], float)
+    assert compacted['ps']['sid-a']['c']['ai']['e'] == {'火': 1.0, '水': 0.8, '土': 1.2}
+    assert expand(compacted) == data
+    # 元の形式のデータを expand() しても変わらない
+    assert expand(data) == data
+
+
+def test_aliases_do_not_collide():
+    shorts = set(KEY_ALIASES.values())
+    assert len(shorts) == len(KEY_ALIASES)
+    assert not shorts & set(KEY_ALIASES)
+
+
+def test_msgpack_packet_round_trip():
+    if msgpack is None:
+        print("⚠️ msgpack 未インストールのためスキップ")
+        return
+    data = sample_battle_result()
+    encoded = CompactMsgPackPacket(packet.EVENT, ['battle_result', data]).encode()
+    assert isinstance(encoded, bytes)
+    decoded = CompactMsgPackPacket(encoded_packet=encoded)
+    assert decoded.packet_type == packet.EVENT
+    assert decoded.namespace == '/'
+    assert decoded.data == ['battle_result', data]
+
+    sizes = payload_sizes('battle_result', data)
+    assert sizes['msgpack'] < sizes['json']
+
+
+def test_json_mode_is_unchanged():
+    assert socketio_serializer('json') == 'default'
+    assert client_head_html('json') == ''
+
+
+if __name__ == "__main__":
+    test_compact_round_trip()
+    test_aliases_do_not_collide()
+    test_msgpack_packet_round_trip()
+    test_json_mode_is_unchanged()
+    print("✅ 通信形式のテスト完了")
@@ -0,0 +1,126 @@
+import threading
+import time
+from typing import Callable, Dict, Hashable, List, Optional
+
+
+class _Timer:
+    """
+    タイマーホイールに登録された1件のタイマー
+    """
+    __slots__ = ('key', 'callback', 'args', 'rounds', 'slot', 'cancelled')
+
+    def __init__(self, key: Hashable, callback: Callable, args: tuple, rounds: int, slot: int):
+        self.key = key
+        self.callback = callback
+        self.args = args
+        self.rounds = rounds
+        self.slot = slot
+        self.cancelled = False
+
+
+class TimerWheel:
+    """
+    全ルームのタイマーを1本のバックグラウンドタスクで管理するハッシュ型タイマーホイール
+
+    登録・キャンセルはO(1)。タイマーはキー単位で管理し、同じキーで再登録すると
+    古いタイマーは自動的にキャンセルされる。
+    """
+
+    def __init__(self, tick_interval: float = 0.1, wheel_size: int = 512):
+        self.tick_interval = tick_interval
+        self.wheel_size = wheel_size
+        self._slots: List[Dict[Hashable, _Timer]] = [{} for _ in range(wheel_size)]
+        self._timers: Dict[Hashable, _Timer] = {}
+        self._cursor = 0
+        self._lock = threading.Lock()
+        self._running = False
+
+    def schedule(self, key: Hashable, delay: float, callback: Callable, *args) -> None:
+        """
+        delay秒後にcallback(*args)を実行するタイマーを登録
+        """
+        ticks = max(1, int(round(delay / self.tick_interval)))
+        with self._lock:
+            self._cancel_locked(key)
+            slot = (self._cursor + ticks) % self.wheel_size
+            rounds = (ticks - 1) // self.wheel_size
+            timer = _Timer(key, callback, args, rounds, slot)
+            self._slots[slot][key] = timer
+            self._timers[key] = timer
+
+    def cancel(self, key: Hashable) -> bool:
+        """
+        タイマーをキャンセル（登録されていなければFalse）
+        """
+        with self._lock:
+            return self._cancel_locked(key)
+
+    def _cancel_locked(self, key: Hashable) -> bool:
+        timer = self._timers.pop(key, None)
+        if timer is None:
+            return False
+        timer.cancelled = True
+        self._slots[timer.slot].pop(key, None)
+        return True
+
+    def pending(self, key: Hashable) -> bool:
+        """
+        指定キーのタイマーが待機中かどうか
+        """
+        return key in self._timers
+
+    def __len__(self) -> int:
+        return len(self._timers)
+
+    def tick(self) -> int:
+        """
+        ホイールを1目盛り進め、期限切れのタイマーを実行（実行数を返す）
+        """
+        expired = []
+        with self._lock:
+            self._cursor = (self._cursor + 1) % self.wheel_size
+            slot = self._slots[self._cursor]
+            for key, timer in list(slot.items()):
+                if timer.rounds > 0:
+                    timer.rounds -= 1
+                    continue
+                del slot[key]
+                del self._timers[key]
+                expired.append(timer)
+
+        for timer in expired:
+            if timer.cancelled:
+                continue
+            try:
+                timer.callback(*timer.args)
+            except Exception as e:
+                print(f"ERROR: Timer {timer.key} failed: {e}")
+
+        return len(expired)
+
+    def run(self, sleep: Optional[Callable[[float], None]] = None) -> None:
+        """
+        タイマーループ本体（バックグラウンドタスクとして1本だけ起動する）
+        """
+        sleep = sleep or time.sleep
+        next_tick = time.monotonic() + self.tick_interval
+        while self._running:
+            delay = next_tick - time.monotonic()
+            if delay > 0:
+                sleep(delay)
+            self.tick()
+            next_tick += self.tick_interval
+
+    def start(self, start_task: Callable, sleep: Optional[Callable[[float], None]] = None) -> bool:
+        """
+        ループが未起動なら start_task(self.run, sleep) で起動する
+        """
+        with self._lock:
+            if self._running:
+                return False
+            self._running = True
+        start_task(self.run, sleep)
+        return True
+
+    def stop(self) -> None:
+        self._running = False
@@ -0,0 +1,164 @@
+import struct
+from typing import BinaryIO, List, Optional, Tuple
+
+# 拡張子ごとに許可する実際の画像形式
+EXTENSION_FORMATS = {
+    'png': 'png',
+    'jpg': 'jpeg',
+    'jpeg': 'jpeg',
+    'gif': 'gif',
+    'bmp': 'bmp',
+}
+
+# 長さフィールドを持たないJPEGマーカー（RST0-7, TEM）
+_JPEG_STANDALONE_MARKERS = set(range(0xD0, 0xD8)) | {0x01}
+# 画像サイズを持つSOFマーカー（DHT/JPG/DACを除く）
+_JPEG_SOF_MARKERS = set(range(0xC0, 0xD0)) - {0xC4, 0xC8, 0xCC}
+_JPEG_MAX_SEGMENTS = 1000
+
+
+class UploadRejected(ValueError):
+    """
+    デコード前の検査で拒否したアップロード
+    """
+
+    def __init__(self, message: str, status_code: int = 400):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+def sniff_image(stream: BinaryIO) -> Tuple[str, int, int]:
+    """
+    画素をデコードせずにヘッダーだけを読んで (形式, 幅, 高さ) を返す
+
+    読み終わったらストリームの位置を元に戻す。未対応・壊れたヘッダーはUploadRejected。
+    """
+    start = stream.tell()
+    try:
+        head = stream.read(26)
+        if head.startswith(b'\x89PNG\r\n\x1a\n') and head[12:16] == b'IHDR':
+            width, height = struct.unpack('>II', head[16:24])
+            return 'png', width, height
+        if head[:6] in (b'GIF87a', b'GIF89a'):
+            width, height = struct.unpack('<HH', head[6:10])
+            return 'gif', width, height
+        if head.startswith(b'BM') and len(head) >= 26:
+            dib_size = struct.unpack('<I', head[14:18])[0]
+            if dib_size == 12:
+                width, height = struct.unpack('<HH', head[18:22])
+            else:
+                width, height = struct.unpack('<ii', head[18:26])
+            return 'bmp', abs(width), abs(height)
+        if head.startswith(b'\xff\xd8'):
+            stream.seek(start + 2)
+            width, height = _sniff_jpeg_size(stream)
+            return 'jpeg', width, height
+    except struct.error:
+        pass
+    finally:
+        stream.seek(start)
+
+    raise UploadRejected('Unsupported or corrupt image header')
+
+
+def _sniff_jpeg_size(stream: BinaryIO) -> Tuple[int, int]:
+    """
+    JPEGのセグメントを長さフィールドで読み飛ばし、SOFから画像サイズを取得
+    """
+    for _ in range(_JPEG_MAX_SEGMENTS):
+        byte = stream.read(1)
+        if byte != b'\xff':
+            break
+        marker = stream.read(1)
+        while marker == b'\xff':
+            marker = stream.read(1)
+        if not marker:
+            break
+
+        marker_code = marker[0]
+        if marker_code in _JPEG_STANDALONE_MARKERS:
+            continue
+        if marker_code in (0xD9, 0xDA):
+            break
+
+        length_bytes = stream.read(2)
+        if len(length_bytes) != 2:
+            break
+        length = struct.unpack('>H', length_bytes)[0]
+        if length < 2:
+            break
+
+        if marker_code in _JPEG_SOF_MARKERS:
+            sof = stream.read(5)
+            if len(sof) != 5:
+                break
+            height, width = struct.unpack('>HH', sof[1:5])
+            return width, height
+
+        stream.seek(length - 2, 1)
+
+    raise UploadRejected('Corrupt JPEG header')
+
+
+def validate_upload(file_storage, max_megapixels: float) -> Tuple[str, int, int]:
+    """
+    アップロード画像を保存・デコードする前に検査する
+
+    - ヘッダーから読み取った形式が拡張子と一致すること
+    - 画素数が max_megapixels 以下であること（デコード後のメモリ爆発を防ぐ）
+    """
+    filename = file_storage.filename or ''
+    extension = filename.rsplit('.', 1)[1].lower() if '.' in filename else ''
+    expected_format = EXTENSION_FORMATS.get(extension)
+    if expected_format is None:
+        raise UploadRejected(f'Invalid file: {filename}')
+
+    image_format, width, height = sniff_image(file_storage.stream)
+    if image_format != expected_format:
+        raise UploadRejected(f'File content does not match its extension: {filename}')
+    if width == 0 or height == 0:
+        raise UploadRejected(f'Invalid image dimensions: {filename}')
+
+    megapixels = width * height / 1_000_000
+    if megapixels > max_megapixels:
+        raise UploadRejected(
+            f'Image too large: {filename} ({width}x{height}, max {max_megapixels:g} megapixels)', 413)
+
+    return image_format, width, height
+
+
+def reported_original_sizes(form, count: int) -> List[Optional[Tuple[int, int]]]:
+    """
+    フォームの original_width / original_height（画像と同じ順）を読み取る
+
+    ブラウザで縮小してからアップロードされた画像の元のサイズ。欠けている・数値でない場合はNone。
+    """
+    widths = form.getlist('original_width')
+    heights = form.getlist('original_height')
+    sizes = []
+    for i in range(count):
+        try:
+            size = (int(widths[i]), int(heights[i]))
+        except (IndexError, ValueError):
+            size = None
+        sizes.append(size)
+    return sizes
+
+
+def trusted_original_size(uploaded_size: Tuple[int, int],
+                          reported_size: Optional[Tuple[int, int]]) -> Optional[Tuple[int, int]]:
+    """
+    申告された元サイズが、アップロード画像の縮小元として矛盾しないときだけ採用する
+
+    縮小しかしないので元サイズはアップロード画像以上、縦横比もほぼ同じはず
+    （解像度の評価は100万画素で頭打ちなので、これ以上の検証はしない）。
+    """
+    if reported_size is None:
+        return None
+    width, height = uploaded_size
+    original_width, original_height = reported_size
+    if original_width < width or original_height < height:
+        return None
+    if abs(original_width / original_height - width / height) > 0.02 * (width / height) + 1 / height:
+        return None
+    return reported_size
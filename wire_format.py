@@ -0,0 +1,246 @@
+import json
+from datetime import datetime
+from typing import Any, Dict
+
+from socketio import packet
+
+from feature_store import ATTRIBUTE_CODES, ATTRIBUTES
+
+try:
+    import msgpack
+except ImportError:  # msgpack は任意（未インストールなら JSON のまま）
+    msgpack = None
+
+WIRE_FORMATS = ('json', 'msgpack')
+
+# よく送るキーの短縮名（カード・バトル結果・ラウンド進行）
+KEY_ALIASES = {
+    # カード
+    'attack_power': 'ap',
+    'attribute': 'at',
+    'name': 'n',
+    'used': 'u',
+    'card_image_url': 'img',
+    'image_path': 'ip',
+    'card_path': 'cp',
+    'attribute_info': 'ai',
+    'name_en': 'ne',
+    'color': 'col',
+    'features': 'ft',
+    'color_diversity': 'cd',
+    'complexity': 'cx',
+    'contrast': 'ct',
+    'saturation': 'sa',
+    'resolution': 'rs',
+    'dominant_hue': 'dh',
+    'hue_distribution': 'hd',
+    'red_ratio': 'rr',
+    'blue_ratio': 'br',
+    'green_ratio': 'gr',
+    'warmth': 'wm',
+    'dhash': 'ph',
+    'game_data': 'gd',
+    'attribute_en': 'ae',
+    'effectiveness_multipliers': 'em',
+    'card': 'c',
+    'cards': 'cs',
+    # バトル結果
+    'battle_power': 'bp',
+    'base_power': 'b',
+    'effective_power': 'ep',
+    'multiplier': 'm',
+    'effectiveness': 'e',
+    'is_effective': 'ie',
+    'player_id': 'pid',
+    'players': 'ps',
+    'winner': 'w',
+    'winner_card': 'wc',
+    'loser_card': 'lc',
+    'scores': 's',
+    'is_draw': 'd',
+    'room_id': 'r',
+    'round': 'rd',
+    'used_cards': 'uc',
+    'message': 'msg',
+    # まとめ送信（emit_batcher）
+    'events': 'ev',
+    'event': 'evt',
+    'data': 'dt',
+    # 時刻
+    'battle_timestamp': 't',
+    'timestamp': 'ts',
+    'selected_at': 'sl',
+    'created_at': 'ca',
+}
+EXPANDED_KEYS = {short: key for key, short in KEY_ALIASES.items()}
+
+# ISO形式の文字列ではなくエポック秒（float）で送るキー
+TIMESTAMP_KEYS = frozenset({'battle_timestamp', 'timestamp', 'selected_at', 'created_at'})
+
+_CONTAINERS = (dict, list, tuple)
+
+
+def compact(value: Any) -> Any:
+    """
+    送信用にキーを短縮し、属性を整数コード・時刻をエポック秒に置き換える
+    """
+    if isinstance(value, dict):
+        result = {}
+        for key, item in value.items():
+            if isinstance(item, _CONTAINERS):
+                item = compact(item)
+            elif key == 'attribute':
+                item = ATTRIBUTE_CODES.get(item, item)
+            elif key in TIMESTAMP_KEYS and isinstance(item, str):
+                try:
+                    item = datetime.fromisoformat(item).timestamp()
+                except ValueError:
+                    pass
+            result[KEY_ALIASES.get(key, key)] = item
+        return result
+    if isinstance(value, (list, tuple)):
+        return [compact(item) if isinstance(item, _CONTAINERS) else item for item in value]
+    return value
+
+
+def expand(value: Any) -> Any:
+    """
+    compact() の逆変換（すでに元の形式のデータはそのまま返す）
+    """
+    if isinstance(value, dict):
+        result = {}
+        for key, item in value.items():
+            key = EXPANDED_KEYS.get(key, key)
+            if isinstance(item, _CONTAINERS):
+                item = expand(item)
+            elif key == 'attribute' and type(item) is int and 0 <= item < len(ATTRIBUTES):
+                item = ATTRIBUTES[item]
+            elif key in TIMESTAMP_KEYS and isinstance(item, (int, float)):
+                item = datetime.fromtimestamp(item).isoformat()
+            result[key] = item
+        return result
+    if isinstance(value, list):
+        return [expand(item) if isinstance(item, _CONTAINERS) else item for item in value]
+    return value
+
+
+class CompactMsgPackPacket(packet.Packet):
+    """
+    MessagePack でエンコードする Socket.IO パケット（イベントの引数は compact() してから送る）
+
+    python-socketio の serializer に渡すと、全ての送信（ルーム宛て・観戦者グループ宛て・
+    まとめ送信）がこのクラスを通る。受信したイベントの引数は expand() して元の形式に戻す。
+    """
+
+    uses_binary_events = False
+
+    def encode(self):
+        data = self.data
+        if self.packet_type == packet.EVENT and data:
+            data = [data[0]] + [compact(arg) for arg in data[1:]]
+        encoded = {'type': self.packet_type, 'data': data, 'nsp': self.namespace or '/'}
+        if self.id is not None:
+            encoded['id'] = self.id
+        return msgpack.dumps(encoded)
+
+    def decode(self, encoded_packet):
+        decoded = msgpack.loads(encoded_packet)
+        self.packet_type = decoded['type']
+        self.data = decoded.get('data')
+        self.id = decoded.get('id')
+        self.namespace = decoded['nsp']
+        if self.packet_type == packet.EVENT and self.data:
+            self.data = [self.data[0]] + [expand(arg) for arg in self.data[1:]]
+
+
+def resolve_wire_format(name: str) -> str:
+    """
+    設定値から実際に使う形式を決める（msgpack が使えなければ json に戻す）
+    """
+    name = (name or 'json').lower()
+    if name not in WIRE_FORMATS:
+        raise ValueError(f'未対応の通信形式です: {name}（{", ".join(WIRE_FORMATS)}）')
+    if name == 'msgpack' and msgpack is None:
+        print("⚠️ msgpack がインストールされていないため JSON で通信します")
+        return 'json'
+    return name
+
+
+def socketio_serializer(wire_format: str):
+    """
+    SocketIO(..., serializer=...) に渡す値
+    """
+    return CompactMsgPackPacket if wire_format == 'msgpack' else 'default'
+
+
+# ブラウザ側の Socket.IO パーサー（@msgpack/msgpack の MessagePack グローバルを使う）
+_CLIENT_SCRIPT = """<script src="https://unpkg.com/@msgpack/msgpack@2.8.0"></script>
+    <script>
+        (function () {
+            const schema = %s;
+            const EVENT = 2;
+
+            function expand(value) {
+                if (Array.isArray(value)) return value.map(expand);
+                if (!value || typeof value !== 'object') return value;
+                const result = {};
+                for (const [shortKey, item] of Object.entries(value)) {
+                    const key = schema.keys[shortKey] || shortKey;
+                    if (key === 'attribute' && typeof item === 'number') {
+                        result[key] = schema.attributes[item];
+                    } else if (schema.timestamps.includes(key) && typeof item === 'number') {
+                        result[key] = new Date(item * 1000).toISOString();
+                    } else {
+                        result[key] = expand(item);
+                    }
+                }
+                return result;
+            }
+
+            class Encoder {
+                encode(packet) {
+                    const encoded = { type: packet.type, nsp: packet.nsp, data: packet.data };
+                    if (packet.id !== undefined) encoded.id = packet.id;
+                    return [MessagePack.encode(encoded, { ignoreUndefined: true })];
+                }
+            }
+
+            class Decoder {
+                constructor() { this.callbacks = []; }
+                on(event, callback) { if (event === 'decoded') this.callbacks.push(callback); return this; }
+                off(event, callback) { this.callbacks = this.callbacks.filter((c) => c !== callback); return this; }
+                add(chunk) {
+                    const packet = MessagePack.decode(chunk);
+                    if (packet.type === EVENT && Array.isArray(packet.data)) {
+                        packet.data = [packet.data[0]].concat(packet.data.slice(1).map(expand));
+                    }
+                    this.callbacks.forEach((callback) => callback(packet));
+                }
+                destroy() { this.callbacks = []; }
+            }
+
+            window.PHOTOBATTLE_SOCKET_OPTIONS = { parser: { Encoder, Decoder } };
+        })();
+    </script>"""
+
+
+def client_head_html(wire_format: str) -> str:
+    """
+    各ページの <head> に埋め込むHTML（json のときは空）
+
+    ページ側は io(Object.assign({...}, window.PHOTOBATTLE_SOCKET_OPTIONS)) で接続する
+    """
+    if wire_format != 'msgpack':
+        return ''
+    schema = {'keys': EXPANDED_KEYS, 'attributes': ATTRIBUTES, 'timestamps': sorted(TIMESTAMP_KEYS)}
+    return _CLIENT_SCRIPT % json.dumps(schema, ensure_ascii=False)
+
+
+def payload_sizes(event: str, data: Dict) -> Dict[str, int]:
+    """
+    1イベントのエンコード後のバイト数を形式ごとに返す（比較・計測用）
+    """
+    sizes = {'json': len(packet.Packet(packet.EVENT, [event, data]).encode().encode('utf-8'))}
+    if msgpack is not None:
+        sizes['msgpack'] = len(CompactMsgPackPacket(packet.EVENT, [event, data]).encode())
+    return sizes